@@ -2,15 +2,20 @@ from flask import Flask, jsonify
 from .extensions import db, jwt, cors, bcrypt
 from .routes.treatment_units import treatment_units_bp
 from .routes.free_maps import free_maps_bp
+from .routes.tiles import tiles_bp
 from .config import Config
+from .cli import register_commands
+from .services.compression import register_compression
 from flask_migrate import Migrate
 
 from .models import *
 
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if test_config:
+        app.config.update(test_config)
 
     db.init_app(app)
     jwt.init_app(app)
@@ -24,6 +29,8 @@ def create_app():
     }   )
     bcrypt.init_app(app)
     migrate = Migrate(app, db)
+    register_commands(app)
+    register_compression(app)
 
     @app.route("/")
     def health_check():
@@ -36,5 +43,6 @@ def create_app():
     # Apenas rotas necessárias para Unidades e Mapas públicos
     app.register_blueprint(treatment_units_bp, url_prefix="/unidades-tratamento")
     app.register_blueprint(free_maps_bp, url_prefix="/api")
+    app.register_blueprint(tiles_bp, url_prefix="/api")
 
     return app
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark do classificador de instalações OSM
+
+Compara, por elemento, as regras originais (laços de substring sobre o nome
+em minúsculas, reproduzidas abaixo como referência) com o classificador
+compilado de services/facility_classifier.py.
+
+Uso: python -m backend.bench_classifier [--elements 20000] [--repeat 9]
+"""
+import argparse
+import random
+import time
+
+from .services.facility_classifier import classify
+
+# Regras originais de routes/free_maps.py, mantidas como referência
+
+def legacy_is_relevant(name, tags):
+    name_lower = name.lower()
+    relevant_keywords = [
+        'hospital', 'hemocentro', 'hemoterapia', 'hematologia',
+        'centro médico', 'clínica', 'ambulatório', 'policlínica',
+        'unidade de saúde', 'posto de saúde', 'upa', 'pronto socorro',
+        'santa casa', 'fundação', 'instituto'
+    ]
+    for keyword in relevant_keywords:
+        if keyword in name_lower:
+            return True
+    amenity = tags.get('amenity', '').lower()
+    healthcare = tags.get('healthcare', '').lower()
+    speciality = tags.get('speciality', '').lower()
+    if amenity in ['hospital', 'clinic'] or healthcare in ['hospital', 'clinic']:
+        return True
+    if 'hematology' in speciality or 'haematology' in speciality:
+        return True
+    return False
+
+
+def legacy_unit_type(name, tags):
+    name_lower = name.lower()
+    public_keywords = [
+        'sus', 'público', 'municipal', 'estadual', 'federal',
+        'upa', 'posto', 'centro de saúde', 'unidade básica',
+        'hospital geral', 'hospital municipal', 'hospital estadual',
+        'hospital universitário', 'hemoba', 'hemocentro', 'hemominas',
+        'hemorio', 'hemoce', 'hemope', 'hemoam', 'hemosc',
+        'fundação', 'instituto público', 'santa casa'
+    ]
+    for keyword in public_keywords:
+        if keyword in name_lower:
+            return 'publica'
+    operator = tags.get('operator', '').lower()
+    operator_type = tags.get('operator:type', '').lower()
+    if 'government' in operator_type or 'public' in operator_type:
+        return 'publica'
+    if any(word in operator for word in ['municipal', 'estadual', 'federal', 'governo']):
+        return 'publica'
+    return 'privada'
+
+
+def legacy_specialties(tags):
+    specialties = []
+    speciality = tags.get('speciality', '').lower()
+    healthcare_speciality = tags.get('healthcare:speciality', '').lower()
+    for keyword in ['hematology', 'haematology', 'blood', 'hemotherapy']:
+        if keyword in speciality or keyword in healthcare_speciality:
+            specialties.append('hematologia')
+            break
+    if 'emergency' in speciality or 'emergency' in healthcare_speciality:
+        specialties.append('emergencia')
+    if not specialties:
+        specialties.append('medicina_geral')
+    return specialties
+
+
+def legacy_classify(elements):
+    results = []
+    for element in elements:
+        tags = element.get('tags') or {}
+        name = tags.get('name', 'Centro Médico')
+        if not legacy_is_relevant(name, tags):
+            results.append((False, None, None))
+            continue
+        results.append((True, legacy_unit_type(name, tags), legacy_specialties(tags)))
+    return results
+
+
+NAME_PARTS = [
+    'Hospital', 'Clínica', 'Farmácia', 'Laboratório', 'Consultório', 'Policlínica',
+    'Centro Médico', 'Hospital Municipal', 'Posto de Saúde', 'UPA 24h', 'Santa Casa de',
+    'Instituto', 'Fundação', 'Drogaria', 'Ótica', 'Academia', 'Hemocentro',
+]
+NAME_SUFFIXES = [
+    'São José', 'Santa Maria', 'do Coração', 'Vida', 'Bem Estar', 'da Criança',
+    'Regional', 'Odontológica', 'Popular', 'Central', 'Nossa Senhora', 'Universitário',
+]
+TAG_CHOICES = [
+    {'amenity': 'hospital'}, {'amenity': 'clinic'}, {'amenity': 'pharmacy'},
+    {'healthcare': 'clinic'}, {'amenity': 'doctors'}, {'shop': 'optician'},
+    {'amenity': 'clinic', 'speciality': 'haematology'},
+    {'healthcare': 'hospital', 'healthcare:speciality': 'emergency;general'},
+    {'amenity': 'hospital', 'operator': 'Secretaria Municipal de Saúde', 'operator:type': 'government'},
+]
+
+
+def synthetic_elements(count, seed=7):
+    """Elementos no formato da Overpass API com nomes e tags variados"""
+    rng = random.Random(seed)
+    elements = []
+    for i in range(count):
+        tags = dict(rng.choice(TAG_CHOICES))
+        if rng.random() > 0.05:
+            tags['name'] = f"{rng.choice(NAME_PARTS)} {rng.choice(NAME_SUFFIXES)}"
+        elements.append({'type': 'node', 'id': i, 'lat': -23.5, 'lon': -46.6, 'tags': tags})
+    return elements
+
+
+def best_times(functions, elements, repeat):
+    """Melhor tempo de cada função, alternando as execuções para reduzir ruído"""
+    best = [float('inf')] * len(functions)
+    for _ in range(repeat):
+        for position, fn in enumerate(functions):
+            started = time.perf_counter()
+            fn(elements)
+            best[position] = min(best[position], time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--elements', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=9)
+    args = parser.parse_args()
+
+    elements = synthetic_elements(args.elements)
+    legacy, compiled = best_times([legacy_classify, classify], elements, args.repeat)
+
+    print(f"{len(elements)} elementos, melhor de {args.repeat} execuções")
+    print(f"  regras originais: {legacy / len(elements) * 1e6:7.2f} µs/elemento")
+    print(f"  compilado:        {compiled / len(elements) * 1e6:7.2f} µs/elemento")
+    print(f"  ganho:            {legacy / compiled:7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
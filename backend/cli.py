@@ -0,0 +1,99 @@
+"""
+Comandos de linha de comando registrados no app (flask <comando>)
+"""
+import os
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .services.catchments import PartialMunicipalities, refresh_catchments
+from .services.municipalities import DATA_DIR, load_states
+from .services.osm_harvester import (
+    classify_elements, harvest_state, prune_facilities, read_extract, upsert_facilities, utc_now
+)
+from .services.unit_export import FORMATS, export_units
+
+
+def _all_state_codes():
+    states_path = current_app.config.get('STATES_FILE') or os.path.join(DATA_DIR, 'estados.csv')
+    return sorted(state['uf'] for state in load_states(states_path).values())
+
+
+@click.command('harvest-osm')
+@click.option('--state', 'states', multiple=True, help='UF a coletar (ex.: BA); repetível. Padrão: todas.')
+@click.option('--file', 'extract_path', type=click.Path(exists=True, dir_okay=False),
+              help='Extrato local (Overpass JSON, GeoJSON ou GeoJSONSeq) em vez da Overpass API.')
+@click.option('--delay', default=10.0, show_default=True,
+              help='Pausa em segundos entre estados, para respeitar a Overpass API.')
+@with_appcontext
+def harvest_osm_command(states, extract_path, delay):
+    """Materializar hospitais e clínicas do OSM na tabela health_facilities"""
+    if extract_path:
+        started = time.time()
+        total = upsert_facilities(classify_elements(read_extract(extract_path)))
+        click.echo(f"{total} unidades gravadas a partir de {extract_path} em {time.time() - started:.1f}s")
+        return
+
+    state_codes = [state.upper() for state in states] or _all_state_codes()
+    failures = []
+    for position, state_code in enumerate(state_codes):
+        if position and delay:
+            time.sleep(delay)
+
+        harvested_at = utc_now()
+        try:
+            medical_centers = harvest_state(state_code)
+        except Exception as e:
+            # Estado com falha mantém os dados da coleta anterior
+            print(f"Erro ao coletar {state_code} na Overpass API: {str(e)}")
+            failures.append(state_code)
+            continue
+
+        total = upsert_facilities(medical_centers, state_code=state_code, harvested_at=harvested_at)
+        removed = prune_facilities(state_code, harvested_at)
+        click.echo(f"{state_code}: {total} unidades gravadas, {removed} removidas")
+
+    if failures:
+        raise click.ClickException(f"Falha ao coletar: {', '.join(failures)}")
+
+
+@click.command('export-units')
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='ndjson', show_default=True)
+@click.option('--output', '-o', default='-', show_default=True, help='Arquivo de saída ("-" para a saída padrão).')
+@click.option('--unit-type', default=None, help='Exportar só unidades deste tipo (ex.: publica).')
+@click.option('--include-inactive', is_flag=True, help='Incluir unidades inativas.')
+@click.option('--batch-size', default=None, type=int, help='Linhas lidas do banco por lote. Padrão: EXPORT_BATCH_SIZE.')
+@with_appcontext
+def export_units_command(fmt, output, unit_type, include_inactive, batch_size):
+    """Exportar as unidades de tratamento em NDJSON ou GeoJSON, em streaming"""
+    batch_size = batch_size or current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    with click.open_file(output, 'wb') as stream:
+        for chunk in export_units(fmt, unit_type=unit_type, include_inactive=include_inactive, batch_size=batch_size):
+            stream.write(chunk)
+
+
+@click.command('build-catchments')
+@click.option('--full', is_flag=True, help='Recalcular todos os municípios em vez de só os afetados.')
+@click.option('--allow-partial', is_flag=True,
+              help='Aceitar um arquivo de municípios incompleto (ex.: só as capitais).')
+@with_appcontext
+def build_catchments_command(full, allow_partial):
+    """Atualizar a tabela município -> unidade mais próxima"""
+    started = time.time()
+    try:
+        stats = refresh_catchments(full=full, allow_partial=allow_partial)
+    except PartialMunicipalities as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"{stats['municipalities']} municípios: {stats['recomputed']} recalculados, "
+        f"{stats['reassigned']} com nova unidade mais próxima, {stats['removed']} removidos "
+        f"em {time.time() - started:.1f}s"
+    )
+
+
+def register_commands(app):
+    app.cli.add_command(harvest_osm_command)
+    app.cli.add_command(export_units_command)
+    app.cli.add_command(build_catchments_command)
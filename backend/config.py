@@ -40,4 +40,104 @@ class Config:
     # Configuração da Google Maps API
     GOOGLE_MAPS_API_KEY = os.environ.get("GOOGLE_MAPS_API_KEY")
 
+    # Busca espacial: "auto" usa o índice do banco (KNN do PostGIS ou R*Tree
+    # do SQLite) quando a migração b7c2e4f1a9d3 foi aplicada e, sem ela, o
+    # snapshot em memória das unidades; "memory" força o snapshot
+    SPATIAL_BACKEND = os.environ.get("SPATIAL_BACKEND", "auto")
 
+    # Paginação por cursor das listas de unidades
+    UNITS_PAGE_SIZE_MAX = int(os.environ.get("UNITS_PAGE_SIZE_MAX", "100"))
+    # Resultados ordenados de /api/unidades mantidos para as páginas seguintes
+    # (por consulta e versão dos dados): quantidade e validade em segundos
+    UNITS_RESULTS_CACHE_SIZE = int(os.environ.get("UNITS_RESULTS_CACHE_SIZE", "256"))
+    UNITS_RESULTS_CACHE_TTL = float(os.environ.get("UNITS_RESULTS_CACHE_TTL", "120"))
+
+    # Snapshot em memória e índice espacial das unidades de tratamento
+    SPATIAL_INDEX_CELL_SIZE = float(os.environ.get("SPATIAL_INDEX_CELL_SIZE", "0.25"))  # graus
+    UNIT_SNAPSHOT_MAX_AGE = int(os.environ.get("UNIT_SNAPSHOT_MAX_AGE", "300"))  # segundos
+
+    # Cache de geocodificação (LRU em memória + SQLite persistente)
+    GEOCODE_CACHE_PATH = os.environ.get("GEOCODE_CACHE_PATH", os.path.join(INSTANCE_DIR, 'geocode_cache.db'))
+    GEOCODE_CACHE_TTL = int(os.environ.get("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))  # segundos
+    GEOCODE_NEGATIVE_TTL = int(os.environ.get("GEOCODE_NEGATIVE_TTL", str(24 * 3600)))  # segundos
+    GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", "1024"))
+
+    # Índice local de municípios para o autocomplete (formato IBGE/kelvins)
+    MUNICIPALITIES_FILE = os.environ.get("MUNICIPALITIES_FILE", os.path.join(BASE_DIR, 'data', 'municipios.csv'))
+    STATES_FILE = os.environ.get("STATES_FILE", os.path.join(BASE_DIR, 'data', 'estados.csv'))
+
+    # Cache por tile das respostas da Overpass API (stale-while-revalidate)
+    OVERPASS_CACHE_ENABLED = os.environ.get("OVERPASS_CACHE_ENABLED", "true").lower() == "true"
+    OVERPASS_CACHE_TTL = int(os.environ.get("OVERPASS_CACHE_TTL", str(6 * 3600)))  # segundos
+    OVERPASS_CACHE_STALE_TTL = int(os.environ.get("OVERPASS_CACHE_STALE_TTL", str(7 * 24 * 3600)))  # segundos
+    OVERPASS_CACHE_MAX_TILES = int(os.environ.get("OVERPASS_CACHE_MAX_TILES", "5000"))
+
+
+    # Cliente HTTP das APIs externas (sessões com keep-alive e retries com jitter)
+    HTTP_USER_AGENT = os.environ.get("HTTP_USER_AGENT", "Sistema-Meia-Lua/1.0 (contato@sistema-meia-lua.com)")
+    HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+    HTTP_BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.25"))  # segundos
+    HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+
+    # Disjuntor por API externa (estado em /api/upstreams): abre quando a taxa
+    # de erro da janela (segundos) passa do limite com um mínimo de chamadas e
+    # libera uma chamada de teste depois de BREAKER_OPEN_SECONDS. O timeout de
+    # leitura passa a ser o p99 das latências × BREAKER_TIMEOUT_FACTOR (com
+    # piso BREAKER_MIN_TIMEOUT) quando houver BREAKER_MIN_SAMPLES amostras
+    BREAKER_WINDOW = float(os.environ.get("BREAKER_WINDOW", "60"))
+    BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "10"))
+    BREAKER_ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", "0.5"))
+    BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+    BREAKER_MIN_SAMPLES = int(os.environ.get("BREAKER_MIN_SAMPLES", "20"))
+    BREAKER_TIMEOUT_FACTOR = float(os.environ.get("BREAKER_TIMEOUT_FACTOR", "2.0"))
+    BREAKER_MIN_TIMEOUT = float(os.environ.get("BREAKER_MIN_TIMEOUT", "1.0"))
+
+    # Agendador das chamadas ao Nominatim (política de 1 requisição/s somando
+    # todos os workers): intervalo mínimo entre chamadas (0 desliga), arquivo
+    # SQLite compartilhado entre os processos e espera máxima na fila do
+    # autocomplete (segundos)
+    NOMINATIM_MIN_INTERVAL = float(os.environ.get("NOMINATIM_MIN_INTERVAL", "1.0"))
+    OUTBOUND_SCHEDULER_PATH = os.environ.get("OUTBOUND_SCHEDULER_PATH", os.path.join(INSTANCE_DIR, 'outbound_scheduler.db'))
+    AUTOCOMPLETE_MAX_WAIT = float(os.environ.get("AUTOCOMPLETE_MAX_WAIT", "1.0"))
+
+    # Prazo total (segundos) das chamadas externas de uma busca de unidades,
+    # número de threads do executor dessas chamadas e máximo de chamadas
+    # pendentes (em execução + na fila), por processo; acima disso a fonte é
+    # reportada como "busy" sem esperar
+    UPSTREAM_DEADLINE = float(os.environ.get("UPSTREAM_DEADLINE", "2.0"))
+    UPSTREAM_MAX_WORKERS = int(os.environ.get("UPSTREAM_MAX_WORKERS", "8"))
+    UPSTREAM_MAX_PENDING = int(os.environ.get("UPSTREAM_MAX_PENDING", "32"))
+
+    # Origem dos centros médicos de /api/unidades: "local" (tabela coletada por
+    # `flask harvest-osm`), "overpass" (API ao vivo) ou "auto" (local quando a
+    # área da busca estiver dentro dos estados coletados)
+    MEDICAL_CENTERS_SOURCE = os.environ.get("MEDICAL_CENTERS_SOURCE", "auto")
+    # Margem (km) em volta da extensão das unidades de cada estado coletado
+    # (a extensão das unidades fica aquém da divisa e da costa)
+    HARVEST_COVERAGE_MARGIN_KM = float(os.environ.get("HARVEST_COVERAGE_MARGIN_KM", "25"))
+
+    # Distância máxima (metros) para fundir centros médicos duplicados de fontes diferentes
+    DEDUP_DISTANCE_M = float(os.environ.get("DEDUP_DISTANCE_M", "200"))
+
+    # Cache HTTP das listas de unidades (ETag + If-None-Match): Cache-Control
+    # das respostas e intervalo (segundos) entre as leituras da versão da base local
+    UNITS_CACHE_CONTROL = os.environ.get("UNITS_CACHE_CONTROL", "public, max-age=60, s-maxage=300")
+    DATA_VERSION_CHECK_INTERVAL = int(os.environ.get("DATA_VERSION_CHECK_INTERVAL", "30"))
+
+    # Compressão (brotli/gzip, conforme Accept-Encoding) das respostas a partir deste tamanho em bytes; 0 desliga
+    COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+
+    # Tiles do mapa com agrupamento de marcadores (/api/tiles/z/x/y): raio do
+    # agrupamento em pixels, zoom a partir do qual os pontos vêm soltos e
+    # quantidade de tiles prontos mantidos em memória por versão dos dados
+    CLUSTER_RADIUS = int(os.environ.get("CLUSTER_RADIUS", "60"))
+    CLUSTER_MAX_ZOOM = int(os.environ.get("CLUSTER_MAX_ZOOM", "16"))
+    CLUSTER_TILE_CACHE_SIZE = int(os.environ.get("CLUSTER_TILE_CACHE_SIZE", "4096"))
+
+    # Busca em lote de unidades próximas: máximo de origens por requisição e
+    # células (origens × unidades) da matriz de distâncias calculada por vez
+    BATCH_MAX_ORIGINS = int(os.environ.get("BATCH_MAX_ORIGINS", "1000"))
+    BATCH_MATRIX_CELLS = int(os.environ.get("BATCH_MATRIX_CELLS", "2000000"))
+
+    # Linhas lidas do banco por lote na exportação em streaming das unidades
+    EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
@@ -0,0 +1,41 @@
+"""
+Configuração do gunicorn para produção
+
+Uso (na raiz do projeto): gunicorn -c backend/gunicorn.conf.py
+
+Por padrão os workers são "gthread": cada processo atende até
+GUNICORN_THREADS requisições ao mesmo tempo, e uma busca esperando as APIs
+externas (no máximo UPSTREAM_DEADLINE segundos) ocupa só uma thread, e não
+o processo inteiro como nos workers "sync". As chamadas externas em si rodam
+no executor limitado de services/fanout.py (UPSTREAM_MAX_WORKERS threads e
+até UPSTREAM_MAX_PENDING chamadas pendentes por processo), de modo que
+upstreams lentos não acumulam threads nem fila.
+
+Concorrência total: WEB_CONCURRENCY processos × GUNICORN_THREADS requisições.
+As threads compartilham o pool de conexões do SQLAlchemy de cada processo.
+
+GUNICORN_WORKER_CLASS=gevent também é suportado (requer o pacote gevent):
+o worker aplica o monkey patching antes de carregar o app (por isso
+preload_app fica desligado), e o requests, os locks e o executor das
+chamadas externas passam a usar greenlets. Nesse modo a concorrência por
+processo é GUNICORN_WORKER_CONNECTIONS.
+"""
+import multiprocessing
+import os
+
+wsgi_app = os.environ.get('GUNICORN_APP', 'backend.app:create_app()')
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', str(min(4, multiprocessing.cpu_count() * 2 + 1))))
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# Segundos sem resposta antes de o worker ser reiniciado; bem acima do
+# UPSTREAM_DEADLINE, pois as requisições não esperam as APIs externas além dele
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+preload_app = False
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
@@ -0,0 +1,47 @@
+"""Cria a tabela de municípios -> unidade mais próxima (catchments)
+
+Revision ID: a8c4e2f9b613
+Revises: f3b9d2a7c1e5
+Create Date: 2026-10-18 19:42:11.830517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c4e2f9b613'
+down_revision = 'f3b9d2a7c1e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'municipality_catchments',
+        sa.Column('ibge_code', sa.String(length=7), nullable=False),
+        sa.Column('name', sa.String(length=150), nullable=False),
+        sa.Column('state_code', sa.String(length=2), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('nearest_unit_id', sa.Integer(), nullable=True),
+        sa.Column('distance_km', sa.Float(), nullable=True),
+        sa.Column('computed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('ibge_code')
+    )
+    op.create_index('ix_municipality_catchments_state_code', 'municipality_catchments', ['state_code'], unique=False)
+    op.create_index('ix_municipality_catchments_nearest_unit_id', 'municipality_catchments', ['nearest_unit_id'], unique=False)
+    op.create_table(
+        'catchment_units',
+        sa.Column('unit_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('unit_id')
+    )
+
+
+def downgrade():
+    op.drop_table('catchment_units')
+    op.drop_index('ix_municipality_catchments_nearest_unit_id', table_name='municipality_catchments')
+    op.drop_index('ix_municipality_catchments_state_code', table_name='municipality_catchments')
+    op.drop_table('municipality_catchments')
@@ -0,0 +1,85 @@
+"""Adiciona índice espacial para treatment_units (PostGIS ou R*Tree)
+
+Revision ID: b7c2e4f1a9d3
+Revises: 506dcf657f91
+Create Date: 2026-10-18 10:12:31.104522
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c2e4f1a9d3'
+down_revision = '506dcf657f91'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name == 'postgresql':
+        available = bind.execute(sa.text(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'postgis'"
+        )).scalar()
+        if not available:
+            print("PostGIS não disponível; índice espacial não criado (busca em memória será usada)")
+            return
+
+        op.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+        # Coluna gerada: acompanha latitude/longitude sem precisar de triggers
+        op.execute("""
+            ALTER TABLE treatment_units
+            ADD COLUMN geog geography(Point, 4326)
+            GENERATED ALWAYS AS (
+                ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography
+            ) STORED
+        """)
+        op.execute("CREATE INDEX ix_treatment_units_geog ON treatment_units USING GIST (geog)")
+
+    elif bind.dialect.name == 'sqlite':
+        op.execute("""
+            CREATE VIRTUAL TABLE treatment_units_rtree
+            USING rtree(id, min_lat, max_lat, min_lng, max_lng)
+        """)
+        op.execute("""
+            INSERT INTO treatment_units_rtree (id, min_lat, max_lat, min_lng, max_lng)
+            SELECT id, latitude, latitude, longitude, longitude FROM treatment_units
+        """)
+        op.execute("""
+            CREATE TRIGGER treatment_units_rtree_insert AFTER INSERT ON treatment_units
+            BEGIN
+                INSERT INTO treatment_units_rtree (id, min_lat, max_lat, min_lng, max_lng)
+                VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER treatment_units_rtree_update
+            AFTER UPDATE OF id, latitude, longitude ON treatment_units
+            BEGIN
+                DELETE FROM treatment_units_rtree WHERE id = old.id;
+                INSERT INTO treatment_units_rtree (id, min_lat, max_lat, min_lng, max_lng)
+                VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER treatment_units_rtree_delete AFTER DELETE ON treatment_units
+            BEGIN
+                DELETE FROM treatment_units_rtree WHERE id = old.id;
+            END
+        """)
+
+
+def downgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_treatment_units_geog")
+        op.execute("ALTER TABLE treatment_units DROP COLUMN IF EXISTS geog")
+
+    elif bind.dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS treatment_units_rtree_delete")
+        op.execute("DROP TRIGGER IF EXISTS treatment_units_rtree_update")
+        op.execute("DROP TRIGGER IF EXISTS treatment_units_rtree_insert")
+        op.execute("DROP TABLE IF EXISTS treatment_units_rtree")
@@ -0,0 +1,34 @@
+"""Cria a tabela de estados coletados do OSM (cobertura da base local)
+
+Revision ID: c5d1e9a3b7f2
+Revises: a8c4e2f9b613
+Create Date: 2026-10-18 21:08:44.190352
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d1e9a3b7f2'
+down_revision = 'a8c4e2f9b613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'osm_harvested_states',
+        sa.Column('state_code', sa.String(length=2), nullable=False),
+        sa.Column('harvested_at', sa.DateTime(), nullable=False),
+        sa.Column('facilities', sa.Integer(), nullable=False),
+        sa.Column('south', sa.Float(), nullable=True),
+        sa.Column('west', sa.Float(), nullable=True),
+        sa.Column('north', sa.Float(), nullable=True),
+        sa.Column('east', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('state_code')
+    )
+
+
+def downgrade():
+    op.drop_table('osm_harvested_states')
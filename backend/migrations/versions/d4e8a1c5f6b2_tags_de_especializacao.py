@@ -0,0 +1,85 @@
+"""Normaliza especializações em tags indexadas e indexa unit_type
+
+Revision ID: d4e8a1c5f6b2
+Revises: b7c2e4f1a9d3
+Create Date: 2026-10-18 14:03:55.518230
+
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e8a1c5f6b2'
+down_revision = 'b7c2e4f1a9d3'
+branch_labels = None
+depends_on = None
+
+
+# Cópia congelada das regras de models/unit_specialization.py no momento da migração
+KNOWN_SPECIALIZATIONS = {
+    'anemia_falciforme': ('anemia falciforme',),
+    'hematologia': ('hematologia',),
+    'hemoterapia': ('hemoterapia',),
+    'hemocentro': ('hemocentro',),
+    'talassemia': ('talassemia',),
+}
+
+
+def _specialization_tags(specialization):
+    if not specialization:
+        return []
+
+    decomposed = unicodedata.normalize('NFKD', specialization)
+    normalized = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    normalized = re.sub(r'\s+', ' ', normalized.casefold()).strip()
+
+    tags = []
+    for part in re.split(r'[,;/|]+', normalized):
+        tag = re.sub(r'[^a-z0-9]+', '_', part).strip('_')[:64]
+        if tag and tag not in tags:
+            tags.append(tag)
+
+    for tag, terms in KNOWN_SPECIALIZATIONS.items():
+        if tag not in tags and any(term in normalized for term in terms):
+            tags.append(tag)
+
+    return tags
+
+
+def upgrade():
+    specializations = op.create_table(
+        'treatment_unit_specializations',
+        sa.Column('unit_id', sa.Integer(), nullable=False),
+        sa.Column('tag', sa.String(length=64), nullable=False),
+        sa.ForeignKeyConstraint(['unit_id'], ['treatment_units.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('unit_id', 'tag')
+    )
+    op.create_index(
+        'ix_treatment_unit_specializations_tag',
+        'treatment_unit_specializations',
+        ['tag', 'unit_id'],
+        unique=False
+    )
+    op.create_index('ix_treatment_units_unit_type', 'treatment_units', ['unit_type'], unique=False)
+
+    # Backfill a partir do texto livre existente
+    rows = op.get_bind().execute(sa.text(
+        "SELECT id, specialization FROM treatment_units WHERE specialization IS NOT NULL"
+    ))
+    tags = [
+        {'unit_id': unit_id, 'tag': tag}
+        for unit_id, specialization in rows
+        for tag in _specialization_tags(specialization)
+    ]
+    if tags:
+        op.bulk_insert(specializations, tags)
+
+
+def downgrade():
+    op.drop_index('ix_treatment_units_unit_type', table_name='treatment_units')
+    op.drop_index('ix_treatment_unit_specializations_tag', table_name='treatment_unit_specializations')
+    op.drop_table('treatment_unit_specializations')
@@ -0,0 +1,29 @@
+"""Cria a tabela de versões dos dados (ETags consistentes entre processos)
+
+Revision ID: e2a7f4c9d1b8
+Revises: c5d1e9a3b7f2
+Create Date: 2026-10-18 21:47:12.552019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7f4c9d1b8'
+down_revision = 'c5d1e9a3b7f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'data_versions',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('data_versions')
@@ -0,0 +1,45 @@
+"""Cria a tabela health_facilities (coleta offline do OSM)
+
+Revision ID: f3b9d2a7c1e5
+Revises: d4e8a1c5f6b2
+Create Date: 2026-10-18 16:21:07.304118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d2a7c1e5'
+down_revision = 'd4e8a1c5f6b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'health_facilities',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('osm_type', sa.String(length=8), nullable=False),
+        sa.Column('osm_id', sa.BigInteger(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('facility_type', sa.String(length=20), nullable=False),
+        sa.Column('address', sa.String(length=255), nullable=False),
+        sa.Column('phone', sa.String(length=64), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('opening_hours', sa.String(length=255), nullable=False),
+        sa.Column('website', sa.String(length=255), nullable=False),
+        sa.Column('specialties', sa.JSON(), nullable=False),
+        sa.Column('state_code', sa.String(length=2), nullable=True),
+        sa.Column('harvested_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_health_facilities_lat_lng', 'health_facilities', ['latitude', 'longitude'], unique=False)
+    op.create_index('ix_health_facilities_state_code', 'health_facilities', ['state_code'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_health_facilities_state_code', table_name='health_facilities')
+    op.drop_index('ix_health_facilities_lat_lng', table_name='health_facilities')
+    op.drop_table('health_facilities')
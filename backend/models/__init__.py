@@ -1 +1,7 @@
+
 from .treatment_unit import TreatmentUnit
+from .unit_specialization import UnitSpecialization
+from .health_facility import HealthFacility
+from .municipality_catchment import MunicipalityCatchment, CatchmentUnit
+from .harvested_state import HarvestedState
+from .data_version import DataVersion
@@ -0,0 +1,12 @@
+from ..extensions import db
+
+
+class DataVersion(db.Model):
+    """
+    Contador de versão de um conjunto de dados, incrementado na mesma
+    transação que o altera; compartilhado por todos os processos
+    """
+    __tablename__ = 'data_versions'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
@@ -0,0 +1,18 @@
+from ..extensions import db
+
+
+class HarvestedState(db.Model):
+    """
+    Estado coletado por `flask harvest-osm`, com a extensão (bbox) das
+    unidades gravadas; define onde /api/unidades pode usar a base local
+    """
+    __tablename__ = 'osm_harvested_states'
+
+    state_code = db.Column(db.String(2), primary_key=True)
+    harvested_at = db.Column(db.DateTime, nullable=False)
+    facilities = db.Column(db.Integer, nullable=False)
+    # Sem unidades gravadas: extensão nula
+    south = db.Column(db.Float, nullable=True)
+    west = db.Column(db.Float, nullable=True)
+    north = db.Column(db.Float, nullable=True)
+    east = db.Column(db.Float, nullable=True)
@@ -0,0 +1,46 @@
+from ..extensions import db
+
+
+class HealthFacility(db.Model):
+    """
+    Hospital ou clínica do OpenStreetMap, materializado pela coleta offline
+    (flask harvest-osm) já classificado
+    """
+    __tablename__ = 'health_facilities'
+
+    # Mesmo identificador usado nas respostas de /api/unidades (osm_<tipo>_<id>)
+    id = db.Column(db.String(32), primary_key=True)
+    osm_type = db.Column(db.String(8), nullable=False)
+    osm_id = db.Column(db.BigInteger, nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    facility_type = db.Column(db.String(20), nullable=False)
+    address = db.Column(db.String(255), nullable=False, default='')
+    phone = db.Column(db.String(64), nullable=False, default='')
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    opening_hours = db.Column(db.String(255), nullable=False, default='')
+    website = db.Column(db.String(255), nullable=False, default='')
+    specialties = db.Column(db.JSON, nullable=False, default=list)
+    state_code = db.Column(db.String(2), nullable=True, index=True)
+    harvested_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_health_facilities_lat_lng', 'latitude', 'longitude'),
+    )
+
+    def to_dict(self):
+        """Mesmo formato dos centros médicos retornados pela Overpass API"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'type': self.facility_type,
+            'address': self.address,
+            'phone': self.phone,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'opening_hours': self.opening_hours,
+            'website': self.website,
+            'specialties': list(self.specialties or []),
+            'osm_id': self.osm_id,
+            'osm_type': self.osm_type
+        }
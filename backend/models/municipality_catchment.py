@@ -0,0 +1,43 @@
+from ..extensions import db
+
+
+class MunicipalityCatchment(db.Model):
+    """
+    Unidade ativa de anemia falciforme mais próxima de cada município,
+    materializada por `flask build-catchments`
+    """
+    __tablename__ = 'municipality_catchments'
+
+    ibge_code = db.Column(db.String(7), primary_key=True)
+    name = db.Column(db.String(150), nullable=False)
+    state_code = db.Column(db.String(2), nullable=False, index=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    # Sem unidade (tabela de unidades vazia): nearest_unit_id e distance_km nulos
+    nearest_unit_id = db.Column(db.Integer, nullable=True, index=True)
+    distance_km = db.Column(db.Float, nullable=True)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            'ibge_code': self.ibge_code,
+            'name': self.name,
+            'state_code': self.state_code,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'nearest_unit_id': self.nearest_unit_id,
+            'distance_km': self.distance_km,
+            'computed_at': self.computed_at.isoformat()
+        }
+
+
+class CatchmentUnit(db.Model):
+    """
+    Posição das unidades usadas no último cálculo da tabela de municípios;
+    comparada com as unidades atuais na atualização incremental
+    """
+    __tablename__ = 'catchment_units'
+
+    unit_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
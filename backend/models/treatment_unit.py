@@ -1,5 +1,8 @@
 # Importação corrigida para o deploy
+from sqlalchemy.orm import validates
+
 from ..extensions import db
+from .unit_specialization import UnitSpecialization, specialization_tags
 
 class TreatmentUnit(db.Model):
     __tablename__ = 'treatment_units'
@@ -11,8 +14,21 @@ class TreatmentUnit(db.Model):
     longitude = db.Column(db.Float, nullable=False)
     active = db.Column(db.Boolean, default=True)
     specialization = db.Column(db.String(255), nullable=True)
-    unit_type = db.Column(db.String(50), nullable=True)
+    unit_type = db.Column(db.String(50), nullable=True, index=True)
+
+    # Especializações normalizadas (tabela indexada por tag)
+    specialization_tags = db.relationship(
+        UnitSpecialization,
+        cascade='all, delete-orphan',
+        passive_deletes=True
+    )
 
+    @validates('specialization')
+    def _sync_specialization_tags(self, key, value):
+        self.specialization_tags = [
+            UnitSpecialization(tag=tag) for tag in specialization_tags(value)
+        ]
+        return value
     
     def to_dict(self):
         return {
@@ -0,0 +1,59 @@
+import re
+
+from ..extensions import db
+from ..services.text import normalize_text
+
+# Tag canônica usada pela busca pública de unidades
+SICKLE_CELL_TAG = 'anemia_falciforme'
+
+# Termos conhecidos (já normalizados) reconhecidos em qualquer parte do texto
+KNOWN_SPECIALIZATIONS = {
+    'anemia_falciforme': ('anemia falciforme',),
+    'hematologia': ('hematologia',),
+    'hemoterapia': ('hemoterapia',),
+    'hemocentro': ('hemocentro',),
+    'talassemia': ('talassemia',),
+}
+
+_SEPARATORS = re.compile(r'[,;/|]+')
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def specialization_tags(specialization) -> list:
+    """
+    Tags canônicas de um texto livre de especialização
+
+    Cada trecho separado por vírgula, ponto e vírgula ou barra vira uma tag
+    ('Anemia Falciforme' -> 'anemia_falciforme'), e os termos conhecidos são
+    reconhecidos mesmo no meio de frases maiores.
+    """
+    normalized = normalize_text(specialization)
+    if not normalized:
+        return []
+
+    tags = []
+    for part in _SEPARATORS.split(normalized):
+        tag = _NON_WORD.sub('_', part).strip('_')[:64]
+        if tag and tag not in tags:
+            tags.append(tag)
+
+    for tag, terms in KNOWN_SPECIALIZATIONS.items():
+        if tag not in tags and any(term in normalized for term in terms):
+            tags.append(tag)
+
+    return tags
+
+
+class UnitSpecialization(db.Model):
+    __tablename__ = 'treatment_unit_specializations'
+
+    unit_id = db.Column(
+        db.Integer,
+        db.ForeignKey('treatment_units.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    tag = db.Column(db.String(64), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_treatment_unit_specializations_tag', 'tag', 'unit_id'),
+    )
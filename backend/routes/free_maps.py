@@ -1,14 +1,43 @@
-from flask import Blueprint, request, jsonify
-import requests
+from flask import Blueprint, current_app, request, jsonify
 import json
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Union
+import numpy as np
+from sqlalchemy import and_, or_
+from ..models.health_facility import HealthFacility
+from ..services import facility_classifier
+from ..services.data_version import facilities_version
+from ..services.dedup import dedupe_medical_centers
+from ..services.distance import bounding_boxes, haversine_km, haversine_one_to_many, within_radius
+from ..services.fanout import (
+    SOURCE_BUSY, SOURCE_ERROR, SOURCE_OK, SOURCE_OPEN, SOURCE_SKIPPED, SOURCE_TIMEOUT, Deadline, submit, upstream_executor_stats, wait_for
+)
+from ..services.geocode_cache import MISS, geocode_key, get_geocode_cache
+from ..services.http_cache import not_modified, strong_etag, with_cache_headers
+from ..services.http_client import CircuitOpen, HttpClient, get_http_client
+from ..services.outbound_scheduler import AUTOCOMPLETE, INTERACTIVE, OutboundRejected
+from ..services.json_stream import iter_response_array
+from ..services.municipalities import get_municipality_index
+from ..services.osm_elements import OVERPASS_URL, build_overpass_query, element_to_medical_center
+from ..services.osm_harvester import covers_area
+from ..services.overpass_cache import get_overpass_cache
+from ..services.pagination import (
+    InvalidCursor, RankedResults, clamp_page_size, decode_cursor, encode_cursor, get_ranked_results_cache,
+    query_fingerprint
+)
+from ..services.responses import json_response, parse_fields, project
+from ..services.single_flight import get_single_flight
+from ..services.text import normalize_text
 
 free_maps_bp = Blueprint('free_maps', __name__)
 
-# URLs das APIs gratuitas
+# URL da API de geocodificação (a da Overpass fica em services/osm_elements.py)
 NOMINATIM_URL = 'https://nominatim.openstreetmap.org'
-OVERPASS_URL = 'https://overpass-api.de/api/interpreter'
+
+# Timeouts (conexão, leitura) em segundos por tipo de chamada
+AUTOCOMPLETE_TIMEOUT = (3.05, 5)
+GEOCODE_TIMEOUT = (3.05, 10)
+OVERPASS_TIMEOUT = (3.05, 30)  # a query pede [timeout:25] ao servidor
 
 # Dados estáticos de fallback para centros de hematologia no Brasil
 FALLBACK_UNITS = [
@@ -110,6 +139,10 @@ FALLBACK_UNITS = [
     }
 ]
 
+# Coordenadas do fallback em arrays para o cálculo de distância em lote
+FALLBACK_LATITUDES = np.array([unit['latitude'] for unit in FALLBACK_UNITS])
+FALLBACK_LONGITUDES = np.array([unit['longitude'] for unit in FALLBACK_UNITS])
+
 @free_maps_bp.route('/unidades', methods=['GET'])
 def get_medical_centers():
     """
@@ -122,11 +155,70 @@ def get_medical_centers():
         lng = request.args.get('lng', type=float)
         cidade = request.args.get('cidade', type=str)
         radius = request.args.get('radius', default=50000, type=int)  # 50km em metros
+        # Projeção opcional dos campos de cada unidade (ex.: fields=id,name,latitude,longitude)
+        fields = parse_fields(request.args.get('fields'))
+        
+        # Paginação por cursor só quando pedida (limit ou cursor), com teto
+        # no servidor; sem ela, a resposta traz todas as unidades do raio
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        max_page_size = current_app.config['UNITS_PAGE_SIZE_MAX']
+        page_size = clamp_page_size(request.args.get('limit'), max_page_size, max_page_size) if paginated else None
+        fingerprint = query_fingerprint(lat, lng, cidade, radius)
+        try:
+            after = decode_cursor(request.args.get('cursor'), fingerprint, id_type=str)
+        except InvalidCursor as e:
+            return jsonify({
+                'success': False,
+                'message': str(e),
+                'error_code': 'INVALID_CURSOR'
+            }), 400
+        
+        # Validação condicional antes de qualquer busca: a ETag depende só da
+        # versão dos dados e dos parâmetros
+        etag_params = ('unidades', lat, lng, cidade, radius, page_size, fields, request.args.get('cursor'))
+        data_version = medical_centers_version(lat, lng, cidade, radius)
+        if data_version is not None:
+            cached_response = not_modified(strong_etag(data_version, *etag_params))
+            if cached_response is not None:
+                return cached_response
+        
+        # Todas as chamadas externas desta requisição compartilham um prazo
+        deadline = Deadline(current_app.config.get('UPSTREAM_DEADLINE', 2.0))
+        source_status = {}
+        
+        # Páginas seguintes (e repetições) da mesma busca, na mesma versão dos
+        # dados, saem do resultado já ordenado: sem refazer busca, deduplicação
+        # e ordenação a cada página
+        ranked_cache = get_ranked_results_cache()
+        ranked = ranked_cache.get((fingerprint, data_version)) if data_version is not None else None
+        if ranked is not None:
+            lat, lng = ranked.extra['location']
+            source_status.update(ranked.extra['source_status'])
         
         # Se não temos coordenadas, tentar geocodificar a cidade
-        if not lat or not lng:
+        if ranked is None and (not lat or not lng):
             if cidade:
-                coords = geocode_city(cidade)
+                status, coords = wait_for(submit(geocode_city, cidade, deadline), deadline, 'geocoding')
+                source_status['geocoding'] = status
+                if status == SOURCE_TIMEOUT:
+                    # A geocodificação continua em segundo plano e fica em cache
+                    return jsonify({
+                        'success': False,
+                        'message': f'Tempo esgotado ao localizar a cidade: {cidade}. Tente novamente.',
+                        'error_code': 'GEOCODING_TIMEOUT'
+                    }), 504
+                if status == SOURCE_BUSY:
+                    return jsonify({
+                        'success': False,
+                        'message': 'Serviço de localização sobrecarregado. Tente novamente em instantes.',
+                        'error_code': 'UPSTREAM_BUSY'
+                    }), 503
+                if status == SOURCE_OPEN:
+                    return jsonify({
+                        'success': False,
+                        'message': 'Serviço de localização indisponível no momento. Tente novamente em instantes.',
+                        'error_code': 'UPSTREAM_UNAVAILABLE'
+                    }), 503
                 if coords:
                     lat, lng = coords
                 else:
@@ -142,52 +234,45 @@ def get_medical_centers():
                     'error_code': 'LOCATION_REQUIRED'
                 }), 400
         
-        # Buscar centros médicos usando Overpass API
-        medical_centers = []
-        
-        try:
-            # Buscar hospitais e clínicas com especialidade em hematologia
-            overpass_results = search_medical_centers_overpass(lat, lng, radius)
-            medical_centers.extend(overpass_results)
-        except Exception as e:
-            print(f"Erro na Overpass API: {str(e)}")
-        
-        # Se não encontrou resultados suficientes, usar dados de fallback
-        if len(medical_centers) < 3:
-            fallback_results = get_fallback_units(lat, lng, radius)
-            medical_centers.extend(fallback_results)
-        
-        # Remover duplicatas baseado no ID
-        seen_ids = set()
-        unique_results = []
-        
-        for center in medical_centers:
-            if center['id'] not in seen_ids:
-                seen_ids.add(center['id'])
-                unique_results.append(center)
-        
-        # Calcular distâncias e ordenar por proximidade
-        for center in unique_results:
-            center['distance_km'] = calculate_distance(
-                lat, lng, 
-                center['latitude'], center['longitude']
-            )
+        if ranked is None:
+            ranked = search_ranked_medical_centers(lat, lng, radius, deadline, source_status)
+        merged_count = ranked.extra['merged_duplicates']
+        
+        next_cursor = None
+        if paginated:
+            page = ranked.page(after, page_size)
+            if len(page) > page_size and page_size > 0:
+                last = page[page_size - 1]
+                next_cursor = encode_cursor(last['distance_km'], last['id'], fingerprint)
+            page = page[:page_size]
+        else:
+            page = list(ranked.items)
         
-        # Ordenar por distância
-        unique_results.sort(key=lambda x: x['distance_km'])
+        # Versão depois da busca (os tiles que faltavam agora estão em cache)
+        data_version = medical_centers_version(lat, lng, cidade, radius)
+        etag = strong_etag(data_version, *etag_params) if data_version is not None else None
+        partial = any(status in (SOURCE_TIMEOUT, SOURCE_ERROR, SOURCE_BUSY, SOURCE_OPEN) for status in source_status.values())
+        if not partial and data_version is not None:
+            ranked_cache.set((fingerprint, data_version), ranked)
         
-        return jsonify({
+        response = json_response({
             'success': True,
-            'data': unique_results,
-            'total': len(unique_results),
+            'data': project(page, fields),
+            'total': len(page),
+            'next_cursor': next_cursor,
             'search_location': {
                 'latitude': lat,
                 'longitude': lng,
                 'radius_km': radius / 1000,
                 'city': cidade if cidade else 'Coordenadas fornecidas'
             },
-            'data_sources': ['overpass_api', 'fallback_data']
-        }), 200
+            'data_sources': [source for source, status in source_status.items() if status == SOURCE_OK],
+            'source_status': source_status,
+            'partial': partial,
+            'merged_duplicates': merged_count
+        })
+        # Resultados parciais (fonte com timeout/erro) não são guardados
+        return with_cache_headers(response, etag, cacheable=not partial), 200
         
     except Exception as e:
         return jsonify({
@@ -195,6 +280,96 @@ def get_medical_centers():
             'message': f'Erro interno do servidor: {str(e)}'
         }), 500
 
+def search_ranked_medical_centers(
+    lat: float, lng: float, radius: int, deadline: Deadline, source_status: Dict[str, str]
+) -> RankedResults:
+    """
+    Buscar os centros médicos em volta do ponto (base local ou Overpass API,
+    mais o fallback), deduplicar e ordenar pela chave da paginação; a
+    situação de cada fonte é registrada em source_status
+    """
+    if use_local_medical_centers(lat, lng, radius):
+        # Base local coletada por `flask harvest-osm`: sem chamadas externas
+        medical_centers = search_local_medical_centers(lat, lng, radius)
+        source_status['osm_local'] = SOURCE_OK
+        fallback_results = get_fallback_units(lat, lng, radius)
+    else:
+        # Buscar centros médicos na Overpass API em paralelo com o fallback
+        overpass_future = submit(search_medical_centers_cached, lat, lng, radius)
+        fallback_results = get_fallback_units(lat, lng, radius)
+        
+        status, overpass_results = wait_for(overpass_future, deadline, 'overpass_api')
+        source_status['overpass_api'] = status
+        medical_centers = list(overpass_results or [])
+    
+    # Se não encontrou resultados suficientes, usar dados de fallback
+    if len(medical_centers) < 3:
+        medical_centers.extend(fallback_results)
+        source_status['fallback_data'] = SOURCE_OK
+    else:
+        source_status['fallback_data'] = SOURCE_SKIPPED
+    
+    # Remover duplicatas por ID e por proximidade + nome (ex.: nó e way
+    # do mesmo hospital, ou hemocentro do OSM e do fallback)
+    unique_results, merged_count = dedupe_medical_centers(
+        medical_centers, current_app.config.get('DEDUP_DISTANCE_M', 200)
+    )
+    
+    # Calcular distâncias (em lote) e ordenar por proximidade
+    distances = haversine_one_to_many(
+        lat, lng,
+        [center['latitude'] for center in unique_results],
+        [center['longitude'] for center in unique_results]
+    )
+    for center, distance_km in zip(unique_results, distances.tolist()):
+        center['distance_km'] = distance_km
+    
+    # Ordenar uma única vez por (distância, id), a chave da paginação
+    return RankedResults(unique_results, key=lambda x: (x['distance_km'], x['id']), extra={
+        'location': (lat, lng),
+        'source_status': dict(source_status),
+        'merged_duplicates': merged_count
+    })
+
+# Sugestões devolvidas pelo autocomplete de cidades
+CITY_SUGGESTIONS_LIMIT = 10
+
+def nominatim_cities(query: str) -> List[Dict[str, Any]]:
+    """Cidades do Nominatim para o autocomplete"""
+    params = {
+        'q': f"{query}, Brasil",
+        'format': 'json',
+        'limit': CITY_SUGGESTIONS_LIMIT,
+        'countrycodes': 'br',
+        'featuretype': 'city',
+        'addressdetails': 1
+    }
+    
+    # Autocomplete espera na fila do Nominatim depois da geocodificação,
+    # e só enquanto a sugestão ainda for útil
+    response = get_http_client().request(
+        'nominatim', 'GET', f"{NOMINATIM_URL}/search",
+        timeout=AUTOCOMPLETE_TIMEOUT, params=params, priority=AUTOCOMPLETE,
+        deadline=Deadline(current_app.config.get('AUTOCOMPLETE_MAX_WAIT', 1.0))
+    )
+    
+    cities = []
+    for item in response.json():
+        address = item.get('address', {})
+        city_name = address.get('city') or address.get('town') or address.get('village')
+        state = address.get('state')
+        
+        if city_name and state:
+            cities.append({
+                'name': city_name,
+                'state': state,
+                'full_name': f"{city_name}, {state}",
+                'latitude': float(item['lat']),
+                'longitude': float(item['lon'])
+            })
+    
+    return cities
+
 @free_maps_bp.route('/cidades', methods=['GET'])
 def search_cities():
     """
@@ -209,39 +384,44 @@ def search_cities():
                 'message': 'Query deve ter pelo menos 2 caracteres'
             }), 400
         
-        # Buscar cidades usando Nominatim
-        params = {
-            'q': f"{query}, Brasil",
-            'format': 'json',
-            'limit': 10,
-            'countrycodes': 'br',
-            'featuretype': 'city',
-            'addressdetails': 1
-        }
-        
-        headers = {
-            'User-Agent': 'Sistema-Meia-Lua/1.0 (contato@sistema-meia-lua.com)'
-        }
-        
-        response = requests.get(f"{NOMINATIM_URL}/search", params=params, headers=headers)
-        response.raise_for_status()
-        
-        data = response.json()
-        
+        # Buscar primeiro no índice local de municípios
         cities = []
-        for item in data:
-            address = item.get('address', {})
-            city_name = address.get('city') or address.get('town') or address.get('village')
-            state = address.get('state')
-            
-            if city_name and state:
-                cities.append({
-                    'name': city_name,
-                    'state': state,
-                    'full_name': f"{city_name}, {state}",
-                    'latitude': float(item['lat']),
-                    'longitude': float(item['lon'])
-                })
+        municipality_index = get_municipality_index()
+        if municipality_index is not None:
+            cities = [
+                {
+                    'name': municipality.name,
+                    'state': municipality.state,
+                    'full_name': f"{municipality.name}, {municipality.state}",
+                    'latitude': municipality.latitude,
+                    'longitude': municipality.longitude
+                }
+                for municipality in municipality_index.search(query, limit=CITY_SUGGESTIONS_LIMIT)
+            ]
+            # Índice completo: o que não está nele não é município
+            if municipality_index.complete or len(cities) >= CITY_SUGGESTIONS_LIMIT:
+                return jsonify({
+                    'success': True,
+                    'data': cities,
+                    'total': len(cities)
+                }), 200
+        
+        # Índice parcial (ou ausente) com menos sugestões que o limite:
+        # completar com o Nominatim, sem repetir as cidades locais. Havendo
+        # sugestões locais, o Nominatim só entra se responder dentro do prazo
+        if cities:
+            future = submit(nominatim_cities, query)
+            _, remote = wait_for(future, Deadline(current_app.config.get('AUTOCOMPLETE_MAX_WAIT', 1.0)), 'nominatim')
+            remote = remote or []
+        else:
+            remote = nominatim_cities(query)
+        
+        seen = {(normalize_text(city['name']), normalize_text(city['state'])) for city in cities}
+        for city in remote:
+            key = (normalize_text(city['name']), normalize_text(city['state']))
+            if key not in seen and len(cities) < CITY_SUGGESTIONS_LIMIT:
+                seen.add(key)
+                cities.append(city)
         
         return jsonify({
             'success': True,
@@ -249,15 +429,63 @@ def search_cities():
             'total': len(cities)
         }), 200
         
+    except (OutboundRejected, CircuitOpen) as e:
+        print(f"Busca de cidades no Nominatim não realizada: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Busca de cidades indisponível no momento. Tente novamente em instantes.',
+            'error_code': 'UPSTREAM_BUSY'
+        }), 503
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'Erro ao buscar cidades: {str(e)}'
         }), 500
 
-def geocode_city(city_name: str) -> Optional[tuple]:
+# Upstreams mostrados em /upstreams mesmo antes da primeira chamada
+UPSTREAMS = ('nominatim', 'overpass')
+
+@free_maps_bp.route('/upstreams', methods=['GET'])
+def get_upstreams_status():
+    """
+    Estado dos disjuntores das APIs externas neste processo: situação
+    (closed/open/half_open), taxa de erro e latências da janela recente e
+    timeout adaptativo em uso; e a fila do agendador de chamadas com limite de taxa
+    """
+    client = get_http_client()
+    response = jsonify({
+        'success': True,
+        'data': [client.breaker(upstream).snapshot() for upstream in UPSTREAMS],
+        'executor': upstream_executor_stats(),
+        'outbound': client.scheduler.stats() if client.scheduler is not None else {}
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200
+
+def geocode_city(
+    city_name: str, deadline: Optional[Deadline] = None, priority: int = INTERACTIVE
+) -> Optional[tuple]:
     """
     Geocodificar nome da cidade usando Nominatim
+
+    Consulta antes o cache de geocodificação (memória + SQLite); resultados
+    negativos também são guardados, mas falhas de rede não. Buscas iguais
+    simultâneas compartilham uma única chamada ao Nominatim, que entra na
+    fila do agendador com a prioridade e o prazo de quem a iniciou.
+    """
+    cache = get_geocode_cache()
+    cache_key = geocode_key(city_name)
+    cached = cache.get(cache_key)
+    if cached is not MISS:
+        return cached
+    
+    return get_single_flight().do(('geocode', cache_key), geocode_city_nominatim, city_name, deadline, priority)
+
+def geocode_city_nominatim(
+    city_name: str, deadline: Optional[Deadline] = None, priority: int = INTERACTIVE
+) -> Optional[tuple]:
+    """
+    Geocodificar no Nominatim e guardar o resultado no cache
     """
     try:
         # Adicionar "Brasil" para melhorar a precisão
@@ -271,228 +499,164 @@ def geocode_city(city_name: str) -> Optional[tuple]:
             'addressdetails': 1
         }
         
-        headers = {
-            'User-Agent': 'Sistema-Meia-Lua/1.0 (contato@sistema-meia-lua.com)'
-        }
-        
-        response = requests.get(f"{NOMINATIM_URL}/search", params=params, headers=headers)
-        response.raise_for_status()
+        response = get_http_client().request(
+            'nominatim', 'GET', f"{NOMINATIM_URL}/search",
+            timeout=GEOCODE_TIMEOUT, params=params, priority=priority, deadline=deadline
+        )
         
         data = response.json()
         
+        coords = None
         if data and len(data) > 0:
             result = data[0]
-            return float(result['lat']), float(result['lon'])
+            coords = float(result['lat']), float(result['lon'])
         
-        return None
+        get_geocode_cache().set(geocode_key(city_name), coords)
+        return coords
         
+    except (CircuitOpen, OutboundRejected):
+        # Nominatim fora do ar ou fila cheia: a rota responde 503 em vez de
+        # "cidade não encontrada", e nada vai para o cache
+        raise
     except Exception as e:
         print(f"Erro na geocodificação: {str(e)}")
         return None
 
+def fetch_medical_centers_overpass(area: Union[str, Sequence[str]], client: Optional[HttpClient] = None) -> List[Dict[Any, Any]]:
+    """
+    Executar a query Overpass para a área; erros de rede são propagados
+
+    A resposta é lida em streaming: cada elemento é classificado assim que
+    chega e os irrelevantes são descartados na hora.
+    """
+    client = client or get_http_client()
+    response = client.request(
+        'overpass', 'POST', OVERPASS_URL,
+        timeout=OVERPASS_TIMEOUT, data=build_overpass_query(area), stream=True
+    )
+    
+    medical_centers = []
+    for element in iter_response_array(response, 'elements'):
+        medical_center = element_to_medical_center(element)
+        if medical_center is not None:
+            medical_centers.append(medical_center)
+    
+    return medical_centers
+
 def search_medical_centers_overpass(lat: float, lng: float, radius: int) -> List[Dict[Any, Any]]:
     """
     Buscar centros médicos usando Overpass API
     """
     try:
-        # Query Overpass para buscar hospitais e clínicas
-        overpass_query = f"""
-        [out:json][timeout:25];
-        (
-          node["amenity"="hospital"](around:{radius},{lat},{lng});
-          node["amenity"="clinic"](around:{radius},{lat},{lng});
-          node["healthcare"="hospital"](around:{radius},{lat},{lng});
-          node["healthcare"="clinic"](around:{radius},{lat},{lng});
-          way["amenity"="hospital"](around:{radius},{lat},{lng});
-          way["amenity"="clinic"](around:{radius},{lat},{lng});
-          way["healthcare"="hospital"](around:{radius},{lat},{lng});
-          way["healthcare"="clinic"](around:{radius},{lat},{lng});
-        );
-        out center meta;
-        """
-        
-        response = requests.post(OVERPASS_URL, data=overpass_query, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        medical_centers = []
-        
-        for element in data.get('elements', []):
-            # Obter coordenadas
-            if element['type'] == 'node':
-                element_lat = element['lat']
-                element_lng = element['lon']
-            elif element['type'] == 'way' and 'center' in element:
-                element_lat = element['center']['lat']
-                element_lng = element['center']['lon']
-            else:
-                continue
-            
-            tags = element.get('tags', {})
-            name = tags.get('name', 'Centro Médico')
-            
-            # Filtrar apenas locais que podem ter serviços de hematologia
-            if is_relevant_medical_facility(name, tags):
-                medical_center = {
-                    'id': f"osm_{element['type']}_{element['id']}",
-                    'name': name,
-                    'type': determine_unit_type_from_tags(name, tags),
-                    'address': format_address_from_tags(tags),
-                    'phone': tags.get('phone', ''),
-                    'latitude': element_lat,
-                    'longitude': element_lng,
-                    'opening_hours': format_opening_hours_from_tags(tags),
-                    'website': tags.get('website', ''),
-                    'specialties': extract_specialties_from_tags(tags),
-                    'osm_id': element['id'],
-                    'osm_type': element['type']
-                }
-                
-                medical_centers.append(medical_center)
-        
-        return medical_centers
-        
+        return fetch_medical_centers_overpass(f"around:{radius},{lat},{lng}")
     except Exception as e:
         print(f"Erro na Overpass API: {str(e)}")
         return []
 
-def is_relevant_medical_facility(name: str, tags: Dict[str, str]) -> bool:
+def search_medical_centers_cached(lat: float, lng: float, radius: int) -> List[Dict[Any, Any]]:
     """
-    Verificar se a instalação médica é relevante para hematologia
+    Buscar centros médicos pelo cache de tiles da Overpass API
+    (stale-while-revalidate; ver services/overpass_cache.py); erros são propagados
     """
-    name_lower = name.lower()
-    
-    # Palavras-chave que indicam relevância para hematologia
-    relevant_keywords = [
-        'hospital', 'hemocentro', 'hemoterapia', 'hematologia',
-        'centro médico', 'clínica', 'ambulatório', 'policlínica',
-        'unidade de saúde', 'posto de saúde', 'upa', 'pronto socorro',
-        'santa casa', 'fundação', 'instituto'
-    ]
-    
-    # Verificar nome
-    for keyword in relevant_keywords:
-        if keyword in name_lower:
-            return True
+    if not current_app.config.get('OVERPASS_CACHE_ENABLED', True):
+        area = f"around:{radius},{lat},{lng}"
+        return get_single_flight().do(('overpass', area), fetch_medical_centers_overpass, area)
     
-    # Verificar tags
-    amenity = tags.get('amenity', '').lower()
-    healthcare = tags.get('healthcare', '').lower()
-    speciality = tags.get('speciality', '').lower()
-    
-    if amenity in ['hospital', 'clinic'] or healthcare in ['hospital', 'clinic']:
-        return True
-    
-    if 'hematology' in speciality or 'haematology' in speciality:
-        return True
-    
-    return False
+    # O cliente é capturado para as atualizações feitas fora do app
+    client = get_http_client()
+    cache = get_overpass_cache(
+        lambda bboxes: search_medical_centers_overpass_bboxes(bboxes, client=client)
+    )
+    return cache.search(lat, lng, radius)
 
-def determine_unit_type_from_tags(name: str, tags: Dict[str, str]) -> str:
+def search_medical_centers_overpass_bboxes(
+    bboxes: Sequence[Tuple[float, float, float, float]], client: Optional[HttpClient] = None
+) -> List[Dict[Any, Any]]:
     """
-    Determinar se a unidade é pública ou privada baseado no nome e tags
+    Buscar centros médicos na união de bboxes (sul, oeste, norte, leste)
+    usando uma query da Overpass API (erros são propagados)
     """
-    name_lower = name.lower()
-    
-    # Palavras-chave que indicam unidade pública
-    public_keywords = [
-        'sus', 'público', 'municipal', 'estadual', 'federal',
-        'upa', 'posto', 'centro de saúde', 'unidade básica',
-        'hospital geral', 'hospital municipal', 'hospital estadual',
-        'hospital universitário', 'hemoba', 'hemocentro', 'hemominas',
-        'hemorio', 'hemoce', 'hemope', 'hemoam', 'hemosc',
-        'fundação', 'instituto público', 'santa casa'
-    ]
-    
-    # Verificar nome
-    for keyword in public_keywords:
-        if keyword in name_lower:
-            return 'publica'
+    return fetch_medical_centers_overpass(
+        [f"{south},{west},{north},{east}" for south, west, north, east in bboxes], client
+    )
+
+def use_local_medical_centers(lat: Optional[float] = None, lng: Optional[float] = None, radius: Optional[int] = None) -> bool:
+    """
+    Se /api/unidades deve consultar a tabela health_facilities em vez da
+    Overpass API (MEDICAL_CENTERS_SOURCE: 'auto', 'local' ou 'overpass')
+    """
+    source = current_app.config.get('MEDICAL_CENTERS_SOURCE', 'auto')
+    if source != 'auto':
+        return source == 'local'
     
-    # Verificar tags
-    operator = tags.get('operator', '').lower()
-    operator_type = tags.get('operator:type', '').lower()
+    # 'auto': usar a base local só se a área da busca estiver dentro dos
+    # estados já coletados; fora deles (ou sem coordenadas), a Overpass API
+    version = facilities_version()
+    if not version or not version[0] or lat is None or lng is None:
+        return False
+    return covers_area(lat, lng, (radius or 0) / 1000)
+
+def medical_centers_version(lat: Optional[float], lng: Optional[float], cidade: Optional[str], radius: int) -> Optional[tuple]:
+    """
+    Versão dos dados de uma busca de /api/unidades, sem chamadas externas:
+    a versão da base local ou a coleta dos tiles da Overpass em cache.
+    None quando ela só pode ser conhecida depois da busca.
+    """
+    if not lat or not lng:
+        coords = get_geocode_cache().get(geocode_key(cidade)) if cidade else None
+        lat, lng = coords if coords is not MISS and coords is not None else (None, None)
     
-    if 'government' in operator_type or 'public' in operator_type:
-        return 'publica'
+    if use_local_medical_centers(lat, lng, radius):
+        return ('osm_local', facilities_version())
     
-    if any(word in operator for word in ['municipal', 'estadual', 'federal', 'governo']):
-        return 'publica'
+    cache = current_app.extensions.get('overpass_cache')
+    if cache is None or lat is None or not current_app.config.get('OVERPASS_CACHE_ENABLED', True):
+        return None
     
-    # Se não conseguir determinar claramente, assumir como privada
-    return 'privada'
+    stamps = cache.version(lat, lng, radius)
+    return ('overpass', stamps) if stamps is not None else None
 
-def format_address_from_tags(tags: Dict[str, str]) -> str:
+def search_local_medical_centers(lat: float, lng: float, radius: int) -> List[Dict[Any, Any]]:
     """
-    Formatar endereço a partir das tags do OSM
+    Buscar centros médicos na base local (bbox indexada + distância exata)
     """
-    address_parts = []
-    
-    # Componentes do endereço em ordem de prioridade
-    components = [
-        ('addr:street', ''),
-        ('addr:housenumber', ', '),
-        ('addr:neighbourhood', ' - '),
-        ('addr:city', ', '),
-        ('addr:state', ' - '),
-        ('addr:postcode', ', ')
+    boxes = [
+        and_(
+            HealthFacility.latitude.between(min_lat, max_lat),
+            HealthFacility.longitude.between(min_lng, max_lng)
+        )
+        for min_lat, max_lat, min_lng, max_lng in bounding_boxes(lat, lng, radius / 1000)
     ]
+    facilities = HealthFacility.query.filter(or_(*boxes)).all()
+    if not facilities:
+        return []
     
-    for tag, separator in components:
-        if tag in tags and tags[tag]:
-            if address_parts and separator:
-                address_parts.append(separator)
-            address_parts.append(tags[tag])
-    
-    if address_parts:
-        return ''.join(address_parts)
-    
-    # Fallback para endereço genérico
-    return tags.get('addr:full', 'Endereço não disponível')
+    positions, _ = within_radius(
+        lat, lng,
+        [facility.latitude for facility in facilities],
+        [facility.longitude for facility in facilities],
+        radius / 1000
+    )
+    return [facilities[position].to_dict() for position in positions.tolist()]
 
-def format_opening_hours_from_tags(tags: Dict[str, str]) -> str:
+def is_relevant_medical_facility(name: str, tags: Dict[str, str]) -> bool:
     """
-    Formatar horários de funcionamento a partir das tags
+    Verificar se a instalação médica é relevante para hematologia
+    (regras compiladas em services/facility_classifier.py)
     """
-    opening_hours = tags.get('opening_hours', '')
-    
-    if opening_hours:
-        # Tentar interpretar horários comuns
-        if opening_hours == '24/7':
-            return '24 horas'
-        elif 'Mo-Fr' in opening_hours:
-            return f'Segunda a sexta: {opening_hours.replace("Mo-Fr ", "")}'
-        else:
-            return opening_hours
-    
-    return 'Horários não disponíveis'
+    return facility_classifier.is_relevant(name.lower(), tags)
+
+def determine_unit_type_from_tags(name: str, tags: Dict[str, str]) -> str:
+    """
+    Determinar se a unidade é pública ou privada baseado no nome e tags
+    """
+    return facility_classifier.unit_type(name.lower(), tags)
 
 def extract_specialties_from_tags(tags: Dict[str, str]) -> List[str]:
     """
     Extrair especialidades médicas das tags
     """
-    specialties = []
-    
-    speciality = tags.get('speciality', '').lower()
-    healthcare_speciality = tags.get('healthcare:speciality', '').lower()
-    
-    # Especialidades relacionadas à hematologia
-    hematology_keywords = ['hematology', 'haematology', 'blood', 'hemotherapy']
-    
-    for keyword in hematology_keywords:
-        if keyword in speciality or keyword in healthcare_speciality:
-            specialties.append('hematologia')
-            break
-    
-    # Adicionar outras especialidades relevantes
-    if 'emergency' in speciality or 'emergency' in healthcare_speciality:
-        specialties.append('emergencia')
-    
-    if not specialties:
-        specialties.append('medicina_geral')
-    
-    return specialties
+    return facility_classifier.specialties(tags)
 
 def get_fallback_units(lat: float, lng: float, radius: int) -> List[Dict[Any, Any]]:
     """
@@ -500,15 +664,16 @@ def get_fallback_units(lat: float, lng: float, radius: int) -> List[Dict[Any, An
     """
     fallback_results = []
     
-    for unit in FALLBACK_UNITS:
-        distance_km = calculate_distance(lat, lng, unit['latitude'], unit['longitude'])
-        
-        # Incluir unidades dentro do raio especificado
-        if distance_km <= (radius / 1000):
-            unit_copy = unit.copy()
-            unit_copy['distance_km'] = distance_km
-            unit_copy['data_source'] = 'fallback'
-            fallback_results.append(unit_copy)
+    # Incluir unidades dentro do raio especificado
+    positions, distances = within_radius(
+        lat, lng, FALLBACK_LATITUDES, FALLBACK_LONGITUDES, radius / 1000
+    )
+    
+    for position, distance_km in zip(positions.tolist(), distances.tolist()):
+        unit_copy = FALLBACK_UNITS[position].copy()
+        unit_copy['distance_km'] = distance_km
+        unit_copy['data_source'] = 'fallback'
+        fallback_results.append(unit_copy)
     
     return fallback_results
 
@@ -516,24 +681,4 @@ def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> fl
     """
     Calcular distância entre duas coordenadas usando fórmula de Haversine
     """
-    import math
-    
-    # Converter graus para radianos
-    lat1_rad = math.radians(lat1)
-    lng1_rad = math.radians(lng1)
-    lat2_rad = math.radians(lat2)
-    lng2_rad = math.radians(lng2)
-    
-    # Diferenças
-    dlat = lat2_rad - lat1_rad
-    dlng = lng2_rad - lng1_rad
-    
-    # Fórmula de Haversine
-    a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlng/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    
-    # Raio da Terra em km
-    r = 6371
-    
-    return c * r
-
+    return haversine_km(lat1, lng1, lat2, lng2)
@@ -0,0 +1,46 @@
+from flask import Blueprint, current_app, request, jsonify
+from ..services.clustering import get_cluster_index, valid_tile
+from ..services.data_version import unit_data_version
+from ..services.http_cache import not_modified, strong_etag, with_cache_headers
+from ..services.responses import dumps
+
+tiles_bp = Blueprint('tiles', __name__)
+
+@tiles_bp.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_tile(z, x, y):
+    """
+    Unidades de tratamento de um tile XYZ do mapa, já agrupadas para o zoom
+    (GeoJSON FeatureCollection; grupos têm cluster=true e point_count)
+    """
+    try:
+        if not valid_tile(z, x, y):
+            return jsonify({
+                'success': False,
+                'message': 'Tile inválido',
+                'error_code': 'INVALID_TILE'
+            }), 400
+        
+        # Filtrar por tipo de unidade (público/privado) se fornecido
+        unit_type = request.args.get('unit_type') or None
+        
+        # Validação condicional antes de montar o índice ou o tile
+        etag = strong_etag(unit_data_version(), 'tiles', unit_type, z, x, y)
+        cached_response = not_modified(etag)
+        if cached_response is not None:
+            return cached_response
+        
+        # Corpo do tile serializado uma vez por versão dos dados
+        index = get_cluster_index(unit_type)
+        body = index.cached_tile((z, x, y), lambda: dumps({
+            'type': 'FeatureCollection',
+            'features': index.tile_features(z, x, y)
+        }))
+        
+        response = current_app.response_class(body, mimetype='application/geo+json')
+        return with_cache_headers(response, etag), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao gerar tile: {str(e)}'
+        }), 500
@@ -1,15 +1,47 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from ..models.treatment_unit import TreatmentUnit
 from ..extensions import db
-import math
+from ..models.municipality_catchment import MunicipalityCatchment
+from ..models.unit_specialization import SICKLE_CELL_TAG
+from ..services.batch_nearest import nearest_for_origins, parse_origins
+from ..services.data_version import unit_data_version
+from ..services.distance import haversine_km
+from ..services.http_cache import not_modified, strong_etag, with_cache_headers
+from ..services.pagination import (
+    InvalidCursor, clamp_page_size, decode_cursor, encode_cursor, query_fingerprint
+)
+from ..services.responses import dumps, json_response, parse_fields, project
+from ..services.spatial_query import find_nearby_units
+from ..services.unit_export import FORMATS, export_units
+from ..services.unit_snapshot import get_unit_snapshot
 
 treatment_units_bp = Blueprint('treatment_units', __name__)
 
-@treatment_units_bp.route('/proximas', methods=['POST'])
+# Parâmetros de /proximas via GET (query string) e seus tipos
+NEARBY_QUERY_ARGS = {
+    'latitude': float, 'longitude': float, 'radius': float,
+    'limit': int, 'unit_type': str, 'cursor': str, 'fields': str
+}
+
+def nearby_query_args():
+    """Parâmetros de /proximas lidos da query string (os ausentes ou inválidos ficam de fora)"""
+    data = {}
+    for name, arg_type in NEARBY_QUERY_ARGS.items():
+        value = request.args.get(name, type=arg_type)
+        if value is not None:
+            data[name] = value
+    return data
+
+@treatment_units_bp.route('/proximas', methods=['GET', 'POST'])
 def get_nearby_units():
-    """Obter unidades próximas baseado na localização do usuário (público)"""
+    """
+    Obter unidades próximas baseado na localização do usuário (público)
+
+    Aceita corpo JSON (POST) ou query string (GET); as respostas do GET levam
+    ETag e Cache-Control e podem ser validadas com If-None-Match.
+    """
     try:
-        data = request.get_json()
+        data = request.get_json() if request.method == 'POST' else nearby_query_args()
         
         if not data or 'latitude' not in data or 'longitude' not in data:
             return jsonify({
@@ -20,38 +52,145 @@ def get_nearby_units():
         user_lat = data['latitude']
         user_lng = data['longitude']
         radius = data.get('radius', 25)  # raio padrão de 25km
-        limit = data.get('limit', 10)    # limite padrão de 10 unidades
+        # limite padrão de 10 unidades por página, com teto no servidor
+        limit = clamp_page_size(data.get('limit'), 10, current_app.config['UNITS_PAGE_SIZE_MAX'])
         
-        # Query em todas as unidades ativas
-        query = TreatmentUnit.query.filter_by(active=True)
-
-        # Filtrar por especialização em anemia falciforme
-        query = query.filter(TreatmentUnit.specialization.ilike("%anemia falciforme%"))
-
         # Filtrar por tipo de unidade (público/privado) se fornecido
         unit_type_filter = data.get("unit_type")
-        if unit_type_filter:
-            query = query.filter_by(unit_type=unit_type_filter)
 
-        units = query.all()
-        
-        # Calcular distâncias e filtrar por raio
+        # Projeção opcional dos campos de cada unidade ("id,name,distance" ou lista)
+        fields = parse_fields(data.get('fields'))
+
+        # Cursor da página anterior: retoma logo após (distância, id)
+        fingerprint = query_fingerprint(user_lat, user_lng, radius, unit_type_filter)
+        try:
+            after = decode_cursor(data.get('cursor'), fingerprint)
+        except InvalidCursor as e:
+            return jsonify({
+                'success': False,
+                'message': str(e),
+                'error_code': 'INVALID_CURSOR'
+            }), 400
+
+        # Validação condicional antes de consultar o banco
+        etag = strong_etag(
+            unit_data_version(), 'proximas', user_lat, user_lng, radius, limit, unit_type_filter, fields,
+            data.get('cursor')
+        )
+        cached_response = not_modified(etag)
+        if cached_response is not None:
+            return cached_response
+
+        # Unidades ativas de anemia falciforme dentro do raio, já ordenadas por
+        # distância (índice espacial do banco ou índice em memória); uma a mais
+        # para saber se existe próxima página
+        matches = find_nearby_units(user_lat, user_lng, radius, limit + 1, unit_type_filter, after)
+
         nearby_units = []
-        for unit in units:
-            distance = calculate_distance(user_lat, user_lng, unit.latitude, unit.longitude)
-            if distance <= radius:
-                unit_dict = unit.to_dict()
-                unit_dict['distance'] = round(distance, 2)
-                nearby_units.append(unit_dict)
+        for distance, unit in matches[:limit]:
+            unit_dict = dict(unit)
+            unit_dict['distance'] = round(distance, 2)
+            nearby_units.append(unit_dict)
+
+        next_cursor = None
+        if len(matches) > limit and nearby_units:
+            last = nearby_units[-1]
+            next_cursor = encode_cursor(last['distance'], last['id'], fingerprint)
         
-        # Ordenar por distância e limitar resultados
-        nearby_units.sort(key=lambda x: x['distance'])
-        nearby_units = nearby_units[:limit]
+        response = json_response({
+            'success': True,
+            'data': project(nearby_units, fields),
+            'total': len(nearby_units),
+            'next_cursor': next_cursor
+        })
+        if request.method == 'GET':
+            response = with_cache_headers(response, etag)
+        return response, 200
         
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'message': f'Erro ao buscar unidades próximas: {str(e)}'
+        }), 500
+
+@treatment_units_bp.route('/proximas/lote', methods=['POST'])
+def get_nearby_units_batch():
+    """
+    Unidades próximas de várias origens em uma requisição (análises de área de cobertura)
+
+    Corpo: {"origins": [{"id", "latitude", "longitude", "radius"?, "limit"?}, ...],
+    "radius"?, "limit"?, "unit_type"?, "fields"?, "format"?: "json" | "ndjson"}.
+    Com format=ndjson, cada origem vira uma linha, enviada assim que calculada.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        origins = data.get('origins')
+        max_origins = current_app.config.get('BATCH_MAX_ORIGINS', 1000)
+        
+        if not isinstance(origins, list) or not origins:
+            return jsonify({
+                'success': False,
+                'message': 'Informe a lista de origens (origins)',
+                'error_code': 'ORIGINS_REQUIRED'
+            }), 400
+        if len(origins) > max_origins:
+            return jsonify({
+                'success': False,
+                'message': f'No máximo {max_origins} origens por requisição',
+                'error_code': 'TOO_MANY_ORIGINS'
+            }), 400
+        
+        fmt = data.get('format', 'json')
+        if fmt not in ('json', 'ndjson'):
+            return jsonify({
+                'success': False,
+                'message': 'Formato inválido: use json ou ndjson',
+                'error_code': 'INVALID_FORMAT'
+            }), 400
+        
+        try:
+            ids, lats, lngs, radii, limits = parse_origins(
+                origins, data.get('radius', 25), data.get('limit', 10), current_app.config['UNITS_PAGE_SIZE_MAX']
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e),
+                'error_code': 'INVALID_ORIGIN'
+            }), 400
+        
+        fields = parse_fields(data.get('fields'))
+        
+        # Candidatas carregadas uma vez: unidades ativas de anemia falciforme do snapshot
+        snapshot = get_unit_snapshot()
+        rows = snapshot.rows(tag=SICKLE_CELL_TAG, unit_type=data.get('unit_type'))
+        candidates = [snapshot.records[row] for row in rows.tolist()]
+        matches = nearest_for_origins(
+            lats, lngs, radii, limits, snapshot.latitudes[rows], snapshot.longitudes[rows],
+            current_app.config.get('BATCH_MATRIX_CELLS', 2_000_000)
+        )
+        
+        def results():
+            for origin_id, lat, lng, (positions, distances) in zip(ids, lats, lngs, matches):
+                units = []
+                for position, distance in zip(positions.tolist(), distances.tolist()):
+                    unit_dict = dict(candidates[position])
+                    unit_dict['distance'] = round(distance, 2)
+                    units.append(unit_dict)
+                yield {
+                    'origin': {'id': origin_id, 'latitude': lat, 'longitude': lng},
+                    'data': project(units, fields),
+                    'total': len(units)
+                }
+        
+        if fmt == 'ndjson':
+            lines = (dumps(result) + b'\n' for result in results())
+            return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+        
+        return json_response({
             'success': True,
-            'data': nearby_units,
-            'total': len(nearby_units)
+            'results': list(results()),
+            'total_origins': len(ids)
         }), 200
         
     except Exception as e:
@@ -60,15 +199,73 @@ def get_nearby_units():
             'message': f'Erro ao buscar unidades próximas: {str(e)}'
         }), 500
 
+@treatment_units_bp.route('/cobertura', methods=['GET'])
+def get_catchments():
+    """
+    Unidade de anemia falciforme mais próxima de cada município (somente
+    leitura; tabela atualizada por `flask build-catchments`). Filtros: uf, ibge.
+    """
+    try:
+        query = (
+            db.session.query(MunicipalityCatchment, TreatmentUnit.name, TreatmentUnit.unit_type)
+            .outerjoin(TreatmentUnit, TreatmentUnit.id == MunicipalityCatchment.nearest_unit_id)
+            .order_by(MunicipalityCatchment.ibge_code)
+        )
+        state_code = request.args.get('uf')
+        if state_code:
+            query = query.filter(MunicipalityCatchment.state_code == state_code.upper())
+        ibge_code = request.args.get('ibge')
+        if ibge_code:
+            query = query.filter(MunicipalityCatchment.ibge_code == ibge_code)
+        
+        catchments = []
+        for catchment, unit_name, unit_type in query:
+            catchment_dict = catchment.to_dict()
+            if catchment_dict['distance_km'] is not None:
+                catchment_dict['distance_km'] = round(catchment_dict['distance_km'], 2)
+            catchment_dict['nearest_unit_name'] = unit_name
+            catchment_dict['nearest_unit_type'] = unit_type
+            catchments.append(catchment_dict)
+        
+        response = json_response({
+            'success': True,
+            'data': catchments,
+            'total': len(catchments)
+        })
+        return with_cache_headers(response, None), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao buscar cobertura dos municípios: {str(e)}'
+        }), 500
+
+@treatment_units_bp.route('/exportar', methods=['GET'])
+def export_treatment_units():
+    """
+    Exportar o catálogo de unidades em streaming (format=ndjson ou geojson)
+
+    Filtros opcionais: unit_type e include_inactive=true.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({
+            'success': False,
+            'message': f"Formato inválido: use {' ou '.join(FORMATS)}",
+            'error_code': 'INVALID_FORMAT'
+        }), 400
+    
+    chunks = export_units(
+        fmt,
+        unit_type=request.args.get('unit_type') or None,
+        include_inactive=request.args.get('include_inactive', '').lower() == 'true',
+        batch_size=current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    )
+    # O contexto da requisição (e a sessão do banco) acompanha o gerador
+    response = Response(stream_with_context(chunks), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=unidades.{fmt}'
+    return response
+
 def calculate_distance(lat1, lng1, lat2, lng2):
     """Calcular distância entre dois pontos usando a fórmula de Haversine"""
-    R = 6371  # Raio da Terra em km
-    lat1_rad, lng1_rad, lat2_rad, lng2_rad = map(math.radians, [lat1, lng1, lat2, lng2])
-    
-    dlat = lat2_rad - lat1_rad
-    dlng = lng2_rad - lng1_rad
-    
-    a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlng/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
+    return haversine_km(lat1, lng1, lat2, lng2)
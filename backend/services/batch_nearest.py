@@ -0,0 +1,105 @@
+"""
+Unidades mais próximas de muitas origens de uma vez
+
+As unidades candidatas são carregadas uma única vez (do snapshot em memória)
+e as distâncias origem×unidade são calculadas em blocos de origens com a
+matriz de Haversine vetorizada. A seleção dos k mais próximos de cada origem
+usa argpartition sobre uma chave inteira (distância arredondada, posição da
+unidade), que reproduz a ordem (distância arredondada, id) de /proximas
+quando as unidades estão ordenadas por id, como no snapshot.
+"""
+import math
+from typing import Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from .distance import haversine_matrix
+from .spatial_query import DISTANCE_DECIMALS
+
+# Células (origens × unidades) por bloco da matriz: limita a memória (~8 bytes cada)
+DEFAULT_BLOCK_CELLS = 2_000_000
+
+_OUTSIDE = np.iinfo(np.int64).max
+
+
+def nearest_for_origins(
+    origin_lats: Sequence[float],
+    origin_lngs: Sequence[float],
+    radii_km: Sequence[float],
+    limits: Sequence[int],
+    unit_lats: np.ndarray,
+    unit_lngs: np.ndarray,
+    block_cells: int = DEFAULT_BLOCK_CELLS
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Para cada origem, em ordem, (posições das unidades, distâncias em km)
+    das até limit unidades a até radius_km, mais próximas primeiro
+    """
+    origin_lats = np.asarray(origin_lats, dtype=np.float64)
+    origin_lngs = np.asarray(origin_lngs, dtype=np.float64)
+    radii_km = np.asarray(radii_km, dtype=np.float64)
+    limits = np.asarray(limits, dtype=np.int64)
+    unit_count = len(unit_lats)
+
+    if unit_count == 0:
+        for _ in range(len(origin_lats)):
+            yield np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return
+
+    scale = 10 ** DISTANCE_DECIMALS
+    positions = np.arange(unit_count, dtype=np.int64)
+    block_size = max(1, block_cells // unit_count)
+
+    for start in range(0, len(origin_lats), block_size):
+        end = min(start + block_size, len(origin_lats))
+        distances = haversine_matrix(origin_lats[start:end], origin_lngs[start:end], unit_lats, unit_lngs)
+
+        # Chave de ordenação: distância arredondada e, no empate, a posição
+        keys = np.rint(distances * scale).astype(np.int64) * unit_count + positions
+        keys[distances > radii_km[start:end, np.newaxis]] = _OUTSIDE
+
+        k = int(min(max(limits[start:end].max(initial=0), 0), unit_count))
+        if k == 0:
+            for _ in range(start, end):
+                yield np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+            continue
+
+        if k < unit_count:
+            top = np.argpartition(keys, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(positions, (end - start, unit_count))
+        top_keys = np.take_along_axis(keys, top, axis=1)
+        order = np.argsort(top_keys, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_keys = np.take_along_axis(top_keys, order, axis=1)
+
+        for row in range(end - start):
+            limit = int(limits[start + row])
+            selected = top[row, :limit][top_keys[row, :limit] != _OUTSIDE]
+            yield selected, distances[row, selected]
+
+
+def parse_origins(origins: List, default_radius: float, default_limit: int, max_limit: int):
+    """
+    Validar as origens ({"latitude", "longitude", "radius"?, "limit"?, "id"?})
+
+    Retorna (ids, latitudes, longitudes, raios, limites); ValueError com a
+    posição da origem inválida.
+    """
+    ids, lats, lngs, radii, limits = [], [], [], [], []
+    for position, origin in enumerate(origins):
+        try:
+            lat = float(origin['latitude'])
+            lng = float(origin['longitude'])
+            radius = float(origin.get('radius', default_radius))
+            limit = int(origin.get('limit', default_limit))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise ValueError(f'Origem {position} inválida: latitude e longitude são obrigatórias')
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not math.isfinite(radius) or radius < 0:
+            raise ValueError(f'Origem {position} inválida: coordenadas ou raio fora do intervalo')
+        ids.append(origin.get('id', position))
+        lats.append(lat)
+        lngs.append(lng)
+        radii.append(radius)
+        limits.append(max(0, min(limit, max_limit)))
+    return ids, lats, lngs, radii, limits
@@ -0,0 +1,158 @@
+"""
+Tabela materializada município -> unidade de anemia falciforme mais próxima
+
+Calculada pelo comando `flask build-catchments` com o índice espacial em
+grade das unidades (services/spatial_index.py). A posição das unidades usadas
+fica guardada em catchment_units; na execução seguinte, só são recalculados:
+
+- municípios novos ou com coordenadas alteradas;
+- municípios cuja unidade mais próxima saiu, ficou inativa ou mudou de lugar
+  (nova busca no índice);
+- municípios mais próximos de uma unidade nova (ou movida) do que da atual,
+  detectados com a matriz de distâncias município × unidades novas.
+
+Com um arquivo de municípios claramente parcial (MUNICIPALITIES_FILE menor
+que a tabela do IBGE versionada) a atualização falha (PartialMunicipalities),
+a menos que seja pedida explicitamente com allow_partial (--allow-partial).
+"""
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from flask import current_app
+
+from ..extensions import db
+from ..models.municipality_catchment import CatchmentUnit, MunicipalityCatchment
+from .distance import EARTH_RADIUS_KM, haversine_matrix
+from .municipalities import COMPLETE_MIN_MUNICIPALITIES, DATA_DIR, Municipality, load_municipalities
+from .spatial_index import GridIndex, build_treatment_unit_index
+from .unit_snapshot import build_unit_snapshot
+
+# Metade da circunferência da Terra: nenhuma unidade fica além disso
+MAX_DISTANCE_KM = np.pi * EARTH_RADIUS_KM
+
+
+class PartialMunicipalities(ValueError):
+    """Arquivo de municípios bem menor que a tabela do IBGE"""
+
+
+def catchment_municipalities() -> List[Municipality]:
+    """Municípios de MUNICIPALITIES_FILE / STATES_FILE"""
+    path = current_app.config.get('MUNICIPALITIES_FILE') or os.path.join(DATA_DIR, 'municipios.csv')
+    states_path = current_app.config.get('STATES_FILE') or os.path.join(DATA_DIR, 'estados.csv')
+    return load_municipalities(path, states_path)
+
+
+def _nearest(index: GridIndex, municipality: Municipality):
+    """(id da unidade, distância) mais próxima no índice; (None, None) se vazio"""
+    found = index.nearest(municipality.latitude, municipality.longitude, 1, MAX_DISTANCE_KM)
+    if not found:
+        return None, None
+    distance, entry = found[0]
+    return entry.key, distance
+
+
+def refresh_catchments(
+    full: bool = False,
+    municipalities: Optional[List[Municipality]] = None,
+    allow_partial: bool = False
+) -> Dict[str, int]:
+    """
+    Atualizar a tabela (incremental por padrão; full=True recalcula tudo)
+
+    Sem uma lista de municípios, lê MUNICIPALITIES_FILE e levanta
+    PartialMunicipalities se ele tiver menos de COMPLETE_MIN_MUNICIPALITIES
+    linhas (salvo allow_partial). Retorna contadores: municipalities,
+    recomputed, reassigned, removed.
+    """
+    if municipalities is None:
+        municipalities = catchment_municipalities()
+        if len(municipalities) < COMPLETE_MIN_MUNICIPALITIES and not allow_partial:
+            raise PartialMunicipalities(
+                f"O arquivo de municípios tem só {len(municipalities)} linhas (a tabela do IBGE tem "
+                f"cerca de 5.570); aponte MUNICIPALITIES_FILE para a tabela completa"
+            )
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    # Unidades atuais (ativas, de anemia falciforme) e o índice espacial delas
+    index = build_treatment_unit_index(build_unit_snapshot())
+    current = {
+        entry.key: (float(entry.latitude), float(entry.longitude))
+        for entries in index.cells.values() for entry in entries
+    }
+
+    previous = {
+        unit.unit_id: (unit.latitude, unit.longitude) for unit in CatchmentUnit.query.all()
+    }
+    existing = {row.ibge_code: row for row in MunicipalityCatchment.query.all()}
+    if not existing:
+        full = True
+
+    # Unidades que saíram ou mudaram de lugar, e as que entraram nas novas posições
+    removed_units = {unit_id for unit_id, position in previous.items() if current.get(unit_id) != position}
+    added_units = [unit_id for unit_id, position in current.items() if previous.get(unit_id) != position]
+
+    stats = {'municipalities': len(municipalities), 'recomputed': 0, 'reassigned': 0, 'removed': 0}
+    candidates = []  # municípios mantidos que ainda podem ganhar uma unidade nova mais próxima
+
+    for municipality in municipalities:
+        row = existing.get(municipality.ibge_code)
+        stale = (
+            full
+            or row is None
+            or (row.latitude, row.longitude) != (municipality.latitude, municipality.longitude)
+            or row.nearest_unit_id in removed_units
+            or (row.nearest_unit_id is None and added_units)
+        )
+        if not stale:
+            if added_units:
+                candidates.append(row)
+            continue
+
+        unit_id, distance = _nearest(index, municipality)
+        if row is None:
+            row = MunicipalityCatchment(ibge_code=municipality.ibge_code)
+            db.session.add(row)
+        row.name = municipality.name
+        row.state_code = municipality.state_code
+        row.latitude = municipality.latitude
+        row.longitude = municipality.longitude
+        row.nearest_unit_id = unit_id
+        row.distance_km = distance
+        row.computed_at = now
+        stats['recomputed'] += 1
+
+    if candidates:
+        # Município × unidades novas em uma única matriz vetorizada
+        added_ids = np.array(added_units, dtype=np.int64)
+        distances = haversine_matrix(
+            [row.latitude for row in candidates], [row.longitude for row in candidates],
+            [current[unit_id][0] for unit_id in added_units], [current[unit_id][1] for unit_id in added_units]
+        )
+        best = np.argmin(distances, axis=1)
+        for row, column, distance in zip(candidates, best.tolist(), distances[np.arange(len(candidates)), best].tolist()):
+            unit_id = int(added_ids[column])
+            # Empate decidido pelo menor id, como no índice
+            if (distance, unit_id) < (row.distance_km, row.nearest_unit_id):
+                row.nearest_unit_id = unit_id
+                row.distance_km = distance
+                row.computed_at = now
+                stats['reassigned'] += 1
+
+    # Municípios que saíram do arquivo
+    codes = {municipality.ibge_code for municipality in municipalities}
+    for ibge_code, row in existing.items():
+        if ibge_code not in codes:
+            db.session.delete(row)
+            stats['removed'] += 1
+
+    # Posições usadas neste cálculo
+    for unit_id in removed_units - set(current):
+        db.session.delete(db.session.get(CatchmentUnit, unit_id))
+    for unit_id in added_units:
+        latitude, longitude = current[unit_id]
+        db.session.merge(CatchmentUnit(unit_id=unit_id, latitude=latitude, longitude=longitude))
+
+    db.session.commit()
+    return stats
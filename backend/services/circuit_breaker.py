@@ -0,0 +1,190 @@
+"""
+Disjuntor (circuit breaker) por API externa, com timeout adaptativo
+
+Cada upstream (nominatim, overpass) guarda as chamadas da janela recente
+(BREAKER_WINDOW segundos): se a taxa de erro passar de BREAKER_ERROR_RATE
+com pelo menos BREAKER_MIN_CALLS chamadas, o disjuntor abre e as chamadas
+falham na hora com CircuitOpen, para que as rotas usem os dados de fallback
+sem esperar o timeout. Depois de BREAKER_OPEN_SECONDS, uma chamada de teste
+(half-open) é liberada: sucesso fecha o disjuntor, falha o abre de novo.
+
+O timeout de leitura de cada chamada é o p99 das latências observadas
+vezes BREAKER_TIMEOUT_FACTOR, limitado ao timeout fixo do chamador (teto)
+e a BREAKER_MIN_TIMEOUT (piso); até haver BREAKER_MIN_SAMPLES latências,
+vale o timeout fixo. Chamadas que estouraram o timeout entram na amostra
+com o tempo esperado, de modo que o timeout volta a crescer se o upstream
+ficar mais lento.
+
+O estado é por processo (cada worker do gunicorn tem o seu).
+"""
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(requests.RequestException):
+    """Chamada recusada: disjuntor do upstream aberto"""
+
+    def __init__(self, upstream: str, retry_in: float = 0.0):
+        super().__init__(f"{upstream}: disjuntor aberto, nova tentativa em {retry_in:.0f}s")
+        self.upstream = upstream
+        self.retry_in = retry_in
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Percentil por posição (nearest-rank) de uma lista já ordenada"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class CircuitBreaker:
+    """Estado do disjuntor e janela de chamadas recentes de um upstream"""
+
+    def __init__(
+        self,
+        name: str,
+        window: float = 60.0,
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 1,
+        min_samples: int = 20,
+        timeout_factor: float = 2.0,
+        min_timeout: float = 1.0,
+        max_samples: int = 1000,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.min_samples = min_samples
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self.max_samples = max_samples
+        self.clock = clock
+
+        self.state = CLOSED
+        self.opened_at = None
+        self.trips = 0
+        self.rejected = 0
+        self._probes = 0
+        # (instante, sucesso, latência ou None)
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self._calls and (now - self._calls[0][0] > self.window or len(self._calls) > self.max_samples):
+            self._calls.popleft()
+
+    def _retry_in(self, now: float) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - now)
+
+    def _trip(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+        print(f"Disjuntor de {self.name} aberto por {self.open_seconds:.0f}s")
+
+    def allow(self) -> None:
+        """Liberar uma chamada ou levantar CircuitOpen"""
+        with self._lock:
+            now = self.clock()
+            if self.state == OPEN:
+                if now - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    raise CircuitOpen(self.name, self._retry_in(now))
+                self.state = HALF_OPEN
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpen(self.name, 0.0)
+                self._probes += 1
+
+    def cancel(self) -> None:
+        """Devolver a vaga de uma chamada liberada que falhou antes de chegar ao upstream"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def record(self, ok: bool, latency: Optional[float] = None) -> None:
+        """Registrar o resultado de uma chamada liberada por allow()"""
+        with self._lock:
+            now = self.clock()
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if ok:
+                    # Recuperado: os erros anteriores saem da janela
+                    self.state = CLOSED
+                    self.opened_at = None
+                    self._calls = deque(call for call in self._calls if call[1])
+                else:
+                    self._trip(now)
+            self._calls.append((now, ok, latency))
+            self._prune(now)
+
+            if self.state == CLOSED:
+                errors = sum(1 for call in self._calls if not call[1])
+                if len(self._calls) >= self.min_calls and errors / len(self._calls) >= self.error_rate:
+                    self._trip(now)
+
+    def _latencies(self) -> List[float]:
+        return sorted(call[2] for call in self._calls if call[2] is not None)
+
+    def _adaptive_timeout(self, latencies: List[float]) -> Optional[float]:
+        if len(latencies) < self.min_samples:
+            return None
+        return max(self.min_timeout, percentile(latencies, 0.99) * self.timeout_factor)
+
+    def read_timeout(self, default: float) -> float:
+        """Timeout de leitura da próxima chamada (no máximo default)"""
+        with self._lock:
+            self._prune(self.clock())
+            adaptive = self._adaptive_timeout(self._latencies())
+        return default if adaptive is None else min(default, adaptive)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado atual, para a rota de introspecção"""
+        with self._lock:
+            now = self.clock()
+            self._prune(now)
+            calls = len(self._calls)
+            errors = sum(1 for call in self._calls if not call[1])
+            latencies = self._latencies()
+            adaptive = self._adaptive_timeout(latencies)
+            state = self.state
+            if state == OPEN and now - self.opened_at >= self.open_seconds:
+                state = HALF_OPEN
+
+            def in_ms(value):
+                return None if value is None else round(value * 1000, 1)
+
+            return {
+                'upstream': self.name,
+                'state': state,
+                'calls': calls,
+                'errors': errors,
+                'error_rate': round(errors / calls, 3) if calls else 0.0,
+                'latency_ms': {
+                    'p50': in_ms(percentile(latencies, 0.5)),
+                    'p90': in_ms(percentile(latencies, 0.9)),
+                    'p99': in_ms(percentile(latencies, 0.99)),
+                },
+                'adaptive_timeout_s': None if adaptive is None else round(adaptive, 3),
+                'retry_in_s': round(self._retry_in(now), 1) if self.state == OPEN else None,
+                'trips': self.trips,
+                'rejected': self.rejected
+            }
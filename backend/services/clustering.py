@@ -0,0 +1,288 @@
+"""
+Agrupamento hierárquico de marcadores por nível de zoom (tiles de mapa)
+
+Mesmo algoritmo do supercluster (Mapbox): as coordenadas são projetadas em
+Web Mercator normalizado ([0, 1] x [0, 1]) e, do zoom máximo até o mínimo,
+cada ponto (ou grupo) do nível anterior absorve os vizinhos a até
+radius / (extent * 2^z), formando um grupo com centro ponderado pela
+quantidade de pontos. Os vizinhos são encontrados por um hash espacial com
+células do tamanho do raio.
+
+O índice reúne as mesmas unidades da busca pública (ativas e com a tag de
+anemia falciforme) e é construído uma vez por versão dos dados, fora do lock
+global e uma única vez mesmo com requisições concorrentes (single-flight);
+cada tile é respondido com um filtro por faixa sobre o nível do zoom pedido e
+guardado em um cache LRU que vive junto com o índice.
+"""
+import math
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from flask import current_app
+
+from ..models.unit_specialization import SICKLE_CELL_TAG
+from .single_flight import SingleFlight
+from .unit_snapshot import UnitSnapshot, get_unit_snapshot
+
+DEFAULT_RADIUS = 60    # pixels
+DEFAULT_EXTENT = 512   # pixels por tile
+DEFAULT_MAX_ZOOM = 16  # acima disso, os pontos são servidos individualmente
+DEFAULT_MIN_POINTS = 2
+MAX_TILE_ZOOM = 24
+
+
+def project_x(lng: np.ndarray) -> np.ndarray:
+    return np.asarray(lng, dtype=np.float64) / 360 + 0.5
+
+
+def project_y(lat: np.ndarray) -> np.ndarray:
+    sin = np.sin(np.radians(np.asarray(lat, dtype=np.float64)))
+    with np.errstate(divide='ignore'):
+        y = 0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / math.pi
+    return np.clip(y, 0, 1)
+
+
+def unproject(x: float, y: float):
+    """(longitude, latitude) de um ponto em Mercator normalizado"""
+    lng = (x - 0.5) * 360
+    lat = 360 * math.atan(math.exp((180 - y * 360) * math.pi / 180)) / math.pi - 90
+    return lng, lat
+
+
+class _Level:
+    """Itens de um nível de zoom, ordenados por x para a busca por faixa"""
+
+    def __init__(self, xs, ys, counts, ids, created):
+        order = np.argsort(xs, kind='stable')
+        self.xs = np.asarray(xs, dtype=np.float64)[order]
+        self.ys = np.asarray(ys, dtype=np.float64)[order]
+        self.counts = np.asarray(counts, dtype=np.int64)[order]
+        # id >= 0: índice do ponto; id < 0: grupo -(id + 1)
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        # Zoom em que cada grupo se formou (-1 para pontos)
+        self.created = np.asarray(created, dtype=np.int64)[order]
+
+    def __len__(self) -> int:
+        return len(self.xs)
+
+    def in_range(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        start = int(np.searchsorted(self.xs, x0, side='left'))
+        end = int(np.searchsorted(self.xs, x1, side='right'))
+        positions = np.arange(start, end)
+        ys = self.ys[start:end]
+        return positions[(ys >= y0) & (ys <= y1)]
+
+
+class ClusterIndex:
+    """
+    Níveis de agrupamento de min_zoom a max_zoom (+1 com os pontos originais)
+
+    records são os dicionários dos pontos (propriedades das features), com
+    as coordenadas em latitudes/longitudes.
+    """
+
+    def __init__(
+        self,
+        records: Sequence[Dict[str, Any]],
+        latitudes: Sequence[float],
+        longitudes: Sequence[float],
+        radius: float = DEFAULT_RADIUS,
+        extent: float = DEFAULT_EXTENT,
+        min_zoom: int = 0,
+        max_zoom: int = DEFAULT_MAX_ZOOM,
+        min_points: int = DEFAULT_MIN_POINTS,
+        tile_cache_size: int = 4096
+    ):
+        self.records = list(records)
+        self.radius = radius
+        self.extent = extent
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.min_points = min_points
+
+        xs = project_x(longitudes)
+        ys = project_y(latitudes)
+        count = len(self.records)
+        self.levels = {
+            max_zoom + 1: _Level(
+                xs, ys, np.ones(count, dtype=np.int64), np.arange(count, dtype=np.int64),
+                np.full(count, -1, dtype=np.int64)
+            )
+        }
+        self.cluster_count = 0
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            self.levels[zoom] = self._cluster(self.levels[zoom + 1], zoom)
+
+        self._tiles = OrderedDict()
+        self._tile_cache_size = tile_cache_size
+        self._lock = threading.Lock()
+
+    def _cluster(self, previous: _Level, zoom: int) -> _Level:
+        """Agrupar os itens do nível zoom + 1 no raio do zoom atual"""
+        r = self.radius / (self.extent * 2 ** zoom)
+        xs = previous.xs.tolist()
+        ys = previous.ys.tolist()
+        counts = previous.counts.tolist()
+
+        cells = defaultdict(list)
+        keys = []
+        for position, (x, y) in enumerate(zip(xs, ys)):
+            key = (math.floor(x / r), math.floor(y / r))
+            keys.append(key)
+            cells[key].append(position)
+
+        r2 = r * r
+        done = [False] * len(xs)
+        out_xs, out_ys, out_counts, out_ids, out_created = [], [], [], [], []
+
+        for position in range(len(xs)):
+            if done[position]:
+                continue
+            done[position] = True
+            x, y = xs[position], ys[position]
+            column, row = keys[position]
+
+            neighbours = []
+            for neighbour_column in (column - 1, column, column + 1):
+                for neighbour_row in (row - 1, row, row + 1):
+                    for other in cells.get((neighbour_column, neighbour_row), ()):
+                        if not done[other] and (xs[other] - x) ** 2 + (ys[other] - y) ** 2 <= r2:
+                            neighbours.append(other)
+
+            total = counts[position] + sum(counts[other] for other in neighbours)
+            if neighbours and total >= self.min_points:
+                # Novo grupo no centro ponderado pela quantidade de pontos
+                weighted_x = x * counts[position]
+                weighted_y = y * counts[position]
+                for other in neighbours:
+                    done[other] = True
+                    weighted_x += xs[other] * counts[other]
+                    weighted_y += ys[other] * counts[other]
+                out_xs.append(weighted_x / total)
+                out_ys.append(weighted_y / total)
+                out_counts.append(total)
+                out_ids.append(-(self.cluster_count + 1))
+                out_created.append(zoom)
+                self.cluster_count += 1
+                continue
+
+            # Sem grupo: o item segue igual para o nível de cima
+            for item in [position] + neighbours:
+                done[item] = True
+                out_xs.append(xs[item])
+                out_ys.append(ys[item])
+                out_counts.append(counts[item])
+                out_ids.append(int(previous.ids[item]))
+                out_created.append(int(previous.created[item]))
+
+        return _Level(out_xs, out_ys, out_counts, out_ids, out_created)
+
+    def _level_for(self, zoom: int) -> _Level:
+        return self.levels[max(self.min_zoom, min(zoom, self.max_zoom + 1))]
+
+    def _feature(self, level: _Level, position: int) -> Dict[str, Any]:
+        lng, lat = unproject(level.xs[position], level.ys[position])
+        item_id = int(level.ids[position])
+        if item_id >= 0:
+            properties = dict(self.records[item_id])
+            properties['cluster'] = False
+            # Pontos mantêm as coordenadas originais, sem o arredondamento da projeção
+            lng, lat = properties.get('longitude', lng), properties.get('latitude', lat)
+        else:
+            count = int(level.counts[position])
+            properties = {
+                'cluster': True,
+                'cluster_id': -item_id - 1,
+                'point_count': count,
+                # Zoom em que o grupo se divide ao aproximar o mapa
+                'expansion_zoom': int(level.created[position]) + 1
+            }
+        return {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+            'properties': properties
+        }
+
+    def tile_features(self, z: int, x: int, y: int) -> List[Dict[str, Any]]:
+        """Features (grupos e pontos) de um tile, com margem de um raio nas bordas"""
+        level = self._level_for(z)
+        if not len(level):
+            return []
+        scale = 2 ** z
+        buffer = self.radius / self.extent
+        positions = level.in_range(
+            (x - buffer) / scale, (y - buffer) / scale,
+            (x + 1 + buffer) / scale, (y + 1 + buffer) / scale
+        )
+        return [self._feature(level, position) for position in positions.tolist()]
+
+    def cached_tile(self, key, build):
+        """Valor do tile em cache (LRU), construído por build() na primeira vez"""
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+        value = build()
+        with self._lock:
+            self._tiles[key] = value
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self._tile_cache_size:
+                self._tiles.popitem(last=False)
+        return value
+
+    def cached_tiles(self) -> int:
+        with self._lock:
+            return len(self._tiles)
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    """Se (z, x, y) é um tile existente no esquema XYZ"""
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+_index_lock = threading.Lock()
+
+
+def build_cluster_index(snapshot: UnitSnapshot, unit_type: Optional[str] = None) -> ClusterIndex:
+    """Índice das unidades de anemia falciforme do snapshot (opcionalmente de um tipo)"""
+    rows = snapshot.rows(tag=SICKLE_CELL_TAG, unit_type=unit_type)
+    config = current_app.config
+    return ClusterIndex(
+        [snapshot.records[row] for row in rows.tolist()],
+        snapshot.latitudes[rows], snapshot.longitudes[rows],
+        radius=config.get('CLUSTER_RADIUS', DEFAULT_RADIUS),
+        max_zoom=config.get('CLUSTER_MAX_ZOOM', DEFAULT_MAX_ZOOM),
+        tile_cache_size=config.get('CLUSTER_TILE_CACHE_SIZE', 4096)
+    )
+
+
+def get_cluster_index(unit_type: Optional[str] = None) -> ClusterIndex:
+    """
+    Índice de agrupamento das unidades do app atual (opcionalmente de um
+    tipo), reconstruído a cada novo snapshot, ou seja, a cada versão dos dados
+
+    O lock só protege a troca do índice: a construção roda fora dele, uma
+    vez por (snapshot, tipo), e requisições de outros tipos não esperam.
+    """
+    snapshot = get_unit_snapshot()
+    state = current_app.extensions.setdefault('cluster_index', {})
+
+    with _index_lock:
+        if state.get('snapshot') is not snapshot:
+            state['snapshot'] = snapshot
+            state['indexes'] = {}
+        index = state['indexes'].get(unit_type)
+        flights = state.setdefault('flights', SingleFlight())
+    if index is not None:
+        return index
+
+    key = (snapshot.version, snapshot.built_at, unit_type)
+    index = flights.do(key, build_cluster_index, snapshot, unit_type)
+
+    with _index_lock:
+        # Snapshot trocado durante a construção: o índice serve só a esta requisição
+        if state.get('snapshot') is snapshot:
+            index = state['indexes'].setdefault(unit_type, index)
+    return index
@@ -0,0 +1,69 @@
+"""
+Compressão negociada (Accept-Encoding) das respostas
+
+Respostas JSON a partir de COMPRESSION_MIN_SIZE bytes são comprimidas com
+brotli (se o pacote estiver instalado) ou gzip, conforme o cliente aceitar.
+Abaixo do limite o ganho não compensa a CPU gasta.
+
+A representação comprimida recebe uma ETag própria (sufixo -br/-gzip dentro
+das aspas), já que uma ETag forte identifica bytes exatos; http_cache aceita
+essas variantes no If-None-Match.
+"""
+import gzip
+
+from flask import Flask, Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # dependência opcional
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/geo+json', 'application/x-ndjson', 'text/plain')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # bom equilíbrio entre taxa e CPU para conteúdo dinâmico
+
+
+def available_encodings():
+    """Codificações suportadas, em ordem de preferência do servidor"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response: Response) -> Response:
+    """Comprimir a resposta se for grande, compressível e aceita pelo cliente"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    min_size = current_app.config.get('COMPRESSION_MIN_SIZE', 1024)
+    if not min_size or response.content_length is None or response.content_length < min_size:
+        return response
+
+    # A representação depende do Accept-Encoding a partir daqui
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
+
+
+def register_compression(app: Flask) -> None:
+    """Comprimir as respostas do app"""
+    app.after_request(compress_response)
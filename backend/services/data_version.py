@@ -0,0 +1,191 @@
+"""
+Versões dos dados de unidades
+
+A versão das unidades de tratamento fica na tabela data_versions e é
+incrementada na mesma transação de cada flush que insere, altera ou remove um
+TreatmentUnit; assim todos os processos (workers do gunicorn) leem a mesma
+versão, usada nas ETags e para invalidar as estruturas mantidas em memória.
+Um contador do processo, incrementado a cada commit, continua existindo para
+bancos sem a tabela (migração ainda não aplicada). A versão dos centros
+médicos coletados do OSM (health_facilities) é lida do banco periodicamente.
+"""
+import threading
+import time
+from typing import Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import event, func, inspect, insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, object_session
+
+from ..extensions import db
+from ..models.data_version import DataVersion
+from ..models.health_facility import HealthFacility
+from ..models.treatment_unit import TreatmentUnit
+
+_lock = threading.Lock()
+_version = 0
+
+# Nome da versão das unidades de tratamento em data_versions
+UNITS_VERSION = 'treatment_units'
+
+# Chaves usadas em Session.info para marcar alterações ainda não confirmadas
+# (no processo) e ainda não contadas no banco
+_PENDING_KEY = 'treatment_units_changed'
+_STORED_PENDING_KEY = 'treatment_units_version_pending'
+
+# Bancos (engines) em que a tabela data_versions já foi encontrada; sem ela, a
+# verificação se repete, para que a migração seja notada sem reiniciar
+_has_version_table = {}
+
+
+def current_version() -> int:
+    """Retornar a versão dos dados de unidades neste processo"""
+    return _version
+
+
+def _version_table_exists(connection) -> bool:
+    engine = connection.engine
+    if engine not in _has_version_table:
+        if not inspect(connection).has_table(DataVersion.__tablename__):
+            return False
+        _has_version_table[engine] = True
+    return True
+
+
+def _increment_stored_version(connection, name: str = UNITS_VERSION) -> None:
+    """Incrementar a versão no banco, dentro da transação da conexão"""
+    if not _version_table_exists(connection):
+        return
+    updated = connection.execute(
+        update(DataVersion).where(DataVersion.name == name).values(version=DataVersion.version + 1)
+    ).rowcount
+    if not updated:
+        connection.execute(insert(DataVersion).values(name=name, version=1))
+
+
+def stored_version(name: str = UNITS_VERSION) -> Optional[int]:
+    """Versão guardada no banco (0 se ainda não houver); None se não puder ser lida"""
+    try:
+        if not _version_table_exists(db.session.connection()):
+            return None
+        version = db.session.query(DataVersion.version).filter(DataVersion.name == name).scalar()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Erro ao consultar a versão dos dados: {str(e)}")
+        return None
+    return version or 0
+
+
+def unit_data_version() -> Tuple:
+    """
+    Versão das unidades para validação de cache HTTP (ETag) e para os
+    snapshots em memória: a versão do banco, a mesma em todos os processos.
+    Sem ela, a versão local mais a janela de UNIT_SNAPSHOT_MAX_AGE, que
+    limita o tempo em que alterações feitas por outros processos passam
+    despercebidas.
+
+    Como em facilities_version, o banco é consultado no máximo a cada
+    DATA_VERSION_CHECK_INTERVAL segundos por app (e logo após um commit de
+    unidades neste processo), para que um 304 não custe consulta; alterações
+    feitas por outros processos aparecem com até esse atraso.
+    """
+    state = current_app.extensions.setdefault('unit_data_version', {})
+    interval = current_app.config.get('DATA_VERSION_CHECK_INTERVAL', 30)
+    checked_at = state.get('checked_at')
+    if checked_at is not None and state['local'] == _version and time.time() - checked_at < interval:
+        version = state['version']
+    else:
+        local = _version
+        version = stored_version()
+        state.update(version=version, local=local, checked_at=time.time())
+    if version is not None:
+        return 'db', version
+    max_age = current_app.config.get('UNIT_SNAPSHOT_MAX_AGE', 300)
+    return 'local', _version, int(time.time() // max_age) if max_age else 0
+
+
+def _bump_local_version() -> int:
+    global _version
+    with _lock:
+        _version += 1
+        return _version
+
+
+def bump_version() -> int:
+    """
+    Incrementar a versão dos dados (ex.: após cargas em massa fora do ORM),
+    no banco e no processo
+    """
+    try:
+        _increment_stored_version(db.session.connection())
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Erro ao incrementar a versão dos dados: {str(e)}")
+    return _bump_local_version()
+
+
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[_PENDING_KEY] = True
+        session.info[_STORED_PENDING_KEY] = True
+
+
+def _after_flush(session, flush_context):
+    if session.info.pop(_STORED_PENDING_KEY, False):
+        _increment_stored_version(session.connection())
+
+
+def _after_commit(session):
+    if session.info.pop(_PENDING_KEY, False):
+        _bump_local_version()
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_STORED_PENDING_KEY, None)
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(TreatmentUnit, _event_name, _mark_changed)
+
+event.listen(Session, 'after_flush', _after_flush)
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_rollback', _after_rollback)
+
+
+# Tabela health_facilities: alimentada por `flask harvest-osm`, em geral em
+# outro processo, então a versão vem do próprio banco
+
+def facilities_version() -> Optional[Tuple[int, Optional[str]]]:
+    """
+    Versão da tabela health_facilities: (quantidade de unidades, última coleta)
+
+    O banco é consultado no máximo a cada DATA_VERSION_CHECK_INTERVAL segundos
+    por app. Retorna None se a tabela não puder ser lida.
+    """
+    state = current_app.extensions.setdefault('facilities_version', {})
+    interval = current_app.config.get('DATA_VERSION_CHECK_INTERVAL', 30)
+    checked_at = state.get('checked_at')
+    if checked_at is not None and time.time() - checked_at < interval:
+        return state['version']
+
+    try:
+        count, last_harvest = db.session.query(
+            func.count(HealthFacility.id), func.max(HealthFacility.harvested_at)
+        ).one()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Erro ao consultar base local de unidades: {str(e)}")
+        return None
+
+    version = (count, last_harvest.isoformat() if last_harvest else None)
+    state.update(version=version, checked_at=time.time())
+    return version
+
+
+def invalidate_facilities_version() -> None:
+    """Descartar a versão guardada (após gravar na tabela neste processo)"""
+    current_app.extensions.get('facilities_version', {}).pop('checked_at', None)
@@ -0,0 +1,168 @@
+"""
+Deduplicação espacial de centros médicos vindos de fontes diferentes
+
+Um mesmo local pode chegar mais de uma vez: o nó e o contorno (way) de um
+hospital no OSM, ou um hemocentro do OSM e a entrada correspondente nos dados
+de fallback. Os registros são distribuídos em um hash espacial (grade com
+células do tamanho da distância de fusão); só pares em células vizinhas são
+comparados, o que mantém o custo quase linear. Registros próximos com nomes
+compatíveis são fundidos, preservando os campos mais completos.
+"""
+import math
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from .distance import EARTH_RADIUS_KM, haversine_km
+from .text import normalize_text
+
+DEFAULT_MERGE_DISTANCE_M = 200
+
+# Valores que não contam como informação
+EMPTY_VALUES = ('', None, 'Endereço não disponível', 'Horários não disponíveis', 'Centro Médico')
+DEFAULT_SPECIALTY = 'medicina_geral'
+
+# Palavras que não identificam um estabelecimento por si só
+_STOPWORDS = frozenset({
+    'a', 'as', 'o', 'os', 'de', 'da', 'das', 'do', 'dos', 'e', 'em', 'na', 'no',
+    'hospital', 'clinica', 'centro', 'medico', 'medica', 'unidade', 'saude',
+    'posto', 'policlinica', 'ambulatorio', 'instituto', 'fundacao', 'ltda', 'sa'
+})
+
+# Campos que identificam o registro base e não são completados pelos demais
+_NOT_MERGED = frozenset({'id', 'specialties', 'latitude', 'longitude', 'merged_ids', 'data_source', 'distance_km'})
+
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def name_tokens(name: str) -> Tuple[str, frozenset]:
+    """Nome normalizado e conjunto de palavras significativas"""
+    normalized = normalize_text(name)
+    words = ''.join(char if char.isalnum() else ' ' for char in normalized).split()
+    return ' '.join(words), frozenset(word for word in words if word not in _STOPWORDS)
+
+
+def names_match(first: Tuple[str, frozenset], second: Tuple[str, frozenset]) -> bool:
+    """
+    Nomes iguais após normalização, ou as palavras significativas de um
+    contidas nas do outro ('HEMOBA' e 'HEMOBA - Fundação de Hematologia...')
+    """
+    if first[0] and first[0] == second[0]:
+        return True
+    smaller, larger = sorted((first[1], second[1]), key=len)
+    return bool(smaller) and smaller <= larger
+
+
+def richness(record: Dict[str, Any]) -> int:
+    """Quantidade de campos preenchidos de um registro"""
+    return sum(
+        1 for key, value in record.items()
+        if key != 'specialties' and not isinstance(value, (list, dict)) and value not in EMPTY_VALUES
+    ) + len([s for s in record.get('specialties') or [] if s != DEFAULT_SPECIALTY])
+
+
+def merge_records(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Fundir registros do mesmo local: o mais completo é a base e os campos
+    vazios são preenchidos pelos demais
+    """
+    ordered = sorted(records, key=lambda record: (-richness(record), str(record['id'])))
+    merged = dict(ordered[0])
+
+    for record in ordered[1:]:
+        for key, value in record.items():
+            if key in _NOT_MERGED:
+                continue
+            if merged.get(key) in EMPTY_VALUES and value not in EMPTY_VALUES:
+                merged[key] = value
+
+    specialties = []
+    for record in ordered:
+        for specialty in record.get('specialties') or []:
+            if specialty not in specialties:
+                specialties.append(specialty)
+    if len(specialties) > 1 and DEFAULT_SPECIALTY in specialties:
+        specialties.remove(DEFAULT_SPECIALTY)
+    if specialties:
+        merged['specialties'] = specialties
+
+    merged['merged_ids'] = sorted(
+        {str(record['id']) for record in ordered[1:]}
+        | {merged_id for record in ordered for merged_id in record.get('merged_ids', ())}
+    )
+    return merged
+
+
+def _find(parents: List[int], position: int) -> int:
+    while parents[position] != position:
+        parents[position] = parents[parents[position]]
+        position = parents[position]
+    return position
+
+
+def dedupe_medical_centers(
+    records: List[Dict[str, Any]],
+    max_distance_m: float = DEFAULT_MERGE_DISTANCE_M
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Remover duplicatas por id e por proximidade + nome
+
+    Retorna (registros únicos, quantidade de registros fundidos). A ordem
+    de entrada é preservada, com cada grupo na posição do primeiro membro.
+    """
+    # Duplicatas exatas por id
+    unique = []
+    seen_ids = set()
+    for record in records:
+        if record['id'] not in seen_ids:
+            seen_ids.add(record['id'])
+            unique.append(record)
+
+    max_distance_km = max_distance_m / 1000
+    cell_deg = max_distance_km / _KM_PER_DEGREE
+    if not unique or cell_deg <= 0:
+        return unique, len(records) - len(unique)
+
+    # Hash espacial: células de cell_deg graus de lado
+    cells = defaultdict(list)
+    keys = []
+    for position, record in enumerate(unique):
+        key = (math.floor(record['latitude'] / cell_deg), math.floor(record['longitude'] / cell_deg))
+        keys.append(key)
+        cells[key].append(position)
+
+    names = [name_tokens(record.get('name', '')) for record in unique]
+    parents = list(range(len(unique)))
+
+    for position, record in enumerate(unique):
+        row, column = keys[position]
+        # Em longitude, a distância de fusão ocupa mais células longe do equador
+        cos_lat = max(math.cos(math.radians(record['latitude'])), 0.01)
+        span = math.ceil(1 / cos_lat)
+        for neighbour_row in (row - 1, row, row + 1):
+            for neighbour_column in range(column - span, column + span + 1):
+                for other in cells.get((neighbour_row, neighbour_column), ()):
+                    if other <= position or _find(parents, other) == _find(parents, position):
+                        continue
+                    if not names_match(names[position], names[other]):
+                        continue
+                    other_record = unique[other]
+                    distance = haversine_km(
+                        record['latitude'], record['longitude'],
+                        other_record['latitude'], other_record['longitude']
+                    )
+                    if distance <= max_distance_km:
+                        parents[_find(parents, other)] = _find(parents, position)
+
+    groups = defaultdict(list)
+    for position in range(len(unique)):
+        groups[_find(parents, position)].append(position)
+
+    results = []
+    for position in sorted(min(members) for members in groups.values()):
+        members = groups[_find(parents, position)]
+        if len(members) == 1:
+            results.append(unique[position])
+        else:
+            results.append(merge_records([unique[member] for member in members]))
+
+    return results, len(records) - len(results)
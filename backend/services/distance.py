@@ -0,0 +1,142 @@
+"""
+Cálculo de distâncias geográficas
+
+Concentra a fórmula de Haversine usada pelas rotas: uma versão escalar e
+kernels vetorizados com NumPy (um ponto contra N pontos e matriz N×M), além
+de um pré-filtro equiretangular barato aplicado antes do cálculo exato.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+# Margem de segurança do pré-filtro equiretangular sobre o raio pedido
+PREFILTER_MARGIN = 0.05
+
+# Acima destes limites a aproximação equiretangular deixa de ser confiável
+PREFILTER_MAX_RADIUS_KM = 500
+PREFILTER_MAX_ABS_LATITUDE = 70
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    Calcular distância entre duas coordenadas usando fórmula de Haversine
+    """
+    lat1_rad, lng1_rad, lat2_rad, lng2_rad = map(math.radians, [lat1, lng1, lat2, lng2])
+
+    dlat = lat2_rad - lat1_rad
+    dlng = lng2_rad - lng1_rad
+
+    a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlng/2)**2
+
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def haversine_one_to_many(lat: float, lng: float, lats, lngs) -> np.ndarray:
+    """
+    Distâncias (km) de um ponto para N pontos
+    """
+    lat_rad = math.radians(lat)
+    lng_rad = math.radians(lng)
+    lats_rad = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs_rad = np.radians(np.asarray(lngs, dtype=np.float64))
+
+    a = (
+        np.sin((lats_rad - lat_rad) / 2) ** 2
+        + math.cos(lat_rad) * np.cos(lats_rad) * np.sin((lngs_rad - lng_rad) / 2) ** 2
+    )
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_matrix(lats1, lngs1, lats2, lngs2) -> np.ndarray:
+    """
+    Matriz N×M de distâncias (km) entre dois conjuntos de pontos
+    """
+    lats1_rad = np.radians(np.asarray(lats1, dtype=np.float64))[:, np.newaxis]
+    lngs1_rad = np.radians(np.asarray(lngs1, dtype=np.float64))[:, np.newaxis]
+    lats2_rad = np.radians(np.asarray(lats2, dtype=np.float64))[np.newaxis, :]
+    lngs2_rad = np.radians(np.asarray(lngs2, dtype=np.float64))[np.newaxis, :]
+
+    a = (
+        np.sin((lats2_rad - lats1_rad) / 2) ** 2
+        + np.cos(lats1_rad) * np.cos(lats2_rad) * np.sin((lngs2_rad - lngs1_rad) / 2) ** 2
+    )
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def equirectangular_one_to_many(lat: float, lng: float, lats, lngs) -> np.ndarray:
+    """
+    Distâncias aproximadas (km) pela projeção equiretangular
+    """
+    lats_rad = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs_rad = np.radians(np.asarray(lngs, dtype=np.float64))
+    lat_rad = math.radians(lat)
+
+    # Diferença de longitude normalizada para [-pi, pi] (antimeridiano)
+    dlng = (lngs_rad - math.radians(lng) + np.pi) % (2 * np.pi) - np.pi
+    x = dlng * np.cos((lats_rad + lat_rad) / 2)
+    y = lats_rad - lat_rad
+
+    return EARTH_RADIUS_KM * np.sqrt(x * x + y * y)
+
+
+def prefilter_mask(lat: float, lng: float, lats, lngs, radius_km: float) -> np.ndarray:
+    """
+    Máscara conservadora dos pontos que podem estar a até radius_km
+
+    Combina a faixa de latitude (limite exato) com a aproximação
+    equiretangular quando ela é confiável para o raio e a latitude.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    mask = np.abs(lats - lat) <= math.degrees(radius_km / EARTH_RADIUS_KM)
+
+    if radius_km <= PREFILTER_MAX_RADIUS_KM and abs(lat) <= PREFILTER_MAX_ABS_LATITUDE:
+        approx = equirectangular_one_to_many(lat, lng, lats, lngs)
+        mask &= approx <= radius_km * (1 + PREFILTER_MARGIN)
+
+    return mask
+
+
+def within_radius(lat: float, lng: float, lats, lngs, radius_km: float):
+    """
+    Índices e distâncias exatas (km) dos pontos a até radius_km
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+
+    candidates = np.flatnonzero(prefilter_mask(lat, lng, lats, lngs, radius_km))
+    distances = haversine_one_to_many(lat, lng, lats[candidates], lngs[candidates])
+    inside = distances <= radius_km
+
+    return candidates[inside], distances[inside]
+
+
+def bounding_boxes(lat: float, lng: float, radius_km: float):
+    """
+    Caixas (min_lat, max_lat, min_lng, max_lng) que contêm o círculo de busca
+
+    Usa o método de coordenadas limite de J. Matuschek; retorna duas caixas
+    quando o círculo cruza o antimeridiano.
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angular)
+    min_lat = lat - dlat
+    max_lat = lat + dlat
+
+    cos_lat = math.cos(math.radians(lat))
+    if min_lat <= -90 or max_lat >= 90 or angular >= math.pi / 2 or math.sin(angular) >= cos_lat:
+        # O círculo alcança um polo: todas as longitudes
+        return [(max(min_lat, -90), min(max_lat, 90), -180.0, 180.0)]
+
+    dlng = math.degrees(math.asin(math.sin(angular) / cos_lat))
+    min_lng = lng - dlng
+    max_lng = lng + dlng
+
+    if min_lng < -180:
+        return [(min_lat, max_lat, min_lng + 360, 180.0), (min_lat, max_lat, -180.0, max_lng)]
+    if max_lng > 180:
+        return [(min_lat, max_lat, min_lng, 180.0), (min_lat, max_lat, -180.0, max_lng - 360)]
+    return [(min_lat, max_lat, min_lng, max_lng)]
@@ -0,0 +1,153 @@
+"""
+Classificação de elementos OSM (relevância, tipo de unidade, especialidades)
+
+Cada lista de palavras-chave é compilada uma única vez, na importação, em uma
+expressão regular em forma de trie (prefixos comuns fatorados, como em
+'hem(?:o(?:ba|ce|...)|atologia)'), o que evita testar palavra por palavra.
+A insensibilidade a acentos também é resolvida na compilação: cada letra
+acentuada das palavras-chave vira uma classe com a forma sem acento
+('clínica' -> 'cl[ií]nica'), de modo que o texto do elemento só precisa de
+lower().
+
+A correspondência continua sendo por substring, como nas regras originais,
+e agora também reconhece nomes grafados sem acento ('Clinica', 'Fundacao').
+"""
+import re
+import unicodedata
+from collections import namedtuple
+from typing import Dict, Iterable, List
+
+from .text import strip_accents
+
+DEFAULT_NAME = 'Centro Médico'
+
+# Palavras-chave que indicam relevância para hematologia
+RELEVANT_NAME_KEYWORDS = [
+    'hospital', 'hemocentro', 'hemoterapia', 'hematologia',
+    'centro médico', 'clínica', 'ambulatório', 'policlínica',
+    'unidade de saúde', 'posto de saúde', 'upa', 'pronto socorro',
+    'santa casa', 'fundação', 'instituto'
+]
+RELEVANT_FACILITY_TAGS = ('hospital', 'clinic')
+HEMATOLOGY_SPECIALITY_KEYWORDS = ['hematology', 'haematology']
+
+# Palavras-chave que indicam unidade pública
+PUBLIC_NAME_KEYWORDS = [
+    'sus', 'público', 'municipal', 'estadual', 'federal',
+    'upa', 'posto', 'centro de saúde', 'unidade básica',
+    'hospital geral', 'hospital municipal', 'hospital estadual',
+    'hospital universitário', 'hemoba', 'hemocentro', 'hemominas',
+    'hemorio', 'hemoce', 'hemope', 'hemoam', 'hemosc',
+    'fundação', 'instituto público', 'santa casa'
+]
+PUBLIC_OPERATOR_TYPE_KEYWORDS = ['government', 'public']
+PUBLIC_OPERATOR_KEYWORDS = ['municipal', 'estadual', 'federal', 'governo']
+
+# Especialidades (tags speciality e healthcare:speciality)
+SPECIALTY_KEYWORDS = [
+    ('hematologia', ['hematology', 'haematology', 'blood', 'hemotherapy']),
+    ('emergencia', ['emergency']),
+]
+DEFAULT_SPECIALTY = 'medicina_geral'
+
+FacilityLabels = namedtuple('FacilityLabels', ['relevant', 'unit_type', 'specialties'])
+
+
+def _trie_pattern(node: Dict) -> str:
+    # Uma palavra que termina aqui já basta para a busca por substring
+    if '' in node:
+        return ''
+    branches = []
+    for char, (forms, child) in sorted(node.items()):
+        # Letra acentuada na palavra-chave: aceita também a forma sem acento
+        char_pattern = re.escape(char) if len(forms) == 1 else f"[{re.escape(''.join(sorted(forms)))}]"
+        branches.append(char_pattern + _trie_pattern(child))
+    return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+
+def compile_keywords(keywords: Iterable[str]) -> re.Pattern:
+    """
+    Expressão única (trie) que encontra qualquer uma das palavras, como
+    substring, em um texto em minúsculas, com ou sem acentos
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in unicodedata.normalize('NFC', keyword.lower()):
+            base = strip_accents(char)
+            forms, node = node.setdefault(base, ({base}, {}))
+            forms.add(char)
+        node[''] = (set(), {})
+    return re.compile(_trie_pattern(trie))
+
+
+_RELEVANT_NAME = compile_keywords(RELEVANT_NAME_KEYWORDS)
+_HEMATOLOGY_SPECIALITY = compile_keywords(HEMATOLOGY_SPECIALITY_KEYWORDS)
+_PUBLIC_NAME = compile_keywords(PUBLIC_NAME_KEYWORDS)
+_PUBLIC_OPERATOR_TYPE = compile_keywords(PUBLIC_OPERATOR_TYPE_KEYWORDS)
+_PUBLIC_OPERATOR = compile_keywords(PUBLIC_OPERATOR_KEYWORDS)
+_SPECIALTIES = [(label, compile_keywords(keywords)) for label, keywords in SPECIALTY_KEYWORDS]
+
+
+def is_relevant(name_lower: str, tags: Dict[str, str]) -> bool:
+    """Relevância para hematologia (nome já em minúsculas)"""
+    if _RELEVANT_NAME.search(name_lower):
+        return True
+    if tags.get('amenity', '').lower() in RELEVANT_FACILITY_TAGS:
+        return True
+    if tags.get('healthcare', '').lower() in RELEVANT_FACILITY_TAGS:
+        return True
+    speciality = tags.get('speciality')
+    return bool(speciality) and _HEMATOLOGY_SPECIALITY.search(speciality.lower()) is not None
+
+
+def unit_type(name_lower: str, tags: Dict[str, str]) -> str:
+    """'publica' ou 'privada' (nome já em minúsculas)"""
+    if _PUBLIC_NAME.search(name_lower):
+        return 'publica'
+    operator_type = tags.get('operator:type')
+    if operator_type and _PUBLIC_OPERATOR_TYPE.search(operator_type.lower()):
+        return 'publica'
+    operator = tags.get('operator')
+    if operator and _PUBLIC_OPERATOR.search(operator.lower()):
+        return 'publica'
+    # Se não conseguir determinar claramente, assumir como privada
+    return 'privada'
+
+
+def specialties(tags: Dict[str, str]) -> List[str]:
+    """Especialidades a partir das tags speciality e healthcare:speciality"""
+    speciality = tags.get('speciality', '')
+    healthcare_speciality = tags.get('healthcare:speciality', '')
+    if not speciality and not healthcare_speciality:
+        return [DEFAULT_SPECIALTY]
+
+    # O separador impede correspondências que atravessem as duas tags
+    text = f"{speciality}\n{healthcare_speciality}".lower()
+    found = [label for label, pattern in _SPECIALTIES if pattern.search(text)]
+    return found or [DEFAULT_SPECIALTY]
+
+
+_NOT_RELEVANT = FacilityLabels(False, None, None)
+
+
+def classify_tags(name: str, tags: Dict[str, str]) -> FacilityLabels:
+    """Rótulos de uma instalação; tipo e especialidades só são calculados se relevante"""
+    name_lower = name.lower()
+    if not is_relevant(name_lower, tags):
+        return _NOT_RELEVANT
+    facility_type = unit_type(name_lower, tags)
+    if 'speciality' in tags or 'healthcare:speciality' in tags:
+        labels = specialties(tags)
+    else:
+        labels = [DEFAULT_SPECIALTY]
+    return FacilityLabels(True, facility_type, labels)
+
+
+def classify(elements: Iterable[Dict]) -> List[FacilityLabels]:
+    """Classificar em lote elementos OSM (formato da Overpass API)"""
+    results = []
+    for element in elements:
+        tags = element.get('tags') or {}
+        results.append(classify_tags(tags.get('name', DEFAULT_NAME), tags))
+    return results
@@ -0,0 +1,144 @@
+"""
+Execução concorrente de chamadas a APIs externas com prazo por requisição
+
+As etapas independentes de uma requisição são enviadas a um executor
+limitado (UPSTREAM_MAX_WORKERS threads por processo) e aguardadas até um
+prazo único (UPSTREAM_DEADLINE). O que não chegar a tempo é reportado como
+ausente; a chamada continua em segundo plano e aquece os caches para as
+próximas requisições.
+
+Com upstreams lentos, as chamadas que passaram do prazo continuam ocupando
+o executor; para que a fila não cresça sem limite (e toda requisição nova
+espere atrás dela), o executor aceita no máximo UPSTREAM_MAX_PENDING
+chamadas pendentes (em execução + na fila). Acima disso a fonte é reportada
+como ocupada na hora, sem esperar o prazo.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Tuple
+
+from flask import current_app
+
+from .circuit_breaker import CircuitOpen
+from .outbound_scheduler import OutboundRejected
+
+# Situação de cada fonte de dados na resposta
+SOURCE_OK = 'ok'
+SOURCE_TIMEOUT = 'timeout'
+SOURCE_ERROR = 'error'
+SOURCE_SKIPPED = 'skipped'
+SOURCE_BUSY = 'busy'
+SOURCE_OPEN = 'circuit_open'
+
+
+class UpstreamBusy(RuntimeError):
+    """Executor das chamadas externas com o limite de chamadas pendentes atingido"""
+
+
+class Deadline:
+    """Prazo absoluto de uma requisição"""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+
+class UpstreamExecutor:
+    """ThreadPoolExecutor com limite de chamadas pendentes e contadores"""
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upstream')
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.pending = 0
+        self.peak_pending = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Agendar fn; com a fila cheia, futuro já falho com UpstreamBusy"""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                future = Future()
+                future.set_exception(UpstreamBusy(f'{self.pending} chamadas externas pendentes'))
+                return future
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+_executor_lock = threading.Lock()
+
+
+def get_upstream_executor() -> UpstreamExecutor:
+    """Executor limitado do app atual para as chamadas externas"""
+    executor = current_app.extensions.get('upstream_executor')
+    if executor is None:
+        with _executor_lock:
+            executor = current_app.extensions.get('upstream_executor')
+            if executor is None:
+                max_workers = current_app.config.get('UPSTREAM_MAX_WORKERS', 8)
+                executor = UpstreamExecutor(
+                    max_workers, current_app.config.get('UPSTREAM_MAX_PENDING', 4 * max_workers)
+                )
+                current_app.extensions['upstream_executor'] = executor
+    return executor
+
+
+def upstream_executor_stats() -> dict:
+    """Ocupação do executor do app atual"""
+    executor = get_upstream_executor()
+    return {
+        'max_workers': executor.max_workers,
+        'max_pending': executor.max_pending,
+        'pending': executor.pending,
+        'peak_pending': executor.peak_pending,
+        'rejected': executor.rejected
+    }
+
+
+def submit(fn: Callable, *args, **kwargs) -> Future:
+    """Executar fn no executor, dentro do contexto do app atual"""
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    return get_upstream_executor().submit(run)
+
+
+def wait_for(future: Future, deadline: Deadline, source: str) -> Tuple[str, Any]:
+    """
+    Aguardar o resultado até o prazo; retorna (situação, resultado), com
+    resultado None em caso de timeout, executor ocupado, disjuntor aberto ou erro
+    """
+    try:
+        return SOURCE_OK, future.result(timeout=deadline.remaining())
+    except FutureTimeout:
+        return SOURCE_TIMEOUT, None
+    except (UpstreamBusy, OutboundRejected) as e:
+        print(f"Fonte {source} não consultada: {str(e)}")
+        return SOURCE_BUSY, None
+    except CircuitOpen as e:
+        print(f"Fonte {source} não consultada: {str(e)}")
+        return SOURCE_OPEN, None
+    except Exception as e:
+        print(f"Erro na fonte {source}: {str(e)}")
+        return SOURCE_ERROR, None
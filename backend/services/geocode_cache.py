@@ -0,0 +1,160 @@
+"""
+Cache de geocodificação de cidades em dois níveis
+
+Nível 1: LRU em memória do processo. Nível 2: arquivo SQLite compartilhado
+entre workers e preservado entre reinícios. As chaves são normalizadas
+(acentos, caixa e espaços) e resultados negativos (cidade não encontrada)
+também são guardados, com TTL próprio.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+from flask import current_app
+
+from .text import normalize_text
+
+# Sentinela para diferenciar "não está no cache" de "cidade não encontrada"
+MISS = object()
+
+
+def geocode_key(city_name: str) -> str:
+    """Chave normalizada de uma busca por cidade"""
+    return normalize_text(city_name)
+
+
+class GeocodeCache:
+    """
+    LRU em memória na frente de um armazenamento SQLite com expiração
+    """
+
+    def __init__(self, path: Optional[str], ttl: int, negative_ttl: int, max_entries: int = 1024):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.path:
+            try:
+                with self._connect() as connection:
+                    connection.execute("""
+                        CREATE TABLE IF NOT EXISTS geocode_cache (
+                            key TEXT PRIMARY KEY,
+                            latitude REAL,
+                            longitude REAL,
+                            expires_at REAL NOT NULL
+                        )
+                    """)
+            except sqlite3.Error as e:
+                # Sem o arquivo, o cache continua só em memória
+                print(f"Erro ao abrir cache de geocodificação: {str(e)}")
+                self.path = None
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """
+        Retornar (lat, lng), None (resultado negativo) ou MISS
+        """
+        now = time.time()
+
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                value, expires_at = cached
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+        if not self.path:
+            return MISS
+
+        try:
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT latitude, longitude, expires_at FROM geocode_cache WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Erro ao ler cache de geocodificação: {str(e)}")
+            return MISS
+
+        if row is None or row[2] <= now:
+            return MISS
+
+        value = (row[0], row[1]) if row[0] is not None else None
+        self._remember(key, value, row[2])
+        return value
+
+    def set(self, key: str, value: Optional[Tuple[float, float]]) -> None:
+        """Guardar um resultado (None = cidade não encontrada)"""
+        expires_at = time.time() + (self.ttl if value is not None else self.negative_ttl)
+        self._remember(key, value, expires_at)
+
+        if not self.path:
+            return
+
+        latitude, longitude = value if value is not None else (None, None)
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO geocode_cache (key, latitude, longitude, expires_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, latitude, longitude, expires_at)
+                )
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar cache de geocodificação: {str(e)}")
+
+    def purge_expired(self) -> int:
+        """Remover entradas expiradas do armazenamento persistente"""
+        if not self.path:
+            return 0
+        try:
+            with self._connect() as connection:
+                return connection.execute(
+                    "DELETE FROM geocode_cache WHERE expires_at <= ?", (time.time(),)
+                ).rowcount
+        except sqlite3.Error as e:
+            print(f"Erro ao limpar cache de geocodificação: {str(e)}")
+            return 0
+
+
+def get_geocode_cache() -> GeocodeCache:
+    """Cache de geocodificação do app atual, criado a partir da configuração"""
+    cache = current_app.extensions.get('geocode_cache')
+    if cache is None:
+        path = current_app.config.get('GEOCODE_CACHE_PATH')
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            except OSError as e:
+                print(f"Erro ao criar diretório do cache de geocodificação: {str(e)}")
+        cache = GeocodeCache(
+            path,
+            ttl=current_app.config.get('GEOCODE_CACHE_TTL', 30 * 24 * 3600),
+            negative_ttl=current_app.config.get('GEOCODE_NEGATIVE_TTL', 24 * 3600),
+            max_entries=current_app.config.get('GEOCODE_CACHE_SIZE', 1024)
+        )
+        current_app.extensions['geocode_cache'] = cache
+    return cache
@@ -0,0 +1,58 @@
+"""
+Validação de cache HTTP (ETag forte + If-None-Match) nas listas de unidades
+
+A ETag é derivada da versão dos dados e dos parâmetros normalizados da busca,
+e não do corpo da resposta. Assim pode ser calculada antes de qualquer
+consulta ao banco ou chamada externa, e um If-None-Match correspondente é
+respondido com 304 sem montar a resposta.
+"""
+import hashlib
+import json
+from typing import Any, Optional
+
+from flask import Response, current_app, request
+
+# Respostas que não devem ser guardadas (ex.: resultado parcial por timeout)
+NO_STORE = 'no-store'
+
+# Sufixos das ETags das representações comprimidas (ver services/compression.py)
+ENCODING_SUFFIXES = ('', '-gzip', '-br')
+
+
+def strong_etag(*parts: Any) -> str:
+    """Valor (sem aspas) da ETag para a versão dos dados e os parâmetros"""
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def cache_control() -> str:
+    """Cabeçalho Cache-Control das listas de unidades (UNITS_CACHE_CONTROL)"""
+    return current_app.config.get('UNITS_CACHE_CONTROL', 'public, max-age=60, s-maxage=300')
+
+
+def not_modified(etag: Optional[str]) -> Optional[Response]:
+    """
+    Resposta 304 se o If-None-Match da requisição corresponder à ETag
+
+    Só vale para GET/HEAD; a comparação do If-None-Match é a fraca (RFC 9110),
+    então W/"x" também corresponde a "x". As variantes comprimidas ("x-gzip")
+    também correspondem, e o 304 devolve a ETag recebida.
+    """
+    if etag is None or request.method not in ('GET', 'HEAD'):
+        return None
+    for suffix in ENCODING_SUFFIXES:
+        if request.if_none_match.contains_weak(etag + suffix):
+            response = Response(status=304)
+            return with_cache_headers(response, etag + suffix)
+    return None
+
+
+def with_cache_headers(response: Response, etag: Optional[str], cacheable: bool = True) -> Response:
+    """Aplicar ETag e Cache-Control; respostas não cacheáveis recebem no-store"""
+    if not cacheable:
+        response.headers['Cache-Control'] = NO_STORE
+        return response
+    if etag is not None:
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control()
+    return response
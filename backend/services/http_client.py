@@ -0,0 +1,225 @@
+"""
+Cliente HTTP compartilhado para as APIs externas (Nominatim, Overpass)
+
+Cada upstream tem sua própria requests.Session, com pool de conexões
+keep-alive, de modo que chamadas seguidas reaproveitam a conexão TCP/TLS.
+Toda chamada informa timeouts de conexão e de leitura; falhas transitórias
+(erro de conexão, timeout, 429 e 5xx) são repetidas um número limitado de
+vezes com backoff exponencial e jitter. Cada upstream também tem um
+disjuntor (services/circuit_breaker.py), que recusa as chamadas enquanto o
+upstream está falhando e ajusta o timeout de leitura à latência observada,
+e as chamadas a upstreams com limite de taxa (Nominatim) passam pelo
+agendador de services/outbound_scheduler.py.
+"""
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
+
+from .circuit_breaker import CircuitBreaker, CircuitOpen
+from .outbound_scheduler import INTERACTIVE, OutboundRejected, OutboundScheduler
+
+DEFAULT_USER_AGENT = 'Sistema-Meia-Lua/1.0 (contato@sistema-meia-lua.com)'
+
+# Política de uso do Nominatim: no máximo 1 requisição por segundo
+DEFAULT_NOMINATIM_INTERVAL = 1.0
+
+# Status HTTP considerados transitórios
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Espera máxima aceita de um Retry-After antes de desistir da repetição
+MAX_RETRY_AFTER = 5.0
+
+Timeout = Tuple[float, float]
+
+
+class UpstreamError(requests.RequestException):
+    """Falha de uma API externa após esgotar as tentativas"""
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 4.0) -> float:
+    """Espera antes da tentativa seguinte (backoff exponencial com jitter completo)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    value = response.headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class HttpClient:
+    """
+    Sessões por upstream com retries limitados
+
+    Uso: client.request('nominatim', 'GET', url, timeout=(3.05, 10), params=...)
+    """
+
+    def __init__(
+        self,
+        user_agent: str = DEFAULT_USER_AGENT,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        pool_size: int = 10,
+        breaker_options: Optional[Dict[str, Any]] = None,
+        scheduler: Optional[OutboundScheduler] = None
+    ):
+        self.user_agent = user_agent
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.pool_size = pool_size
+        self.breaker_options = breaker_options or {}
+        self.scheduler = scheduler
+        self._sessions = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def session(self, upstream: str) -> requests.Session:
+        """Sessão (com pool de conexões) de um upstream"""
+        with self._lock:
+            session = self._sessions.get(upstream)
+            if session is None:
+                session = requests.Session()
+                # Os retries são feitos aqui, com jitter, e não pelo urllib3
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_size, max_retries=0
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['User-Agent'] = self.user_agent
+                self._sessions[upstream] = session
+            return session
+
+    def breaker(self, upstream: str) -> CircuitBreaker:
+        """Disjuntor de um upstream"""
+        with self._lock:
+            breaker = self._breakers.get(upstream)
+            if breaker is None:
+                breaker = CircuitBreaker(upstream, **self.breaker_options)
+                self._breakers[upstream] = breaker
+            return breaker
+
+    def request(
+        self,
+        upstream: str,
+        method: str,
+        url: str,
+        timeout: Timeout,
+        retries: Optional[int] = None,
+        priority: int = INTERACTIVE,
+        deadline=None,
+        **kwargs
+    ) -> requests.Response:
+        """
+        Executar a requisição e retornar a resposta (já validada com
+        raise_for_status); erros não transitórios são propagados na hora e,
+        com o disjuntor aberto, CircuitOpen sem chamar o upstream
+
+        timeout[1] é o teto do timeout de leitura, ajustado pelo disjuntor.
+        priority e deadline (fanout.Deadline ou None) valem para a fila do
+        agendador: OutboundRejected se a vez não chegar antes do prazo.
+        """
+        session = self.session(upstream)
+        breaker = self.breaker(upstream)
+        retries = self.max_retries if retries is None else retries
+        connect_timeout, read_timeout = timeout
+
+        for attempt in range(retries + 1):
+            last_attempt = attempt == retries
+            breaker.allow()
+            if self.scheduler is not None:
+                try:
+                    self.scheduler.acquire(
+                        upstream, priority, deadline.remaining() if deadline is not None else None
+                    )
+                except BaseException:
+                    breaker.cancel()
+                    raise
+            started = time.monotonic()
+            try:
+                response = session.request(
+                    method, url, timeout=(connect_timeout, breaker.read_timeout(read_timeout)), **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # Só o timeout de leitura entra na amostra de latências
+                latency = time.monotonic() - started if isinstance(e, requests.ReadTimeout) else None
+                breaker.record(False, latency)
+                if last_attempt:
+                    raise UpstreamError(f"{upstream}: {str(e)}") from e
+                time.sleep(backoff_delay(attempt, self.backoff_base))
+                continue
+            except BaseException:
+                breaker.cancel()
+                raise
+
+            # 4xx é erro da requisição, não do upstream
+            breaker.record(response.status_code not in RETRY_STATUSES, time.monotonic() - started)
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                delay = _retry_after(response)
+                if delay is None:
+                    delay = backoff_delay(attempt, self.backoff_base)
+                if delay <= MAX_RETRY_AFTER:
+                    response.close()
+                    time.sleep(delay)
+                    continue
+
+            response.raise_for_status()
+            return response
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+def breaker_options(config) -> Dict[str, Any]:
+    """Parâmetros dos disjuntores a partir da configuração do app"""
+    return {
+        'window': config.get('BREAKER_WINDOW', 60.0),
+        'min_calls': config.get('BREAKER_MIN_CALLS', 10),
+        'error_rate': config.get('BREAKER_ERROR_RATE', 0.5),
+        'open_seconds': config.get('BREAKER_OPEN_SECONDS', 30.0),
+        'min_samples': config.get('BREAKER_MIN_SAMPLES', 20),
+        'timeout_factor': config.get('BREAKER_TIMEOUT_FACTOR', 2.0),
+        'min_timeout': config.get('BREAKER_MIN_TIMEOUT', 1.0),
+    }
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Cliente do app atual (criado a partir da configuração)"""
+    global _default_client
+    if has_app_context():
+        client = current_app.extensions.get('http_client')
+        if client is None:
+            client = HttpClient(
+                user_agent=current_app.config.get('HTTP_USER_AGENT', DEFAULT_USER_AGENT),
+                max_retries=current_app.config.get('HTTP_MAX_RETRIES', 2),
+                backoff_base=current_app.config.get('HTTP_BACKOFF_BASE', 0.25),
+                pool_size=current_app.config.get('HTTP_POOL_SIZE', 10),
+                breaker_options=breaker_options(current_app.config),
+                scheduler=OutboundScheduler(
+                    {'nominatim': current_app.config.get('NOMINATIM_MIN_INTERVAL', DEFAULT_NOMINATIM_INTERVAL)},
+                    current_app.config.get('OUTBOUND_SCHEDULER_PATH')
+                )
+            )
+            current_app.extensions['http_client'] = client
+        return client
+
+    # Fora de um app (ex.: atualização do cache em segundo plano): o limite
+    # de taxa do Nominatim vale ao menos dentro do processo
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient(scheduler=OutboundScheduler({'nominatim': DEFAULT_NOMINATIM_INTERVAL}))
+        return _default_client
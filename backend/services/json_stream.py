@@ -0,0 +1,130 @@
+"""
+Leitura incremental de um array dentro de um documento JSON
+
+Usado nas respostas da Overpass API ({"version": ..., "elements": [...]}):
+cada item do array é decodificado assim que chega, a partir dos blocos de
+bytes da resposta, sem montar o documento inteiro na memória. Os demais
+campos do objeto raiz são lidos e descartados.
+"""
+import codecs
+import json
+from typing import Any, Iterable, Iterator
+
+CHUNK_SIZE = 64 * 1024
+
+# Tamanho do texto já consumido a partir do qual o buffer é compactado
+_COMPACT_AT = 256 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',]}'
+
+
+class _Reader:
+    """Buffer de texto alimentado por blocos de bytes UTF-8"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Ler mais um bloco; False no fim dos dados"""
+        if self.eof:
+            return False
+        if self.pos > _COMPACT_AT:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self._chunks:
+            if chunk:
+                self.buffer += self._utf8.decode(chunk)
+                return True
+        self.buffer += self._utf8.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """Próximo caractere que não seja espaço ('' no fim dos dados)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON inválido: esperado {char!r}, encontrado {found!r} na posição {self.pos}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decodificar o próximo valor JSON completo"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Valor ainda incompleto no buffer: ler mais
+                if self.fill():
+                    continue
+                raise
+            # Um número só está completo quando seguido de um delimitador
+            # ('1' ou '0.' no fim do buffer podem continuar no próximo bloco)
+            if isinstance(value, (int, float)) and not self.eof and (
+                end == len(self.buffer) or self.buffer[end] not in _DELIMITERS
+            ):
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(chunks: Iterable[bytes], key: str) -> Iterator[Any]:
+    """
+    Itens do array em objeto_raiz[key], decodificados um a um
+
+    Se a chave não existir, nada é retornado.
+    """
+    reader = _Reader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        name = reader.value()
+        reader.expect(':')
+
+        if name == key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value()
+                    separator = reader.peek()
+                    reader.pos += 1
+                    if separator == ']':
+                        break
+                    if separator != ',':
+                        raise ValueError(f"JSON inválido: esperado ',' ou ']' na posição {reader.pos - 1}")
+        else:
+            reader.value()
+
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == '}':
+            return
+        if separator != ',':
+            raise ValueError(f"JSON inválido: esperado ',' ou '}}' na posição {reader.pos - 1}")
+
+
+def iter_response_array(response, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """Itens de um array de uma resposta HTTP em streaming (fecha a resposta ao final)"""
+    try:
+        yield from iter_json_array(response.iter_content(chunk_size=chunk_size), key)
+    finally:
+        response.close()
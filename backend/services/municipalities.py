@@ -0,0 +1,149 @@
+"""
+Índice local de municípios brasileiros para o autocomplete de cidades
+
+Os municípios (nome, UF e centroide) são lidos de um CSV no formato do
+dataset IBGE/kelvins (backend/data/municipios.csv e estados.csv) e ficam em
+um array ordenado de chaves normalizadas; buscas por prefixo usam bisect.
+
+O CSV versionado traz os 5.570 municípios do IBGE. Com um arquivo parcial
+em MUNICIPALITIES_FILE (MunicipalityIndex.complete é False), as rotas
+complementam as buscas com o Nominatim.
+"""
+import bisect
+import csv
+import os
+import threading
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+from flask import current_app
+
+from .text import normalize_text
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# Abaixo disso o arquivo de municípios não é a tabela completa do IBGE
+COMPLETE_MIN_MUNICIPALITIES = 5500
+
+Municipality = namedtuple(
+    'Municipality', ['ibge_code', 'name', 'state', 'state_code', 'latitude', 'longitude', 'capital']
+)
+
+
+def load_states(path: str) -> Dict[str, Dict[str, str]]:
+    """Estados por codigo_uf: {'29': {'uf': 'BA', 'nome': 'Bahia'}, ...}"""
+    with open(path, encoding='utf-8') as csv_file:
+        return {row['codigo_uf']: row for row in csv.DictReader(csv_file)}
+
+
+def load_municipalities(path: str, states_path: str) -> List[Municipality]:
+    """Ler o CSV de municípios (colunas extras do dataset completo são ignoradas)"""
+    states = load_states(states_path)
+    municipalities = []
+
+    with open(path, encoding='utf-8') as csv_file:
+        for row in csv.DictReader(csv_file):
+            state = states.get(row['codigo_uf'], {})
+            municipalities.append(Municipality(
+                ibge_code=row['codigo_ibge'],
+                name=row['nome'],
+                state=state.get('nome', ''),
+                state_code=state.get('uf', ''),
+                latitude=float(row['latitude']),
+                longitude=float(row['longitude']),
+                capital=row.get('capital') in ('1', 'true', 'True')
+            ))
+
+    return municipalities
+
+
+class MunicipalityIndex:
+    """
+    Índice de prefixos, sem acentos e sem caixa, sobre os nomes dos municípios
+
+    Cada município é indexado pelo nome completo e por cada palavra a partir
+    da segunda ('paulo' encontra 'São Paulo'); correspondências no início do
+    nome vêm antes.
+    """
+
+    def __init__(self, municipalities: List[Municipality]):
+        self.municipalities = municipalities
+        self._names = [normalize_text(municipality.name) for municipality in municipalities]
+        self._states = [
+            (normalize_text(municipality.state), normalize_text(municipality.state_code))
+            for municipality in municipalities
+        ]
+
+        entries = []
+        for position, name in enumerate(self._names):
+            words = name.split(' ')
+            for start in range(len(words)):
+                entries.append((' '.join(words[start:]), start, position))
+        entries.sort()
+        self._keys = [entry[0] for entry in entries]
+        self._entries = entries
+
+    def __len__(self) -> int:
+        return len(self.municipalities)
+
+    @property
+    def complete(self) -> bool:
+        """Se o índice cobre (praticamente) todos os municípios do país"""
+        return len(self.municipalities) >= COMPLETE_MIN_MUNICIPALITIES
+
+    def search(self, query: str, limit: int = 10) -> List[Municipality]:
+        """
+        Municípios cujo nome (ou uma palavra do nome) começa com a busca
+
+        Aceita 'Cidade, UF' ou 'Cidade, Estado' para filtrar pelo estado.
+        """
+        city_part, _, state_part = query.partition(',')
+        prefix = normalize_text(city_part)
+        state_filter = normalize_text(state_part)
+        if not prefix:
+            return []
+
+        # Melhor posição (início do nome ou de uma palavra) de cada município
+        best_start = {}
+        position = bisect.bisect_left(self._keys, prefix)
+        while position < len(self._keys) and self._keys[position].startswith(prefix):
+            _, word_start, row = self._entries[position]
+            position += 1
+            state_name, state_code = self._states[row]
+            if state_filter and not (state_name.startswith(state_filter) or state_code == state_filter):
+                continue
+            best_start[row] = min(word_start, best_start.get(row, word_start))
+
+        matches = [
+            (
+                word_start > 0,
+                self._names[row] != prefix,
+                not self.municipalities[row].capital,
+                self._names[row],
+                row
+            )
+            for row, word_start in best_start.items()
+        ]
+        matches.sort()
+        return [self.municipalities[match[-1]] for match in matches[:limit]]
+
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+def get_municipality_index() -> Optional[MunicipalityIndex]:
+    """
+    Índice carregado de MUNICIPALITIES_FILE (uma vez por processo);
+    None se o arquivo não existir
+    """
+    path = current_app.config.get('MUNICIPALITIES_FILE') or os.path.join(DATA_DIR, 'municipios.csv')
+    states_path = current_app.config.get('STATES_FILE') or os.path.join(DATA_DIR, 'estados.csv')
+
+    with _lock:
+        if (path, states_path) not in _indexes:
+            index = None
+            if os.path.exists(path) and os.path.exists(states_path):
+                index = MunicipalityIndex(load_municipalities(path, states_path))
+            _indexes[(path, states_path)] = index
+        return _indexes[(path, states_path)]
@@ -0,0 +1,132 @@
+"""
+Query da Overpass API e conversão de elementos OSM em centros médicos
+
+Compartilhadas por /api/unidades (routes/free_maps.py) e pela coleta
+offline (services/osm_harvester.py), para que as duas fontes classifiquem e
+formatem os elementos da mesma forma.
+"""
+from typing import Any, Dict, Optional, Sequence, Union
+
+from . import facility_classifier
+
+OVERPASS_URL = 'https://overpass-api.de/api/interpreter'
+
+# Combinações de tipo de elemento e tag consultadas na Overpass API
+OVERPASS_SELECTORS = [
+    ('node', 'amenity', 'hospital'),
+    ('node', 'amenity', 'clinic'),
+    ('node', 'healthcare', 'hospital'),
+    ('node', 'healthcare', 'clinic'),
+    ('way', 'amenity', 'hospital'),
+    ('way', 'amenity', 'clinic'),
+    ('way', 'healthcare', 'hospital'),
+    ('way', 'healthcare', 'clinic'),
+]
+
+
+def build_overpass_query(area: Union[str, Sequence[str]], prelude: str = '', server_timeout: int = 25) -> str:
+    """
+    Montar a query Overpass de hospitais e clínicas para um filtro de área
+    (ex.: 'around:50000,-12.97,-38.50', uma bbox 'sul,oeste,norte,leste' ou
+    'area.estado', com a área definida em prelude); com uma lista de áreas,
+    a query retorna a união delas
+    """
+    areas = [area] if isinstance(area, str) else area
+    selectors = "\n".join(
+        f'          {element_type}["{key}"="{value}"]({area_filter});'
+        for area_filter in areas
+        for element_type, key, value in OVERPASS_SELECTORS
+    )
+    return f"""
+        [out:json][timeout:{server_timeout}];
+        {prelude}
+        (
+{selectors}
+        );
+        out center meta;
+        """
+
+
+def element_to_medical_center(element: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Converter um elemento OSM em centro médico; None se não for relevante
+    """
+    # Obter coordenadas
+    if element['type'] == 'node':
+        element_lat = element['lat']
+        element_lng = element['lon']
+    elif element['type'] == 'way' and 'center' in element:
+        element_lat = element['center']['lat']
+        element_lng = element['center']['lon']
+    else:
+        return None
+
+    tags = element.get('tags', {})
+    name = tags.get('name', facility_classifier.DEFAULT_NAME)
+
+    # Filtrar apenas locais que podem ter serviços de hematologia
+    labels = facility_classifier.classify_tags(name, tags)
+    if not labels.relevant:
+        return None
+
+    return {
+        'id': f"osm_{element['type']}_{element['id']}",
+        'name': name,
+        'type': labels.unit_type,
+        'address': format_address_from_tags(tags),
+        'phone': tags.get('phone', ''),
+        'latitude': element_lat,
+        'longitude': element_lng,
+        'opening_hours': format_opening_hours_from_tags(tags),
+        'website': tags.get('website', ''),
+        'specialties': labels.specialties,
+        'osm_id': element['id'],
+        'osm_type': element['type']
+    }
+
+
+def format_address_from_tags(tags: Dict[str, str]) -> str:
+    """
+    Formatar endereço a partir das tags do OSM
+    """
+    address_parts = []
+
+    # Componentes do endereço em ordem de prioridade
+    components = [
+        ('addr:street', ''),
+        ('addr:housenumber', ', '),
+        ('addr:neighbourhood', ' - '),
+        ('addr:city', ', '),
+        ('addr:state', ' - '),
+        ('addr:postcode', ', ')
+    ]
+
+    for tag, separator in components:
+        if tag in tags and tags[tag]:
+            if address_parts and separator:
+                address_parts.append(separator)
+            address_parts.append(tags[tag])
+
+    if address_parts:
+        return ''.join(address_parts)
+
+    # Fallback para endereço genérico
+    return tags.get('addr:full', 'Endereço não disponível')
+
+
+def format_opening_hours_from_tags(tags: Dict[str, str]) -> str:
+    """
+    Formatar horários de funcionamento a partir das tags
+    """
+    opening_hours = tags.get('opening_hours', '')
+
+    if opening_hours:
+        # Tentar interpretar horários comuns
+        if opening_hours == '24/7':
+            return '24 horas'
+        elif 'Mo-Fr' in opening_hours:
+            return f'Segunda a sexta: {opening_hours.replace("Mo-Fr ", "")}'
+        else:
+            return opening_hours
+
+    return 'Horários não disponíveis'
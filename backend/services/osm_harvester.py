@@ -0,0 +1,274 @@
+"""
+Coleta offline de hospitais e clínicas do OpenStreetMap
+
+Executada pelo comando `flask harvest-osm`, estado por estado pela Overpass
+API ou a partir de um extrato local, fora do caminho das requisições. Os
+elementos são classificados com as mesmas regras de /api/unidades e gravados
+em lote (upsert) na tabela health_facilities.
+
+Extratos aceitos: JSON no formato da Overpass API ({"elements": [...]}) e
+GeoJSON/GeoJSONSeq gerado por `osmium export --add-unique-id=type_id`.
+
+Cada estado gravado fica registrado em osm_harvested_states com a extensão
+das suas unidades; no modo 'auto', /api/unidades só usa a base local quando a
+área da busca está dentro dos estados coletados. Importações de extrato sem
+estado não entram nessa cobertura.
+"""
+import json
+import math
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..extensions import db
+from ..models.harvested_state import HarvestedState
+from ..models.health_facility import HealthFacility
+from .data_version import facilities_version, invalidate_facilities_version
+from .distance import bounding_boxes
+from .http_client import get_http_client
+from .json_stream import iter_response_array
+from .osm_elements import OVERPASS_URL, build_overpass_query, element_to_medical_center
+
+# Prazo pedido ao servidor Overpass para a query de um estado inteiro
+STATE_QUERY_TIMEOUT = 180
+
+BATCH_SIZE = 500
+
+# Prefixos de id do osmium export (n123, w123, r123)
+_OSMIUM_TYPES = {'n': 'node', 'w': 'way', 'r': 'relation'}
+
+KM_PER_DEGREE = 111.32
+
+
+def utc_now() -> datetime:
+    """Agora em UTC, sem fuso, como nas colunas DateTime dos modelos"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def state_overpass_query(state_code: str) -> str:
+    """Query Overpass dos centros médicos de um estado (ex.: 'BA')"""
+    prelude = f'area["ISO3166-2"="BR-{state_code.upper()}"]["admin_level"="4"]->.estado;'
+    return build_overpass_query('area.estado', prelude=prelude, server_timeout=STATE_QUERY_TIMEOUT)
+
+
+def classify_elements(elements: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Converter elementos OSM em centros médicos, descartando os irrelevantes"""
+    medical_centers = []
+    for element in elements:
+        medical_center = element_to_medical_center(element)
+        if medical_center is not None:
+            medical_centers.append(medical_center)
+    return medical_centers
+
+
+def harvest_state(state_code: str) -> List[Dict[str, Any]]:
+    """Buscar e classificar os centros médicos de um estado na Overpass API"""
+    # Upstream próprio: as queries por estado são longas e não devem entrar
+    # nas latências (nem no timeout adaptativo) das buscas interativas
+    response = get_http_client().request(
+        'overpass-harvest', 'POST', OVERPASS_URL,
+        timeout=(3.05, STATE_QUERY_TIMEOUT + 15),
+        data=state_overpass_query(state_code),
+        stream=True
+    )
+    return classify_elements(iter_response_array(response, 'elements'))
+
+
+def feature_to_element(feature: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Converter uma feature GeoJSON do osmium em elemento no formato Overpass"""
+    feature_id = str(feature.get('id', ''))
+    osm_type = _OSMIUM_TYPES.get(feature_id[:1])
+    geometry = feature.get('geometry') or {}
+    if osm_type is None or not feature_id[1:].isdigit() or not geometry:
+        return None
+
+    tags = {key: value for key, value in (feature.get('properties') or {}).items() if isinstance(value, str)}
+    element = {'type': osm_type, 'id': int(feature_id[1:]), 'tags': tags}
+
+    if geometry['type'] == 'Point':
+        element['lon'], element['lat'] = geometry['coordinates'][:2]
+        return element
+
+    # Áreas: centro do anel externo, como o "out center" da Overpass
+    coordinates = geometry['coordinates']
+    while coordinates and isinstance(coordinates[0][0], list):
+        coordinates = coordinates[0]
+    if not coordinates:
+        return None
+    element['center'] = {
+        'lat': sum(point[1] for point in coordinates) / len(coordinates),
+        'lon': sum(point[0] for point in coordinates) / len(coordinates)
+    }
+    return element
+
+
+def read_extract(path: str) -> Iterator[Dict[str, Any]]:
+    """Elementos OSM de um extrato local (Overpass JSON, GeoJSON ou GeoJSONSeq)"""
+    with open(path, encoding='utf-8') as extract:
+        if path.endswith(('.geojsonseq', '.geojsonl', '.jsonl', '.ndjson')):
+            for line in extract:
+                line = line.strip().lstrip('\x1e')
+                if line:
+                    element = feature_to_element(json.loads(line))
+                    if element is not None:
+                        yield element
+            return
+
+        data = json.load(extract)
+
+    if 'elements' in data:
+        yield from data['elements']
+        return
+
+    for feature in data.get('features', []):
+        element = feature_to_element(feature)
+        if element is not None:
+            yield element
+
+
+def _insert(dialect_name: str):
+    if dialect_name == 'postgresql':
+        return postgresql.insert(HealthFacility)
+    if dialect_name == 'sqlite':
+        return sqlite.insert(HealthFacility)
+    return None
+
+
+def upsert_facilities(
+    medical_centers: Iterable[Dict[str, Any]],
+    state_code: Optional[str] = None,
+    harvested_at: Optional[datetime] = None
+) -> int:
+    """Gravar (inserir ou atualizar) centros médicos em lote; retorna o total gravado"""
+    harvested_at = harvested_at or utc_now()
+
+    # Um mesmo elemento pode aparecer mais de uma vez; o último vence
+    rows = {}
+    for center in medical_centers:
+        rows[center['id']] = {
+            'id': center['id'],
+            'osm_type': center['osm_type'],
+            'osm_id': center['osm_id'],
+            'name': center['name'][:255],
+            'facility_type': center['type'],
+            'address': center['address'][:255],
+            'phone': center['phone'][:64],
+            'latitude': center['latitude'],
+            'longitude': center['longitude'],
+            'opening_hours': center['opening_hours'][:255],
+            'website': center['website'][:255],
+            'specialties': center['specialties'],
+            'state_code': state_code,
+            'harvested_at': harvested_at
+        }
+    rows = list(rows.values())
+
+    insert = _insert(db.engine.dialect.name)
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        if insert is None:
+            for row in batch:
+                db.session.merge(HealthFacility(**row))
+            continue
+        # Importações sem estado preservam o estado já conhecido da unidade
+        updated = [column for column in batch[0] if column != 'id' and (state_code or column != 'state_code')]
+        statement = insert.on_conflict_do_update(
+            index_elements=['id'],
+            set_={column: getattr(insert.excluded, column) for column in updated}
+        )
+        db.session.execute(statement, batch)
+
+    if state_code:
+        record_harvested_state(state_code, harvested_at)
+    db.session.commit()
+    invalidate_facilities_version()
+    return len(rows)
+
+
+def prune_facilities(state_code: str, harvested_before: datetime) -> int:
+    """Remover do estado as unidades que não apareceram na última coleta"""
+    removed = HealthFacility.query.filter(
+        HealthFacility.state_code == state_code,
+        HealthFacility.harvested_at < harvested_before
+    ).delete(synchronize_session=False)
+    record_harvested_state(state_code, harvested_before)
+    db.session.commit()
+    invalidate_facilities_version()
+    return removed
+
+
+def record_harvested_state(state_code: str, harvested_at: datetime) -> HarvestedState:
+    """
+    Registrar o estado como coletado, com a extensão atual das suas unidades
+    (na sessão atual; o commit fica com quem chama)
+    """
+    count, south, north, west, east = db.session.query(
+        func.count(HealthFacility.id),
+        func.min(HealthFacility.latitude), func.max(HealthFacility.latitude),
+        func.min(HealthFacility.longitude), func.max(HealthFacility.longitude)
+    ).filter(HealthFacility.state_code == state_code).one()
+
+    state = db.session.get(HarvestedState, state_code) or HarvestedState(state_code=state_code)
+    state.harvested_at = max(harvested_at, state.harvested_at or harvested_at)
+    state.facilities = count
+    state.south, state.west, state.north, state.east = south, west, north, east
+    db.session.add(state)
+    return state
+
+
+def harvested_extents() -> List[Tuple[float, float, float, float]]:
+    """
+    Extensões (sul, oeste, norte, leste) dos estados coletados, já com a
+    margem HARVEST_COVERAGE_MARGIN_KM; relidas do banco quando a versão da
+    tabela health_facilities muda
+    """
+    version = facilities_version()
+    cached = current_app.extensions.get('harvested_extents')
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    try:
+        states = HarvestedState.query.filter(HarvestedState.south.isnot(None)).all()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Erro ao consultar estados coletados: {str(e)}")
+        return []
+
+    margin_km = current_app.config.get('HARVEST_COVERAGE_MARGIN_KM', 25)
+    extents = []
+    for state in states:
+        margin_lat = margin_km / KM_PER_DEGREE
+        widest = max(abs(state.south), abs(state.north)) + margin_lat
+        margin_lng = margin_km / (KM_PER_DEGREE * max(math.cos(math.radians(min(widest, 89.0))), 0.01))
+        extents.append((
+            state.south - margin_lat, state.west - margin_lng,
+            state.north + margin_lat, state.east + margin_lng
+        ))
+
+    current_app.extensions['harvested_extents'] = (version, extents)
+    return extents
+
+
+def covers_area(lat: float, lng: float, radius_km: float) -> bool:
+    """
+    Se a área da busca está dentro dos estados coletados: os cantos, os
+    pontos médios das bordas e o centro das bboxes do círculo caem na
+    extensão de algum estado
+    """
+    extents = harvested_extents()
+    if not extents:
+        return False
+
+    for min_lat, max_lat, min_lng, max_lng in bounding_boxes(lat, lng, radius_km):
+        for point_lat in (min_lat, (min_lat + max_lat) / 2, max_lat):
+            for point_lng in (min_lng, (min_lng + max_lng) / 2, max_lng):
+                if not any(
+                    south <= point_lat <= north and west <= point_lng <= east
+                    for south, west, north, east in extents
+                ):
+                    return False
+    return True
@@ -0,0 +1,224 @@
+"""
+Agendador das chamadas externas com limite de taxa e prioridades
+
+A política de uso do Nominatim permite no máximo 1 requisição por segundo
+por aplicação, somando todos os workers. Cada chamada a um upstream com
+intervalo mínimo (NOMINATIM_MIN_INTERVAL) reserva um horário de saída em
+um balde de fichas compartilhado: um arquivo SQLite (OUTBOUND_SCHEDULER_PATH)
+guarda, por upstream, o próximo horário livre, e a reserva é feita em uma
+transação exclusiva (BEGIN IMMEDIATE), de modo que processos diferentes
+nunca recebem horários a menos de um intervalo um do outro.
+
+Dentro do processo, as chamadas esperam em uma fila de prioridade e só a
+primeira da fila reserva horário: buscas interativas (geocodificação) saem
+antes do autocomplete, e o autocomplete antes de tarefas em lote. Quem não
+conseguiria sair da fila antes do próprio prazo é recusado na hora com
+OutboundRejected, em vez de esperar para depois falhar.
+"""
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+import requests
+
+# Classes de prioridade (menor sai primeiro)
+INTERACTIVE = 0
+AUTOCOMPLETE = 1
+BATCH = 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', AUTOCOMPLETE: 'autocomplete', BATCH: 'batch'}
+
+
+class OutboundRejected(requests.RequestException):
+    """Chamada recusada: não sairia da fila antes do prazo"""
+
+
+class OutboundScheduler:
+    """
+    Fila de prioridade por upstream + balde de fichas compartilhado
+
+    intervals: intervalo mínimo (segundos) entre chamadas de cada upstream;
+    upstreams fora do dicionário (ou com intervalo 0) não esperam. Sem path,
+    o balde vale só para o processo atual.
+    """
+
+    def __init__(
+        self,
+        intervals: Dict[str, float],
+        path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        self.intervals = {upstream: interval for upstream, interval in intervals.items() if interval > 0}
+        self.path = path
+        self.clock = clock
+        self.sleep = sleep
+
+        self._queues = {}      # upstream -> heap de (prioridade, ordem de chegada)
+        self._reserving = set()  # upstreams com uma chamada reservando/aguardando horário
+        self._local_next = {}  # próximo horário livre, sem arquivo (ou com falha nele)
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._local_lock = threading.Lock()
+        # (upstream, prioridade) -> quantidade
+        self.granted = Counter()
+        self.rejected = Counter()
+
+        if path:
+            try:
+                connection = sqlite3.connect(path, timeout=5)
+                try:
+                    with connection:
+                        connection.execute(
+                            "CREATE TABLE IF NOT EXISTS outbound_slots (upstream TEXT PRIMARY KEY, next_at REAL NOT NULL)"
+                        )
+                finally:
+                    connection.close()
+            except sqlite3.Error as e:
+                print(f"Erro ao abrir o agendador de chamadas externas: {str(e)}")
+                self.path = None
+
+    def _next_free(self, upstream: str) -> float:
+        """Próximo horário livre do upstream (sem reservar)"""
+        if self.path:
+            try:
+                connection = sqlite3.connect(self.path, timeout=5)
+                try:
+                    row = connection.execute(
+                        "SELECT next_at FROM outbound_slots WHERE upstream = ?", (upstream,)
+                    ).fetchone()
+                finally:
+                    connection.close()
+                return row[0] if row else 0.0
+            except sqlite3.Error as e:
+                print(f"Erro ao consultar o agendador de chamadas externas: {str(e)}")
+        with self._local_lock:
+            return self._local_next.get(upstream, 0.0)
+
+    def _reserve_local(self, upstream: str, interval: float, max_wait: Optional[float]) -> Optional[float]:
+        with self._local_lock:
+            now = self.clock()
+            slot = max(now, self._local_next.get(upstream, 0.0))
+            if max_wait is not None and slot - now > max_wait:
+                return None
+            self._local_next[upstream] = slot + interval
+            return slot
+
+    def _reserve(self, upstream: str, interval: float, max_wait: Optional[float]) -> Optional[float]:
+        """
+        Reservar o próximo horário de saída (relógio de parede); None se ele
+        cair depois de max_wait segundos
+        """
+        if not self.path:
+            return self._reserve_local(upstream, interval, max_wait)
+        try:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute(
+                    "SELECT next_at FROM outbound_slots WHERE upstream = ?", (upstream,)
+                ).fetchone()
+                now = self.clock()
+                slot = max(now, row[0] if row else 0.0)
+                if max_wait is not None and slot - now > max_wait:
+                    connection.execute("ROLLBACK")
+                    return None
+                connection.execute(
+                    "INSERT OR REPLACE INTO outbound_slots (upstream, next_at) VALUES (?, ?)",
+                    (upstream, slot + interval)
+                )
+                connection.execute("COMMIT")
+                return slot
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            # Sem o arquivo, o limite continua valendo ao menos neste processo
+            print(f"Erro no agendador de chamadas externas: {str(e)}")
+            return self._reserve_local(upstream, interval, max_wait)
+
+    def _count(self, counter: Counter, upstream: str, priority: int) -> None:
+        with self._local_lock:
+            counter[upstream, PRIORITY_NAMES.get(priority, 'batch')] += 1
+
+    def _reject(self, upstream: str, priority: int, message: str):
+        self._count(self.rejected, upstream, priority)
+        raise OutboundRejected(f"{upstream}: {message}")
+
+    def acquire(self, upstream: str, priority: int = INTERACTIVE, max_wait: Optional[float] = None) -> float:
+        """
+        Esperar a vez da chamada e o horário reservado; retorna a espera em
+        segundos. max_wait (segundos, None = sem prazo) é o quanto a chamada
+        pode esperar: se a estimativa ou o horário reservado passarem dele,
+        levanta OutboundRejected.
+        """
+        interval = self.intervals.get(upstream)
+        if not interval:
+            return 0.0
+
+        started = time.monotonic()
+        give_up_at = None if max_wait is None else started + max_wait
+        key = (priority, next(self._order))
+        # Lido antes de entrar na fila: a consulta ao arquivo (timeout de 5 s)
+        # não pode segurar a condição que as outras chamadas esperam
+        next_free = self._next_free(upstream)
+
+        with self._condition:
+            queue = self._queues.setdefault(upstream, [])
+            # Estimativa: próximo horário livre (já conta quem está reservando)
+            # + um intervalo por chamada à frente na fila
+            ahead = sum(1 for other in queue if other < key)
+            estimate = max(0.0, next_free - self.clock()) + ahead * interval
+            if max_wait is not None and estimate > max_wait:
+                self._reject(upstream, priority, f"espera estimada de {estimate:.1f}s passa do prazo")
+
+            heapq.heappush(queue, key)
+            try:
+                while upstream in self._reserving or queue[0] != key:
+                    timeout = None if give_up_at is None else give_up_at - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        self._reject(upstream, priority, "prazo esgotado na fila")
+                    self._condition.wait(timeout)
+                heapq.heappop(queue)
+                self._reserving.add(upstream)
+            except BaseException:
+                if key in queue:
+                    queue.remove(key)
+                    heapq.heapify(queue)
+                    self._condition.notify_all()
+                raise
+
+        # Só a primeira da fila reserva: uma chamada mais prioritária que
+        # chegar agora passa na frente das que ainda esperam
+        try:
+            remaining = None if give_up_at is None else max(0.0, give_up_at - time.monotonic())
+            slot = self._reserve(upstream, interval, remaining)
+            if slot is None:
+                self._reject(upstream, priority, "próximo horário livre passa do prazo")
+            delay = slot - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+        finally:
+            with self._condition:
+                self._reserving.discard(upstream)
+                self._condition.notify_all()
+
+        self._count(self.granted, upstream, priority)
+        return time.monotonic() - started
+
+    def stats(self) -> Dict[str, Dict]:
+        """Fila, chamadas liberadas e recusadas por prioridade, para /api/upstreams"""
+        with self._condition:
+            queued = {upstream: len(queue) for upstream, queue in self._queues.items()}
+        with self._local_lock:
+            return {
+                upstream: {
+                    'min_interval_s': interval,
+                    'queued': queued.get(upstream, 0),
+                    'granted': {name: self.granted[upstream, name] for name in PRIORITY_NAMES.values()},
+                    'rejected': {name: self.rejected[upstream, name] for name in PRIORITY_NAMES.values()}
+                }
+                for upstream, interval in self.intervals.items()
+            }
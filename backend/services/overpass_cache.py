@@ -0,0 +1,273 @@
+"""
+Cache de respostas da Overpass API por tile, com stale-while-revalidate
+
+As buscas são quantizadas em tiles de mapa (esquema slippy map/XYZ). O zoom
+dos tiles depende da faixa de raio pedida, de modo que uma busca cubra poucos
+tiles. Os tiles que faltam são agrupados em retângulos contíguos e buscados
+em uma única query (união das bboxes dos retângulos, sem baixar de novo os
+tiles já em cache entre eles), e os resultados são distribuídos pelos tiles.
+O raio pedido é respondido combinando os tiles em cache e filtrando pela
+distância exata.
+
+Cada tile fica fresco por OVERPASS_CACHE_TTL. Depois disso, e até
+OVERPASS_CACHE_STALE_TTL, ainda é servido enquanto uma atualização roda em
+segundo plano.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+
+from .distance import bounding_boxes, within_radius
+from .single_flight import SingleFlight
+
+Tile = Tuple[int, int, int]
+
+# Faixas de raio (metros) -> zoom dos tiles (~39 km de lado no z10, no equador)
+RADIUS_ZOOM_BUCKETS = [
+    (10000, 12),
+    (50000, 10),
+    (200000, 8),
+]
+MIN_ZOOM = 6
+
+MAX_LATITUDE = 85.0511
+
+# Atualizações em segundo plano compartilhadas pelo processo
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='overpass-refresh')
+
+
+def zoom_for_radius(radius_m: float) -> int:
+    """Zoom dos tiles usado para uma faixa de raio"""
+    for max_radius, zoom in RADIUS_ZOOM_BUCKETS:
+        if radius_m <= max_radius:
+            return zoom
+    return MIN_ZOOM
+
+
+def tile_for(lat: float, lng: float, zoom: int) -> Tile:
+    """Tile (zoom, x, y) que contém a coordenada"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    n = 2 ** zoom
+    x = int((lng + 180) / 360 * n)
+    lat_rad = math.radians(lat)
+    y = int((1 - math.asinh(math.tan(lat_rad)) / math.pi) / 2 * n)
+    return zoom, min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(tile: Tile) -> Tuple[float, float, float, float]:
+    """Limites (sul, oeste, norte, leste) de um tile"""
+    zoom, x, y = tile
+    n = 2 ** zoom
+    west = x / n * 360 - 180
+    east = (x + 1) / n * 360 - 180
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+
+def tiles_for_radius(lat: float, lng: float, radius_m: float) -> List[Tile]:
+    """Tiles que cobrem o círculo de busca"""
+    zoom = zoom_for_radius(radius_m)
+    tiles = []
+    for min_lat, max_lat, min_lng, max_lng in bounding_boxes(lat, lng, radius_m / 1000):
+        _, x_min, y_min = tile_for(max_lat, min_lng, zoom)
+        _, x_max, y_max = tile_for(min_lat, max_lng, zoom)
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                if (zoom, x, y) not in tiles:
+                    tiles.append((zoom, x, y))
+    return tiles
+
+
+def _covering_bounds(tiles: Iterable[Tile]) -> Tuple[float, float, float, float]:
+    bounds = [tile_bounds(tile) for tile in tiles]
+    return (
+        min(bound[0] for bound in bounds),
+        min(bound[1] for bound in bounds),
+        max(bound[2] for bound in bounds),
+        max(bound[3] for bound in bounds)
+    )
+
+
+def tile_rectangles(tiles: Iterable[Tile]) -> List[List[Tile]]:
+    """
+    Particionar tiles de um mesmo zoom em retângulos contíguos: cada tile, na
+    ordem (y, x), começa um retângulo que cresce para leste enquanto houver
+    tiles na linha e depois para o sul enquanto a linha inteira existir
+    """
+    remaining = set(tiles)
+    rectangles = []
+    for tile in sorted(remaining, key=lambda tile: (tile[2], tile[1])):
+        if tile not in remaining:
+            continue
+        zoom, x0, y0 = tile
+        x1 = x0
+        while (zoom, x1 + 1, y0) in remaining:
+            x1 += 1
+        y1 = y0
+        while all((zoom, x, y1 + 1) in remaining for x in range(x0, x1 + 1)):
+            y1 += 1
+        rectangle = [(zoom, x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+        remaining.difference_update(rectangle)
+        rectangles.append(rectangle)
+    return rectangles
+
+
+class OverpassTileCache:
+    """
+    Cache LRU de centros médicos por tile
+
+    fetch_bboxes([(sul, oeste, norte, leste), ...]) deve retornar, em uma
+    chamada, a lista de centros médicos da união das áreas e propagar erros
+    (falhas nunca são guardadas).
+    """
+
+    def __init__(
+        self,
+        fetch_bboxes: Callable[[List[Tuple[float, float, float, float]]], List[Dict[str, Any]]],
+        ttl: float,
+        stale_ttl: float,
+        max_tiles: int = 5000
+    ):
+        self.fetch_bboxes = fetch_bboxes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def _lookup(self, tile: Tile, now: float) -> Tuple[Optional[List[Dict]], str]:
+        entry = self._tiles.get(tile)
+        if entry is None:
+            return None, 'missing'
+        centers, fetched_at = entry
+        age = now - fetched_at
+        if age <= self.ttl:
+            self._tiles.move_to_end(tile)
+            return centers, 'fresh'
+        if age <= self.stale_ttl:
+            self._tiles.move_to_end(tile)
+            return centers, 'stale'
+        return None, 'missing'
+
+    def _fetch_tiles(self, tiles: List[Tile]) -> Dict[Tile, List[Dict]]:
+        """Buscar os tiles em uma query (bbox por retângulo) e distribuir os resultados"""
+        zoom = tiles[0][0]
+        wanted = set(tiles)
+        by_tile = {tile: [] for tile in tiles}
+        bboxes = [_covering_bounds(rectangle) for rectangle in tile_rectangles(tiles)]
+
+        for center in self.fetch_bboxes(bboxes):
+            tile = tile_for(center['latitude'], center['longitude'], zoom)
+            # Elementos cujo centro cai fora dos tiles pedidos ficam de fora
+            if tile in wanted:
+                by_tile[tile].append(center)
+
+        now = time.time()
+        with self._lock:
+            for tile, centers in by_tile.items():
+                self._tiles[tile] = (centers, now)
+                self._tiles.move_to_end(tile)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+
+        return by_tile
+
+    def _refresh(self, tiles: List[Tile]) -> None:
+        try:
+            self._flights.do(tuple(tiles), self._fetch_tiles, tiles)
+        except Exception as e:
+            print(f"Erro ao atualizar cache da Overpass API: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(tiles)
+
+    def search(self, lat: float, lng: float, radius_m: float) -> List[Dict[str, Any]]:
+        """
+        Centros médicos a até radius_m da coordenada, a partir dos tiles em
+        cache (buscando os que faltam). Retorna cópias dos registros.
+        """
+        tiles = tiles_for_radius(lat, lng, radius_m)
+        now = time.time()
+
+        cached = {}
+        missing = []
+        stale = []
+        with self._lock:
+            for tile in tiles:
+                centers, state = self._lookup(tile, now)
+                if state == 'missing':
+                    missing.append(tile)
+                else:
+                    cached[tile] = centers
+                    if state == 'stale' and tile not in self._refreshing:
+                        stale.append(tile)
+            self._refreshing.update(stale)
+
+        if stale:
+            _executor.submit(self._refresh, stale)
+
+        if missing:
+            cached.update(self._flights.do(tuple(missing), self._fetch_tiles, missing))
+
+        candidates = [center for tile in tiles for center in cached[tile]]
+        if not candidates:
+            return []
+
+        positions, _ = within_radius(
+            lat, lng,
+            np.fromiter((center['latitude'] for center in candidates), dtype=np.float64, count=len(candidates)),
+            np.fromiter((center['longitude'] for center in candidates), dtype=np.float64, count=len(candidates)),
+            radius_m / 1000
+        )
+        return [dict(candidates[position]) for position in positions.tolist()]
+
+    def version(self, lat: float, lng: float, radius_m: float) -> Optional[Tuple[float, ...]]:
+        """
+        Momentos de coleta dos tiles que cobrem a busca, sem buscar nada;
+        None se algum deles faltar ou estiver vencido (a busca precisa rodar
+        para disparar a atualização)
+        """
+        tiles = tiles_for_radius(lat, lng, radius_m)
+        now = time.time()
+        stamps = []
+        with self._lock:
+            for tile in tiles:
+                entry = self._tiles.get(tile)
+                if entry is None or now - entry[1] > self.ttl:
+                    return None
+                stamps.append(entry[1])
+        return tuple(stamps)
+
+    def stats(self) -> Dict[str, int]:
+        flights = self._flights.stats()
+        with self._lock:
+            return {
+                'tiles': len(self._tiles),
+                'refreshing': len(self._refreshing),
+                'fetches': flights['executions'],
+                'coalesced': flights['coalesced']
+            }
+
+
+def get_overpass_cache(fetch_bboxes) -> OverpassTileCache:
+    """Cache de tiles da Overpass do app atual, criado a partir da configuração"""
+    cache = current_app.extensions.get('overpass_cache')
+    if cache is None:
+        ttl = current_app.config.get('OVERPASS_CACHE_TTL', 6 * 3600)
+        cache = OverpassTileCache(
+            fetch_bboxes,
+            ttl=ttl,
+            stale_ttl=max(ttl, current_app.config.get('OVERPASS_CACHE_STALE_TTL', 7 * 24 * 3600)),
+            max_tiles=current_app.config.get('OVERPASS_CACHE_MAX_TILES', 5000)
+        )
+        current_app.extensions['overpass_cache'] = cache
+    return cache
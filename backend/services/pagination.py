@@ -0,0 +1,134 @@
+"""
+Paginação por cursor (keyset) para resultados ordenados por distância
+
+O cursor é opaco para o cliente: codifica a chave (distância, id) do último
+item entregue e uma impressão digital dos parâmetros da busca, para que não
+seja reaproveitado em outra consulta.
+"""
+import base64
+import bisect
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from flask import current_app
+
+
+class InvalidCursor(ValueError):
+    """Cursor malformado ou gerado para outra consulta"""
+
+
+def query_fingerprint(*params: Any) -> str:
+    """Impressão digital curta dos parâmetros que definem a ordenação"""
+    raw = json.dumps(params, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def encode_cursor(distance: float, item_id: Any, fingerprint: str) -> str:
+    """Gerar o cursor que retoma a paginação logo após (distance, item_id)"""
+    payload = json.dumps({'d': distance, 'id': item_id, 'q': fingerprint}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], fingerprint: str, id_type: type = int) -> Optional[Tuple[float, Any]]:
+    """
+    Decodificar o cursor em (distância, id); None se não houver cursor
+
+    id_type é o tipo das chaves da listagem (int nas unidades de tratamento,
+    str em /api/unidades): um id de outro tipo não pode ser comparado na
+    paginação e torna o cursor inválido.
+    """
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        distance = float(payload['d'])
+        item_id = payload['id']
+        cursor_fingerprint = payload['q']
+        if not math.isfinite(distance):
+            raise ValueError('distância não finita')
+        # bool é subclasse de int, mas não é um id
+        if not isinstance(item_id, id_type) or isinstance(item_id, bool):
+            raise TypeError(f'id deve ser {id_type.__name__}')
+    except (ValueError, TypeError, KeyError, UnicodeError) as e:
+        raise InvalidCursor(f'Cursor inválido: {e}') from e
+
+    if cursor_fingerprint != fingerprint:
+        raise InvalidCursor('Cursor não corresponde aos parâmetros da busca')
+
+    return distance, item_id
+
+
+def clamp_page_size(requested: Any, default: int, maximum: int) -> int:
+    """Tamanho de página pedido, limitado ao máximo configurado no servidor"""
+    try:
+        size = int(requested) if requested is not None else default
+    except (TypeError, ValueError):
+        size = default
+    return max(0, min(size, maximum))
+
+
+class RankedResults:
+    """Resultado completo de uma busca, já ordenado pela chave da paginação"""
+
+    def __init__(self, items: List[Dict[str, Any]], key: Callable[[Dict[str, Any]], Tuple], extra: Any = None):
+        self.items = sorted(items, key=key)
+        self.keys = [key(item) for item in self.items]
+        self.extra = extra
+
+    def page(self, after: Optional[Tuple], size: int) -> List[Dict[str, Any]]:
+        """Até size + 1 itens logo após a chave after (o item a mais indica se há próxima página)"""
+        start = bisect.bisect_right(self.keys, tuple(after)) if after is not None else 0
+        return self.items[start:start + size + 1]
+
+
+class RankedResultsCache:
+    """
+    Cache LRU com TTL dos resultados ordenados por (consulta, versão dos
+    dados), para que as páginas seguintes de uma busca não refaçam a busca
+    e a ordenação inteiras: cada página é só um bisect + fatia
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 120.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[RankedResults]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, results = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return results
+
+    def set(self, key: Hashable, results: RankedResults) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def get_ranked_results_cache() -> RankedResultsCache:
+    """Cache de resultados ordenados do app atual"""
+    cache = current_app.extensions.get('ranked_results_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('ranked_results_cache', RankedResultsCache(
+            max_entries=current_app.config.get('UNITS_RESULTS_CACHE_SIZE', 256),
+            ttl=current_app.config.get('UNITS_RESULTS_CACHE_TTL', 120)
+        ))
+    return cache
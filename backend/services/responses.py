@@ -0,0 +1,64 @@
+"""
+Serialização das listas de unidades
+
+- Projeção de campos (parâmetro fields=): a listagem costuma usar só nome,
+  tipo e coordenadas, e cada unidade do OSM carrega vários campos a mais
+  (osm_id, osm_type, website, opening_hours...).
+- Encoder rápido: com o orjson instalado, o corpo é gerado por ele (bem mais
+  rápido que o json da biblioteca padrão em listas grandes); sem ele, usa o
+  encoder JSON do Flask, como o jsonify.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import Response, current_app
+
+try:
+    import orjson
+except ImportError:  # dependência opcional
+    orjson = None
+
+# Campos sempre presentes em uma projeção (chave das unidades e do cursor)
+REQUIRED_FIELDS = ('id',)
+
+
+def parse_fields(value: Any) -> Optional[Tuple[str, ...]]:
+    """
+    Campos pedidos ('id,name,latitude' ou lista); None = todos os campos
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)):
+        return None
+    fields = [str(field).strip() for field in value if str(field).strip()]
+    if not fields:
+        return None
+    for field in REQUIRED_FIELDS:
+        if field not in fields:
+            fields.insert(0, field)
+    # Sem repetições, na ordem pedida
+    return tuple(dict.fromkeys(fields))
+
+
+def project(records: Iterable[Dict[str, Any]], fields: Optional[Tuple[str, ...]]) -> List[Dict[str, Any]]:
+    """Manter só os campos pedidos de cada registro (campos desconhecidos são ignorados)"""
+    if fields is None:
+        return list(records)
+    return [{field: record[field] for field in fields if field in record} for record in records]
+
+
+def dumps(payload: Any) -> bytes:
+    """Serializar em JSON (UTF-8), com o orjson quando disponível"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            # Tipos que só o encoder do Flask conhece
+            pass
+    return current_app.json.dumps(payload).encode('utf-8')
+
+
+def json_response(payload: Any) -> Response:
+    """Equivalente a jsonify(payload), pelo encoder rápido"""
+    return current_app.response_class(dumps(payload), mimetype='application/json')
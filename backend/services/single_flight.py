@@ -0,0 +1,75 @@
+"""
+Coalescência de chamadas idênticas em andamento (single-flight)
+
+Chamadas concorrentes com a mesma chave esperam uma única execução e
+recebem o mesmo resultado (ou a mesma exceção). Os resultados são
+compartilhados entre as chamadas e não devem ser alterados por quem os recebe.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from flask import current_app
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Grupo de chamadas coalescidas por chave, com contadores"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Executar fn, ou aguardar a execução em andamento com a mesma chave"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls)
+            }
+
+
+def get_single_flight() -> SingleFlight:
+    """Grupo de chamadas coalescidas do app atual"""
+    group = current_app.extensions.get('single_flight')
+    if group is None:
+        group = current_app.extensions.setdefault('single_flight', SingleFlight())
+    return group
@@ -0,0 +1,205 @@
+"""
+Índice espacial em memória para as unidades de tratamento
+
+As unidades são distribuídas em uma grade de células de latitude/longitude;
+consultas por raio e pelos k vizinhos mais próximos visitam apenas as células
+que podem conter resultados, em vez de percorrer a tabela inteira.
+"""
+import heapq
+import math
+import threading
+from collections import defaultdict, namedtuple
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+
+from ..models.unit_specialization import SICKLE_CELL_TAG
+from .distance import EARTH_RADIUS_KM, within_radius as points_within_radius
+from .unit_snapshot import UnitSnapshot, get_unit_snapshot
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Tamanho padrão da célula da grade, em graus (~28 km no equador)
+DEFAULT_CELL_SIZE = 0.25
+
+# key: chave de desempate na ordenação (o id da unidade)
+IndexEntry = namedtuple('IndexEntry', ['latitude', 'longitude', 'key', 'unit_type', 'payload'])
+
+
+class GridIndex:
+    """
+    Grade de buckets de latitude/longitude sobre um conjunto de entradas
+    """
+
+    def __init__(self, entries: Iterable[IndexEntry], cell_size: float = DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.columns = int(math.ceil(360 / cell_size))
+        self.cells = defaultdict(list)
+        self.size = 0
+
+        for entry in entries:
+            self.cells[self._cell(entry.latitude, entry.longitude)].append(entry)
+            self.size += 1
+
+        # Coordenadas de cada célula em arrays para o cálculo vetorizado
+        self.coordinates = {
+            cell: (
+                np.fromiter((entry.latitude for entry in cell_entries), dtype=np.float64),
+                np.fromiter((entry.longitude for entry in cell_entries), dtype=np.float64)
+            )
+            for cell, cell_entries in self.cells.items()
+        }
+
+    def _row(self, lat: float) -> int:
+        return int(math.floor((lat + 90) / self.cell_size))
+
+    def _column(self, lng: float) -> int:
+        return int(math.floor((lng + 180) / self.cell_size)) % self.columns
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return self._row(lat), self._column(lng)
+
+    def _candidate_cells(self, lat: float, lng: float, radius_km: float):
+        """
+        Células que intersectam a caixa envolvente do círculo de busca
+        (método de coordenadas limite de J. Matuschek)
+        """
+        angular = radius_km / EARTH_RADIUS_KM
+        dlat = math.degrees(angular)
+        min_lat = lat - dlat
+        max_lat = lat + dlat
+
+        sin_angular = math.sin(min(angular, math.pi / 2))
+        cos_lat = math.cos(math.radians(lat))
+        if min_lat <= -90 or max_lat >= 90 or angular >= math.pi / 2 or sin_angular >= cos_lat:
+            # O círculo alcança um polo: todas as longitudes são candidatas
+            columns = range(self.columns)
+        else:
+            dlng = math.degrees(math.asin(sin_angular / cos_lat))
+            first = int(math.floor((lng - dlng + 180) / self.cell_size))
+            last = int(math.floor((lng + dlng + 180) / self.cell_size))
+            if last - first + 1 >= self.columns:
+                columns = range(self.columns)
+            else:
+                columns = {column % self.columns for column in range(first, last + 1)}
+
+        rows = range(self._row(max(min_lat, -90)), self._row(min(max_lat, 90)) + 1)
+
+        # Para raios grandes é mais barato percorrer só as células ocupadas
+        if len(rows) * len(columns) > len(self.cells):
+            row_set = set(rows)
+            column_set = set(columns)
+            return [cell for cell in self.cells if cell[0] in row_set and cell[1] in column_set]
+
+        return [(row, column) for row in rows for column in columns if (row, column) in self.cells]
+
+    def within_radius(
+        self,
+        lat: float,
+        lng: float,
+        radius_km: float,
+        predicate: Optional[Callable[[IndexEntry], bool]] = None
+    ) -> List[Tuple[float, IndexEntry]]:
+        """
+        Retornar (distância, entrada) de todas as entradas a até radius_km
+        """
+        cells = self._candidate_cells(lat, lng, radius_km)
+        if not cells:
+            return []
+
+        entries = []
+        for cell in cells:
+            entries.extend(self.cells[cell])
+        lats = np.concatenate([self.coordinates[cell][0] for cell in cells])
+        lngs = np.concatenate([self.coordinates[cell][1] for cell in cells])
+
+        positions, distances = points_within_radius(lat, lng, lats, lngs, radius_km)
+
+        results = []
+        for position, distance in zip(positions.tolist(), distances.tolist()):
+            entry = entries[position]
+            if predicate is None or predicate(entry):
+                results.append((distance, entry))
+        return results
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        max_km: float,
+        predicate: Optional[Callable[[IndexEntry], bool]] = None,
+        decimals: Optional[int] = None,
+        after: Optional[Tuple[float, Any]] = None
+    ) -> List[Tuple[float, IndexEntry]]:
+        """
+        Retornar as k entradas mais próximas a até max_km, ordenadas por
+        distância e, em caso de empate, pela chave da entrada.
+
+        Se decimals for informado, a ordenação usa a distância arredondada
+        (como faz a resposta da API). Com after=(distância, chave), retorna
+        apenas as entradas posteriores a essa posição (paginação por cursor).
+        """
+        if k <= 0 or self.size == 0:
+            return []
+
+        def rank(item):
+            distance, entry = item
+            if decimals is not None:
+                distance = round(distance, decimals)
+            return distance, entry.key
+
+        def collect(radius_km):
+            results = self.within_radius(lat, lng, radius_km, predicate)
+            if after is not None:
+                results = [item for item in results if rank(item) > after]
+            return results
+
+        # Raio crescente: começa uma célula além do cursor e dobra até achar k resultados
+        cell_km = self.cell_size * KM_PER_DEGREE
+        search_km = min(max_km, (after[0] if after is not None else 0) + cell_km)
+        while True:
+            results = collect(search_km)
+            if len(results) >= k or search_km >= max_km:
+                break
+            search_km = min(max_km, search_km * 2)
+
+        if decimals is not None and len(results) >= k and search_km < max_km:
+            # Empates após o arredondamento podem estar logo além do raio atual
+            results = collect(min(max_km, search_km + 10 ** -decimals))
+
+        return heapq.nsmallest(k, results, key=rank)
+
+
+_lock = threading.Lock()
+
+
+def build_treatment_unit_index(snapshot: UnitSnapshot, cell_size: float = DEFAULT_CELL_SIZE) -> GridIndex:
+    """
+    Construir o índice com as unidades ativas especializadas em anemia falciforme
+    """
+    entries = (
+        IndexEntry(
+            snapshot.latitudes[row], snapshot.longitudes[row], snapshot.records[row]['id'],
+            snapshot.records[row]['unit_type'], snapshot.records[row]
+        )
+        for row in snapshot.rows_with_tag(SICKLE_CELL_TAG).tolist()
+    )
+    return GridIndex(entries, cell_size=cell_size)
+
+
+def get_treatment_unit_index() -> GridIndex:
+    """
+    Obter o índice de unidades do app atual, reconstruído a cada novo snapshot
+    """
+    snapshot = get_unit_snapshot()
+    state = current_app.extensions.setdefault('treatment_unit_index', {})
+
+    with _lock:
+        if state.get('snapshot') is not snapshot:
+            state['index'] = build_treatment_unit_index(
+                snapshot, current_app.config.get('SPATIAL_INDEX_CELL_SIZE', DEFAULT_CELL_SIZE)
+            )
+            state['snapshot'] = snapshot
+        return state['index']
@@ -0,0 +1,231 @@
+"""
+Busca de unidades próximas
+
+Com SPATIAL_BACKEND='auto' (padrão) e o índice espacial criado pela
+migração b7c2e4f1a9d3 (coluna geography + GiST no PostgreSQL/PostGIS ou
+tabela R*Tree no SQLite), a busca usa o índice do banco: KNN do GiST
+(ORDER BY geog <-> ponto) no PostGIS e caixas de raio crescente no R*Tree.
+Sem a migração, ou com SPATIAL_BACKEND='memory', usa o índice em grade
+construído sobre o snapshot em memória das unidades.
+"""
+import heapq
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import inspect, text
+
+from ..extensions import db
+from ..models.treatment_unit import TreatmentUnit
+from ..models.unit_specialization import SICKLE_CELL_TAG
+from .distance import bounding_boxes, haversine_km, within_radius as points_within_radius
+from .spatial_index import get_treatment_unit_index
+
+_UNIT_COLUMNS = ', '.join(
+    f'treatment_units.{column.name}' for column in TreatmentUnit.__table__.columns
+)
+
+_POSTGIS_POINT = "ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography"
+
+# Mesma fórmula de services/distance.haversine_km, em SQL
+_SQL_HAVERSINE_KM = """(2 * 6371 * asin(least(1.0, sqrt(
+    power(sin((radians(treatment_units.latitude) - radians(:lat)) / 2), 2)
+    + cos(radians(:lat)) * cos(radians(treatment_units.latitude))
+      * power(sin((radians(treatment_units.longitude) - radians(:lng)) / 2), 2)
+))))"""
+
+# Casas decimais da distância exibida, que também definem a ordenação
+DISTANCE_DECIMALS = 2
+
+# Raio inicial (km) da busca por caixas crescentes no R*Tree
+RTREE_INITIAL_SEARCH_KM = 10.0
+
+
+def get_spatial_backend() -> Optional[str]:
+    """
+    Detectar o backend espacial do banco: 'postgis', 'rtree' ou None
+
+    Só é consultado com SPATIAL_BACKEND='auto'; o resultado é guardado por app.
+    """
+    if current_app.config.get('SPATIAL_BACKEND', 'auto') != 'auto':
+        return None
+
+    state = current_app.extensions.setdefault('spatial_backend', {})
+    if 'backend' not in state:
+        inspector = inspect(db.engine)
+        backend = None
+        if db.engine.dialect.name == 'postgresql':
+            columns = {column['name'] for column in inspector.get_columns('treatment_units')}
+            if 'geog' in columns:
+                backend = 'postgis'
+        elif db.engine.dialect.name == 'sqlite':
+            if inspector.has_table('treatment_units_rtree'):
+                backend = 'rtree'
+        state['backend'] = backend
+
+    return state['backend']
+
+
+def _query_postgis(lat, lng, radius_km, limit, unit_type, after) -> List[TreatmentUnit]:
+    params = {
+        'lat': lat, 'lng': lng, 'radius_km': radius_km,
+        # Folga: o PostGIS usa um raio terrestre ~1 ppm maior que 6371 km
+        'radius_m': radius_km * 1000 * 1.00001 + 1,
+        # Distância KNN (esfera do PostGIS) até onde pode haver unidades com a
+        # mesma distância arredondada da última selecionada
+        'tie_margin_m': 10 ** (3 - DISTANCE_DECIMALS) + 1,
+        'limit': limit, 'tag': SICKLE_CELL_TAG
+    }
+
+    unit_type_clause = ""
+    if unit_type:
+        unit_type_clause = "AND treatment_units.unit_type = :unit_type"
+        params['unit_type'] = unit_type
+
+    after_clause = ""
+    if after is not None:
+        after_clause = (
+            f"AND (round(CAST({_SQL_HAVERSINE_KM} AS numeric), {DISTANCE_DECIMALS}), treatment_units.id)"
+            " > (CAST(:after_distance AS numeric), :after_id)"
+        )
+        params.update({'after_distance': after[0], 'after_id': after[1]})
+
+    candidates = f"""
+            FROM treatment_units
+            JOIN treatment_unit_specializations AS s
+              ON s.unit_id = treatment_units.id AND s.tag = :tag
+            WHERE treatment_units.active
+              {unit_type_clause}
+              AND {_SQL_HAVERSINE_KM} <= :radius_km
+              {after_clause}"""
+
+    # 1) KNN pelo GiST (ORDER BY geog <-> ponto) com o filtro do cursor: as
+    #    `limit` unidades mais próximas depois da posição do cursor;
+    # 2) como a ordem da paginação é (distância arredondada, id), igual à do
+    #    índice em memória, as unidades empatadas com a última ainda podem
+    #    estar um pouco além dela: uma segunda busca com ST_DWithin até essa
+    #    distância (mais a margem do arredondamento) ordena só esse conjunto
+    statement = text(f"""
+        WITH knn AS (
+            SELECT treatment_units.geog <-> {_POSTGIS_POINT} AS knn_m
+            {candidates}
+              AND ST_DWithin(treatment_units.geog, {_POSTGIS_POINT}, :radius_m, false)
+            ORDER BY treatment_units.geog <-> {_POSTGIS_POINT}
+            LIMIT :limit
+        )
+        SELECT {_UNIT_COLUMNS}
+        FROM (
+            SELECT treatment_units.*,
+                   round(CAST({_SQL_HAVERSINE_KM} AS numeric), {DISTANCE_DECIMALS}) AS distance_key
+            {candidates}
+              AND ST_DWithin(
+                  treatment_units.geog, {_POSTGIS_POINT},
+                  LEAST(:radius_m, (SELECT max(knn_m) FROM knn) * 1.00001 + :tie_margin_m), false
+              )
+        ) AS treatment_units
+        ORDER BY distance_key, id
+        LIMIT :limit
+    """)
+
+    return TreatmentUnit.query.from_statement(statement.bindparams(**params)).all()
+
+
+def _rtree_candidates(lat, lng, radius_km, unit_type) -> List[Tuple[int, float, float]]:
+    """(id, latitude, longitude) das unidades nas caixas do R*Tree que cobrem o raio"""
+    params = {'tag': SICKLE_CELL_TAG}
+    boxes = []
+    for i, (min_lat, max_lat, min_lng, max_lng) in enumerate(bounding_boxes(lat, lng, radius_km)):
+        boxes.append(
+            f"(r.max_lat >= :min_lat_{i} AND r.min_lat <= :max_lat_{i} "
+            f"AND r.max_lng >= :min_lng_{i} AND r.min_lng <= :max_lng_{i})"
+        )
+        params.update({
+            f'min_lat_{i}': min_lat, f'max_lat_{i}': max_lat,
+            f'min_lng_{i}': min_lng, f'max_lng_{i}': max_lng
+        })
+
+    unit_type_clause = ""
+    if unit_type:
+        unit_type_clause = "AND treatment_units.unit_type = :unit_type"
+        params['unit_type'] = unit_type
+
+    statement = text(f"""
+        SELECT treatment_units.id, treatment_units.latitude, treatment_units.longitude
+        FROM treatment_units_rtree AS r
+        JOIN treatment_units ON treatment_units.id = r.id
+        JOIN treatment_unit_specializations AS s
+          ON s.unit_id = treatment_units.id AND s.tag = :tag
+        WHERE ({' OR '.join(boxes)})
+          AND treatment_units.active = 1
+          {unit_type_clause}
+    """)
+    return db.session.execute(statement, params).all()
+
+
+def _query_rtree(lat, lng, radius_km, limit, unit_type, after) -> List[TreatmentUnit]:
+    # O SQLite não tem KNN no R*Tree: a busca usa caixas de raio crescente
+    # (como GridIndex.nearest), e as distâncias dos poucos candidatos de cada
+    # caixa são calculadas em lote, em vez de uma função por linha no ORDER BY
+    def collect(search_km):
+        rows = _rtree_candidates(lat, lng, search_km, unit_type)
+        if not rows:
+            return []
+        ids, lats, lngs = zip(*rows)
+        positions, distances = points_within_radius(lat, lng, lats, lngs, search_km)
+        results = [
+            (round(distance, DISTANCE_DECIMALS), ids[position])
+            for position, distance in zip(positions.tolist(), distances.tolist())
+        ]
+        if after is not None:
+            results = [key for key in results if key > tuple(after)]
+        return results
+
+    search_km = min(radius_km, (after[0] if after is not None else 0) + RTREE_INITIAL_SEARCH_KM)
+    while True:
+        results = collect(search_km)
+        if len(results) >= limit or search_km >= radius_km:
+            break
+        search_km = min(radius_km, search_km * 2)
+
+    if len(results) >= limit and search_km < radius_km:
+        # Empates após o arredondamento podem estar logo além do raio atual
+        results = collect(min(radius_km, search_km + 10 ** -DISTANCE_DECIMALS))
+
+    ids = [unit_id for _, unit_id in heapq.nsmallest(limit, results)]
+    units = {unit.id: unit for unit in TreatmentUnit.query.filter(TreatmentUnit.id.in_(ids)).all()} if ids else {}
+    return [units[unit_id] for unit_id in ids]
+
+
+def find_nearby_units(
+    lat: float,
+    lng: float,
+    radius_km: float,
+    limit: int,
+    unit_type: Optional[str] = None,
+    after: Optional[Tuple[float, int]] = None
+) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    Unidades ativas de anemia falciforme a até radius_km, mais próximas primeiro
+
+    A ordem é (distância arredondada, id); com after=(distância, id) a busca
+    recomeça logo após essa posição. Retorna pares (distância em km, unit.to_dict()).
+    """
+    if limit <= 0:
+        return []
+
+    backend = get_spatial_backend()
+    if backend is None:
+        predicate = None
+        if unit_type:
+            predicate = lambda entry: entry.unit_type == unit_type
+        return [
+            (distance, entry.payload)
+            for distance, entry in get_treatment_unit_index().nearest(
+                lat, lng, limit, radius_km, predicate, decimals=DISTANCE_DECIMALS, after=after
+            )
+        ]
+
+    query = _query_postgis if backend == 'postgis' else _query_rtree
+    return [
+        (haversine_km(lat, lng, unit.latitude, unit.longitude), unit.to_dict())
+        for unit in query(lat, lng, radius_km, limit, unit_type, after)
+    ]
@@ -0,0 +1,23 @@
+"""
+Normalização de textos para comparação e indexação
+"""
+import re
+import unicodedata
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def strip_accents(value: str) -> str:
+    """Remover acentos e demais marcas diacríticas"""
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def normalize_text(value) -> str:
+    """
+    Forma canônica de um texto: sem acentos, em minúsculas e com espaços
+    colapsados (ex.: '  Anêmia   FALCIFORME ' -> 'anemia falciforme')
+    """
+    if not value:
+        return ''
+    return _WHITESPACE.sub(' ', strip_accents(str(value)).casefold()).strip()
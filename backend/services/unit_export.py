@@ -0,0 +1,99 @@
+"""
+Exportação em streaming das unidades de tratamento (NDJSON ou GeoJSON)
+
+As linhas são lidas com um cursor do lado do servidor (yield_per, sem
+objetos ORM) e serializadas em blocos de até CHUNK_SIZE bytes, de modo que
+a memória usada não depende do tamanho da tabela. Usado pela rota
+/unidades-tratamento/exportar e pelo comando `flask export-units`.
+"""
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from sqlalchemy import select
+
+from ..extensions import db
+from ..models.treatment_unit import TreatmentUnit
+from .responses import dumps
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'geojson': 'application/geo+json',
+}
+DEFAULT_BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+EXPORT_COLUMNS = (
+    TreatmentUnit.id, TreatmentUnit.name, TreatmentUnit.address,
+    TreatmentUnit.latitude, TreatmentUnit.longitude,
+    TreatmentUnit.specialization, TreatmentUnit.unit_type, TreatmentUnit.active
+)
+
+
+def iter_unit_rows(
+    unit_type: Optional[str] = None,
+    include_inactive: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """Unidades como dicionários, lidas do banco em lotes de batch_size linhas"""
+    statement = select(*EXPORT_COLUMNS).order_by(TreatmentUnit.id)
+    if not include_inactive:
+        statement = statement.where(TreatmentUnit.active.is_(True))
+    if unit_type:
+        statement = statement.where(TreatmentUnit.unit_type == unit_type)
+
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        for row in result.mappings():
+            yield dict(row)
+    finally:
+        result.close()
+
+
+def _chunked(pieces: Iterable[bytes], chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """Juntar pedaços pequenos em blocos de cerca de chunk_size bytes (padrão: CHUNK_SIZE)"""
+    chunk_size = chunk_size or CHUNK_SIZE
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def unit_feature(unit: Dict[str, Any]) -> Dict[str, Any]:
+    """Feature GeoJSON de uma unidade"""
+    return {
+        'type': 'Feature',
+        'id': unit['id'],
+        'geometry': {'type': 'Point', 'coordinates': [unit['longitude'], unit['latitude']]},
+        'properties': unit
+    }
+
+
+def iter_ndjson(units: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Uma unidade JSON por linha"""
+    return _chunked(dumps(unit) + b'\n' for unit in units)
+
+
+def iter_geojson(units: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """FeatureCollection GeoJSON gerada feature por feature"""
+    def pieces():
+        yield b'{"type":"FeatureCollection","features":['
+        separator = b''
+        for unit in units:
+            yield separator + dumps(unit_feature(unit))
+            separator = b','
+        yield b']}\n'
+    return _chunked(pieces())
+
+
+def export_units(fmt: str, **filters) -> Iterator[bytes]:
+    """Blocos de bytes da exportação no formato pedido ('ndjson' ou 'geojson')"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato de exportação inválido: {fmt}")
+    units = iter_unit_rows(**filters)
+    return iter_ndjson(units) if fmt == 'ndjson' else iter_geojson(units)
@@ -0,0 +1,143 @@
+"""
+Snapshot colunar, em memória, das unidades de tratamento ativas
+
+A tabela de unidades muda poucas vezes por dia; as rotas de leitura consultam
+este snapshot (arrays de coordenadas, códigos internados de tipo e índice
+invertido de tags) em vez de hidratar objetos ORM a cada requisição. O
+snapshot é carimbado com a versão de services/data_version (a mesma das
+ETags), incrementada no banco a cada alteração de TreatmentUnit, de modo que
+alterações feitas por outros processos também o invalidam.
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+
+from ..extensions import db
+from ..models.treatment_unit import TreatmentUnit
+from ..models.unit_specialization import UnitSpecialization
+from .data_version import unit_data_version
+
+_EMPTY_ROWS = np.empty(0, dtype=np.int64)
+
+
+class UnitSnapshot:
+    """
+    Unidades ativas em arrays paralelos, ordenadas por id
+    """
+
+    def __init__(self, version: Tuple, units: List[Dict], tags_by_unit: Dict[int, List[str]]):
+        self.version = version
+        self.built_at = time.time()
+
+        # Dicionários já serializáveis, no mesmo formato de TreatmentUnit.to_dict()
+        self.records = units
+        self.ids = np.fromiter((unit['id'] for unit in units), dtype=np.int64, count=len(units))
+        self.latitudes = np.fromiter((unit['latitude'] for unit in units), dtype=np.float64, count=len(units))
+        self.longitudes = np.fromiter((unit['longitude'] for unit in units), dtype=np.float64, count=len(units))
+
+        # Tipos de unidade internados: vocabulário + código por linha (-1 = sem tipo)
+        self.unit_types = tuple(sorted({unit['unit_type'] for unit in units if unit['unit_type']}))
+        type_codes = {unit_type: code for code, unit_type in enumerate(self.unit_types)}
+        self.unit_type_codes = np.fromiter(
+            (type_codes.get(unit['unit_type'], -1) for unit in units), dtype=np.int16, count=len(units)
+        )
+
+        # Índice invertido tag -> linhas (ordenadas) que possuem a tag
+        rows_by_tag = defaultdict(list)
+        for row, unit in enumerate(units):
+            for tag in tags_by_unit.get(unit['id'], ()):
+                rows_by_tag[tag].append(row)
+        self.tags = tuple(sorted(rows_by_tag))
+        self.tag_rows = {tag: np.asarray(rows, dtype=np.int64) for tag, rows in rows_by_tag.items()}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def rows_with_tag(self, tag: str) -> np.ndarray:
+        """Linhas das unidades que possuem a tag"""
+        return self.tag_rows.get(tag, _EMPTY_ROWS)
+
+    def type_code(self, unit_type: Optional[str]) -> Optional[int]:
+        """Código internado de um tipo de unidade (None se desconhecido)"""
+        try:
+            return self.unit_types.index(unit_type)
+        except ValueError:
+            return None
+
+    def rows(self, tag: Optional[str] = None, unit_type: Optional[str] = None) -> np.ndarray:
+        """Linhas filtradas por tag e/ou tipo de unidade"""
+        rows = self.rows_with_tag(tag) if tag else np.arange(len(self), dtype=np.int64)
+        if unit_type:
+            code = self.type_code(unit_type)
+            if code is None:
+                return _EMPTY_ROWS
+            rows = rows[self.unit_type_codes[rows] == code]
+        return rows
+
+
+def build_unit_snapshot(version: Optional[Tuple] = None) -> UnitSnapshot:
+    """
+    Carregar as unidades ativas com consultas de colunas (sem objetos ORM)
+    """
+    if version is None:
+        version = unit_data_version()
+
+    columns = (
+        TreatmentUnit.id, TreatmentUnit.name, TreatmentUnit.address,
+        TreatmentUnit.latitude, TreatmentUnit.longitude,
+        TreatmentUnit.specialization, TreatmentUnit.unit_type
+    )
+    rows = (
+        db.session.query(*columns)
+        .filter(TreatmentUnit.active.is_(True))
+        .order_by(TreatmentUnit.id)
+        .all()
+    )
+    units = [row._asdict() for row in rows]
+
+    tags_by_unit = defaultdict(list)
+    tag_rows = (
+        db.session.query(UnitSpecialization.unit_id, UnitSpecialization.tag)
+        .join(TreatmentUnit, TreatmentUnit.id == UnitSpecialization.unit_id)
+        .filter(TreatmentUnit.active.is_(True))
+    )
+    for unit_id, tag in tag_rows:
+        tags_by_unit[unit_id].append(tag)
+
+    return UnitSnapshot(version, units, tags_by_unit)
+
+
+_lock = threading.Lock()
+
+
+def get_unit_snapshot() -> UnitSnapshot:
+    """
+    Obter o snapshot do app atual, reconstruindo-o quando a versão dos dados
+    mudar ou quando passar de UNIT_SNAPSHOT_MAX_AGE (alterações fora do ORM
+    que não incrementaram a versão)
+    """
+    state = current_app.extensions.setdefault('unit_snapshot', {})
+    max_age = current_app.config.get('UNIT_SNAPSHOT_MAX_AGE', 300)
+    version = unit_data_version()
+
+    with _lock:
+        snapshot = state.get('snapshot')
+        stale = (
+            snapshot is None
+            or snapshot.version != version
+            or (max_age and time.time() - snapshot.built_at > max_age)
+        )
+        if stale:
+            snapshot = build_unit_snapshot(version)
+            state['snapshot'] = snapshot
+        return snapshot
+
+
+def invalidate_unit_snapshot() -> None:
+    """Descartar o snapshot do app atual; o próximo acesso o reconstrói"""
+    with _lock:
+        current_app.extensions.get('unit_snapshot', {}).pop('snapshot', None)
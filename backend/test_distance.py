@@ -0,0 +1,86 @@
+import math
+import random
+
+import numpy as np
+import pytest
+from backend.routes import free_maps
+from backend.services.distance import (
+    haversine_km,
+    haversine_matrix,
+    haversine_one_to_many,
+    prefilter_mask,
+    within_radius,
+)
+
+
+def reference_atan2(lat1, lng1, lat2, lng2):
+    # Fórmula usada anteriormente em routes/treatment_units.py
+    lat1_rad, lng1_rad, lat2_rad, lng2_rad = map(math.radians, [lat1, lng1, lat2, lng2])
+    a = math.sin((lat2_rad - lat1_rad)/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin((lng2_rad - lng1_rad)/2)**2
+    return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+
+
+def reference_asin(lat1, lng1, lat2, lng2):
+    # Fórmula usada anteriormente em routes/free_maps.py
+    lat1_rad, lng1_rad, lat2_rad, lng2_rad = map(math.radians, [lat1, lng1, lat2, lng2])
+    a = math.sin((lat2_rad - lat1_rad)/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin((lng2_rad - lng1_rad)/2)**2
+    return 2 * math.asin(math.sqrt(a)) * 6371
+
+
+@pytest.fixture
+def points():
+    rng = random.Random(7)
+    lats = [rng.uniform(-34, 5) for _ in range(300)]
+    lngs = [rng.uniform(-74, -34) for _ in range(300)]
+    return lats, lngs
+
+
+def test_scalar_matches_previous_formulas(points):
+    lats, lngs = points
+    for lat, lng in zip(lats, lngs):
+        expected = reference_atan2(-12.9714, -38.5014, lat, lng)
+        assert haversine_km(-12.9714, -38.5014, lat, lng) == pytest.approx(expected, abs=1e-9)
+        assert reference_asin(-12.9714, -38.5014, lat, lng) == pytest.approx(expected, abs=1e-9)
+
+
+def test_one_to_many_and_matrix_match_scalar(points):
+    lats, lngs = points
+    row = haversine_one_to_many(-23.5505, -46.6333, lats, lngs)
+    expected = [reference_asin(-23.5505, -46.6333, lat, lng) for lat, lng in zip(lats, lngs)]
+    np.testing.assert_allclose(row, expected, rtol=0, atol=1e-9)
+
+    matrix = haversine_matrix(lats[:20], lngs[:20], lats, lngs)
+    assert matrix.shape == (20, 300)
+    for i in range(20):
+        np.testing.assert_allclose(matrix[i], haversine_one_to_many(lats[i], lngs[i], lats, lngs), atol=1e-9)
+
+
+@pytest.mark.parametrize("radius_km", [1, 25, 50, 200, 499, 2000])
+def test_prefilter_never_drops_points_inside_radius(points, radius_km):
+    lats, lngs = points
+    exact = haversine_one_to_many(-15.78, -47.93, lats, lngs)
+    mask = prefilter_mask(-15.78, -47.93, lats, lngs, radius_km)
+    assert not np.any((exact <= radius_km) & ~mask)
+
+    positions, distances = within_radius(-15.78, -47.93, lats, lngs, radius_km)
+    assert positions.tolist() == np.flatnonzero(exact <= radius_km).tolist()
+    np.testing.assert_allclose(distances, exact[positions])
+
+
+def test_prefilter_handles_antimeridian():
+    mask = prefilter_mask(0, 179.9, [0, 0], [-179.9, 0], 50)
+    assert mask.tolist() == [True, False]
+
+
+def test_fallback_units_match_scalar_loop():
+    for lat, lng, radius in [(-12.97, -38.5, 50000), (-15.78, -47.93, 1500000), (0, 0, 1000)]:
+        expected = [
+            unit['id'] for unit in free_maps.FALLBACK_UNITS
+            if reference_asin(lat, lng, unit['latitude'], unit['longitude']) <= radius / 1000
+        ]
+        results = free_maps.get_fallback_units(lat, lng, radius)
+        assert [unit['id'] for unit in results] == expected
+        for unit in results:
+            assert unit['distance_km'] == pytest.approx(
+                reference_asin(lat, lng, unit['latitude'], unit['longitude']), abs=1e-9
+            )
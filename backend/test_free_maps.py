@@ -0,0 +1,1095 @@
+import base64
+import gzip
+import json
+import os
+import random
+import runpy
+import threading
+import time
+
+import pytest
+import requests
+from flask import jsonify
+from backend.app import create_app
+from backend.bench_classifier import legacy_classify, synthetic_elements
+from backend.routes import free_maps
+from backend.services import municipalities, responses
+from backend.services.circuit_breaker import CircuitBreaker, CircuitOpen
+from backend.services.fanout import UpstreamExecutor, get_upstream_executor
+from backend.services.osm_elements import OVERPASS_SELECTORS
+from backend.services.outbound_scheduler import (
+    AUTOCOMPLETE, BATCH, INTERACTIVE, OutboundRejected, OutboundScheduler
+)
+from backend.services.overpass_cache import OverpassTileCache, tile_bounds, tile_rectangles
+from backend.services.pagination import encode_cursor
+from backend.services.dedup import dedupe_medical_centers, name_tokens, names_match
+from backend.services.distance import haversine_km
+from backend.services.facility_classifier import classify
+from backend.services.geocode_cache import MISS, GeocodeCache
+from backend.services.http_client import HttpClient, UpstreamError, get_http_client
+from backend.services.json_stream import iter_json_array
+from backend.services.single_flight import SingleFlight, get_single_flight
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200, headers=None):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}")
+
+    def close(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+    def iter_content(self, chunk_size=1):
+        content = json.dumps(self.payload).encode("utf-8")
+        for start in range(0, len(content), chunk_size):
+            yield content[start:start + chunk_size]
+
+
+@pytest.fixture
+def app(tmp_path):
+    return create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "GEOCODE_CACHE_PATH": str(tmp_path / "geocode_cache.db"),
+        "OUTBOUND_SCHEDULER_PATH": str(tmp_path / "outbound_scheduler.db"),
+        "NOMINATIM_MIN_INTERVAL": 0,
+        "HTTP_BACKOFF_BASE": 0
+    })
+
+
+def capitals_only(tmp_path):
+    """Arquivo de municípios parcial: só as capitais do CSV versionado"""
+    path = tmp_path / "capitais.csv"
+    with open(os.path.join(municipalities.DATA_DIR, "municipios.csv"), encoding="utf-8") as source:
+        lines = source.read().splitlines()
+    path.write_text("\n".join([lines[0]] + [line for line in lines[1:] if line.split(",")[4] == "1"]) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def fake_upstream(monkeypatch, handler):
+    """Substituir as requisições das sessões do cliente HTTP"""
+    def fake_request(session, method, url, params=None, data=None, **kwargs):
+        return handler(method, url, params=params, data=data)
+
+    monkeypatch.setattr(requests.Session, "request", fake_request)
+
+
+@pytest.fixture
+def nominatim(monkeypatch):
+    calls = []
+    results = {"salvador, brasil": [{"lat": "-12.97", "lon": "-38.50"}]}
+
+    def fake_get(method, url, params=None, **kwargs):
+        calls.append(params["q"])
+        return FakeResponse(results.get(params["q"].lower(), []))
+
+    fake_upstream(monkeypatch, fake_get)
+    return calls
+
+
+def test_geocode_city_is_cached_across_spellings_and_restarts(app, tmp_path, nominatim):
+    with app.app_context():
+        assert free_maps.geocode_city("Salvador") == (-12.97, -38.50)
+        assert free_maps.geocode_city("  SALVADOR ") == (-12.97, -38.50)
+    assert nominatim == ["Salvador, Brasil"]
+
+    # Um novo app (reinício) lê do armazenamento SQLite
+    restarted = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "GEOCODE_CACHE_PATH": str(tmp_path / "geocode_cache.db")
+    })
+    with restarted.app_context():
+        assert free_maps.geocode_city("salvador") == (-12.97, -38.50)
+    assert len(nominatim) == 1
+
+
+def test_geocode_cache_falls_back_to_memory_when_file_cannot_be_opened(tmp_path):
+    blocker = tmp_path / "arquivo"
+    blocker.write_text("")
+    cache = GeocodeCache(str(blocker / "geocode_cache.db"), ttl=60, negative_ttl=60)
+    assert cache.path is None
+
+    cache.set("salvador", (-12.97, -38.50))
+    assert cache.get("salvador") == (-12.97, -38.50)
+    assert cache.get("recife") is MISS
+    assert cache.purge_expired() == 0
+
+
+def test_city_not_found_is_negatively_cached(app, nominatim):
+    client = app.test_client()
+    for _ in range(3):
+        response = client.get("/api/unidades?cidade=Cidade Inexistente")
+        assert response.status_code == 400
+        assert response.json["error_code"] == "CITY_NOT_FOUND"
+    assert nominatim == ["Cidade Inexistente, Brasil"]
+
+
+def test_network_errors_are_not_cached(app, monkeypatch):
+    def failing_get(*args, **kwargs):
+        raise requests.ConnectionError("sem rede")
+
+    fake_upstream(monkeypatch, failing_get)
+    with app.app_context():
+        assert free_maps.geocode_city("Salvador") is None
+
+    fake_upstream(monkeypatch, lambda *a, **k: FakeResponse([{"lat": "-12.97", "lon": "-38.50"}]))
+    with app.app_context():
+        assert free_maps.geocode_city("Salvador") == (-12.97, -38.50)
+
+
+def test_city_autocomplete_is_served_locally(app, nominatim):
+    # O CSV versionado é a tabela completa do IBGE: o índice local é a resposta
+    client = app.test_client()
+
+    response = client.get("/api/cidades?q=sao")
+    assert response.status_code == 200
+    cities = [city["full_name"] for city in response.json["data"]]
+    assert cities[:3] == ["São Luís, Maranhão", "São Paulo, São Paulo", "São Benedito, Ceará"]
+    assert len(cities) == 10
+
+    response = client.get("/api/cidades?q=paulo")
+    assert response.json["data"][0]["name"] == "Paulo Afonso"
+
+    response = client.get("/api/cidades?q=rio, RJ")
+    assert [city["name"] for city in response.json["data"]][:3] == ["Rio de Janeiro", "Rio Bonito", "Rio Claro"]
+
+    response = client.get("/api/cidades?q=vila ficticia")
+    assert response.json["data"] == []
+    assert nominatim == []
+
+
+def test_city_autocomplete_falls_back_to_nominatim(app, tmp_path, monkeypatch):
+    app.config["MUNICIPALITIES_FILE"] = capitals_only(tmp_path)
+    calls = []
+
+    def fake_get(method, url, params=None, **kwargs):
+        calls.append(params["q"])
+        return FakeResponse([{
+            "lat": "-12.13", "lon": "-38.41",
+            "address": {"town": "Vila Fictícia", "state": "Bahia"}
+        }])
+
+    fake_upstream(monkeypatch, fake_get)
+    response = app.test_client().get("/api/cidades?q=vila ficticia")
+    assert response.json["data"][0]["full_name"] == "Vila Fictícia, Bahia"
+    assert calls == ["vila ficticia, Brasil"]
+
+
+def test_partial_city_index_is_completed_by_nominatim(app, tmp_path, monkeypatch):
+    app.config["MUNICIPALITIES_FILE"] = capitals_only(tmp_path)
+    calls = []
+
+    def fake_get(method, url, params=None, **kwargs):
+        calls.append(params["q"])
+        return FakeResponse([
+            {"lat": "-20.46", "lon": "-54.62", "address": {"city": "Campo Grande", "state": "Mato Grosso do Sul"}},
+            {"lat": "-25.45", "lon": "-49.53", "address": {"city": "Campo Largo", "state": "Paraná"}},
+            {"lat": "-9.47", "lon": "-35.85", "address": {"town": "Campo Alegre", "state": "Alagoas"}},
+        ])
+
+    fake_upstream(monkeypatch, fake_get)
+    response = app.test_client().get("/api/cidades?q=Campo").json
+    # Só as capitais: as cidades locais vêm primeiro, sem repetição
+    assert [city["full_name"] for city in response["data"]] == [
+        "Campo Grande, Mato Grosso do Sul", "Campo Largo, Paraná", "Campo Alegre, Alagoas"
+    ]
+    assert calls == ["Campo, Brasil"]
+
+    def failing_get(*args, **kwargs):
+        raise requests.ConnectionError("sem rede")
+
+    # Nominatim fora do ar: as sugestões locais continuam valendo
+    fake_upstream(monkeypatch, failing_get)
+    response = app.test_client().get("/api/cidades?q=Campo")
+    assert response.status_code == 200
+    assert [city["name"] for city in response.json["data"]] == ["Campo Grande"]
+
+
+def overpass_payload():
+    return {"elements": [
+        {"type": "node", "id": 1, "lat": -12.98, "lon": -38.48,
+         "tags": {"amenity": "hospital", "name": "Hospital Geral"}},
+        {"type": "way", "id": 2, "center": {"lat": -12.95, "lon": -38.45},
+         "tags": {"amenity": "clinic", "name": "Clínica Hematologia"}},
+        {"type": "node", "id": 3, "lat": -14.5, "lon": -40.0,
+         "tags": {"amenity": "hospital", "name": "Hospital Distante"}},
+    ]}
+
+
+@pytest.fixture
+def overpass(monkeypatch):
+    calls = []
+
+    def fake_post(method, url, data=None, **kwargs):
+        calls.append(data)
+        return FakeResponse(overpass_payload())
+
+    fake_upstream(monkeypatch, fake_post)
+    return calls
+
+
+def test_overpass_results_are_served_from_tile_cache(app, overpass):
+    client = app.test_client()
+
+    first = client.get("/api/unidades?lat=-12.97&lng=-38.50&radius=20000").json
+    assert {unit["id"] for unit in first["data"]} >= {"osm_node_1", "osm_way_2"}
+    assert "osm_node_3" not in {unit["id"] for unit in first["data"]}
+    assert len(overpass) == 1
+
+    # Outro usuário a um quarteirão de distância reaproveita os mesmos tiles
+    second = client.get("/api/unidades?lat=-12.9705&lng=-38.5008&radius=20000").json
+    assert len(overpass) == 1
+    assert {unit["id"] for unit in second["data"]} == {unit["id"] for unit in first["data"]}
+
+
+def test_missing_tiles_are_fetched_as_rectangles_in_one_query():
+    # Formato de L: a bbox única cobriria também o tile (10, 1, 1), já em cache
+    missing = [(10, 0, 0), (10, 1, 0), (10, 0, 1)]
+    rectangles = tile_rectangles(missing)
+    assert sorted(map(sorted, rectangles)) == [[(10, 0, 0), (10, 1, 0)], [(10, 0, 1)]]
+    assert tile_rectangles([(10, x, y) for x in range(3) for y in range(2)]) == [
+        [(10, x, y) for y in range(2) for x in range(3)]
+    ]
+
+    calls = []
+
+    def fetch_bboxes(bboxes):
+        calls.append(bboxes)
+        return []
+
+    cache = OverpassTileCache(fetch_bboxes, ttl=60, stale_ttl=60)
+    cache._fetch_tiles(missing)
+    assert len(calls) == 1
+    assert sorted(calls[0]) == sorted(
+        (min(b[0] for b in bounds), min(b[1] for b in bounds), max(b[2] for b in bounds), max(b[3] for b in bounds))
+        for bounds in ([tile_bounds(tile) for tile in rectangle] for rectangle in rectangles)
+    )
+    assert set(cache._tiles) == set(missing)
+
+
+def test_overpass_query_unions_bboxes(app, overpass):
+    with app.app_context():
+        free_maps.search_medical_centers_overpass_bboxes([(-13.0, -38.6, -12.9, -38.4), (-12.9, -38.6, -12.8, -38.5)])
+    query = overpass[0]
+    assert query.count("(-13.0,-38.6,-12.9,-38.4)") == query.count("(-12.9,-38.6,-12.8,-38.5)") == len(OVERPASS_SELECTORS)
+
+
+def test_stale_tiles_are_served_and_refreshed_in_background(app, overpass):
+    with app.app_context():
+        assert len(free_maps.search_medical_centers_cached(-12.97, -38.50, 20000)) == 2
+        cache = app.extensions["overpass_cache"]
+        for tile, (centers, fetched_at) in list(cache._tiles.items()):
+            cache._tiles[tile] = (centers, fetched_at - cache.ttl - 1)
+
+        # Tile vencido ainda é servido na hora, e atualizado em segundo plano
+        assert len(free_maps.search_medical_centers_cached(-12.97, -38.50, 20000)) == 2
+
+    deadline = time.time() + 5
+    while cache.stats()["refreshing"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(overpass) == 2
+    assert all(time.time() - fetched_at < cache.ttl for _, fetched_at in cache._tiles.values())
+
+
+def test_http_client_reuses_sessions_and_retries_transient_errors(monkeypatch):
+    calls = []
+    responses = [FakeResponse({}, status_code=503), FakeResponse({"ok": True})]
+
+    def fake_request(session, method, url, timeout=None, **kwargs):
+        calls.append((session, timeout, session.headers["User-Agent"]))
+        if not responses:
+            raise requests.ConnectTimeout("timeout")
+        return responses.pop(0)
+
+    monkeypatch.setattr(requests.Session, "request", fake_request)
+    client = HttpClient(user_agent="Teste/1.0", max_retries=2, backoff_base=0)
+
+    assert client.request("nominatim", "GET", "https://example.org", timeout=(1, 2)).json() == {"ok": True}
+    assert [call[1:] for call in calls] == [((1, 2), "Teste/1.0")] * 2
+    assert calls[0][0] is calls[1][0] is client.session("nominatim")
+    assert client.session("overpass") is not client.session("nominatim")
+
+    # Falhas de conexão repetidas esgotam as tentativas
+    with pytest.raises(UpstreamError):
+        client.request("nominatim", "GET", "https://example.org", timeout=(1, 2))
+    assert len(calls) == 5
+
+
+def test_http_client_does_not_retry_client_errors(monkeypatch):
+    calls = []
+
+    def fake_request(session, method, url, **kwargs):
+        calls.append(url)
+        return FakeResponse({}, status_code=400)
+
+    monkeypatch.setattr(requests.Session, "request", fake_request)
+    with pytest.raises(requests.HTTPError):
+        HttpClient(backoff_base=0).request("overpass", "POST", "https://example.org", timeout=(1, 2))
+    assert len(calls) == 1
+
+
+def test_slow_overpass_is_reported_missing_at_the_deadline(tmp_path, monkeypatch):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "GEOCODE_CACHE_PATH": str(tmp_path / "geocode_cache.db"),
+        "OUTBOUND_SCHEDULER_PATH": str(tmp_path / "outbound_scheduler.db"),
+        "UPSTREAM_DEADLINE": 0.2
+    })
+    release = threading.Event()
+
+    def slow_post(method, url, data=None, **kwargs):
+        release.wait(5)
+        return FakeResponse(overpass_payload())
+
+    fake_upstream(monkeypatch, slow_post)
+    started = time.monotonic()
+    response = app.test_client().get("/api/unidades?lat=-12.97&lng=-38.50&radius=20000").json
+    release.set()
+
+    assert time.monotonic() - started < 2
+    assert response["partial"] is True
+    assert response["source_status"] == {"overpass_api": "timeout", "fallback_data": "ok"}
+    assert response["data_sources"] == ["fallback_data"]
+    assert response["data"][0]["id"] == "hemoba_salvador"
+
+
+def test_overpass_errors_are_reported_and_fallback_is_used(app, monkeypatch):
+    def failing_post(*args, **kwargs):
+        raise requests.ConnectionError("sem rede")
+
+    fake_upstream(monkeypatch, failing_post)
+    response = app.test_client().get("/api/unidades?lat=-12.97&lng=-38.50&radius=20000")
+    assert response.json["source_status"]["overpass_api"] == "error"
+    assert response.json["partial"] is True
+    assert response.json["data"]
+    # Resultado parcial não pode ser guardado pelo CDN
+    assert response.headers["Cache-Control"] == "no-store"
+    assert "ETag" not in response.headers
+
+
+def test_complete_responses_are_not_partial(app, monkeypatch):
+    def fake_request(method, url, params=None, data=None):
+        if method == "GET":
+            return FakeResponse([{"lat": "-12.97", "lon": "-38.50"}])
+        return FakeResponse(overpass_payload())
+
+    fake_upstream(monkeypatch, fake_request)
+    response = app.test_client().get("/api/unidades?cidade=Salvador&radius=20000").json
+    assert response["source_status"] == {"geocoding": "ok", "overpass_api": "ok", "fallback_data": "ok"}
+    assert response["partial"] is False
+
+
+def test_hundreds_of_slow_upstream_calls_do_not_exhaust_workers(tmp_path, monkeypatch):
+    # Banco em arquivo: o SQLite em memória compartilha uma única conexão
+    # entre as threads, o que não é seguro com centenas de requisições
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}",
+        "GEOCODE_CACHE_PATH": str(tmp_path / "geocode_cache.db"),
+        "OUTBOUND_SCHEDULER_PATH": str(tmp_path / "outbound_scheduler.db"),
+        "UPSTREAM_DEADLINE": 0.3,
+        "UPSTREAM_MAX_WORKERS": 4,
+        "UPSTREAM_MAX_PENDING": 16
+    })
+    release = threading.Event()
+    lock = threading.Lock()
+    in_flight = [0, 0]  # atual, máximo
+
+    def slow_post(method, url, data=None, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        try:
+            release.wait(10)
+            return FakeResponse(overpass_payload())
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    fake_upstream(monkeypatch, slow_post)
+    count = 300
+    results = [None] * count
+
+    def search(position):
+        # Cada busca em um lugar diferente: sem cache nem coalescência
+        lat = -30 + (position % 20) * 1.1
+        lng = -60 + (position // 20) * 1.1
+        started = time.monotonic()
+        response = app.test_client().get(f"/api/unidades?lat={lat}&lng={lng}&radius=5000")
+        results[position] = (response.status_code, response.json, time.monotonic() - started)
+
+    threads = [threading.Thread(target=search, args=(position,)) for position in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    # Durante a tempestade, rotas locais continuam respondendo
+    started = time.monotonic()
+    assert app.test_client().get("/api/cidades?q=Salvador").status_code == 200
+    assert time.monotonic() - started < 1
+
+    with app.app_context():
+        executor = get_upstream_executor()
+    release.set()
+
+    statuses = [result[1]["source_status"]["overpass_api"] for result in results]
+    assert all(result[0] == 200 for result in results)
+    assert all(result[1]["partial"] for result in results)
+    # Ninguém esperou além do prazo, e a fila não passou do limite
+    assert max(result[2] for result in results) < 2
+    assert set(statuses) == {"timeout", "busy"}
+    assert statuses.count("busy") >= count - executor.max_pending
+    assert executor.peak_pending <= 16
+    assert in_flight[1] <= 4
+
+    # Liberado o upstream, a fila esvazia e as buscas voltam ao normal
+    for _ in range(100):
+        if executor.pending == 0:
+            break
+        time.sleep(0.05)
+    assert executor.pending == 0
+    response = app.test_client().get("/api/unidades?lat=-12.97&lng=-38.50&radius=20000").json
+    assert response["source_status"]["overpass_api"] == "ok"
+
+
+def test_upstream_executor_rejects_beyond_max_pending():
+    executor = UpstreamExecutor(max_workers=1, max_pending=2)
+    release = threading.Event()
+    futures = [executor.submit(release.wait, 5) for _ in range(3)]
+    assert futures[2].done() and executor.rejected == 1
+    release.set()
+    assert futures[0].result(1) and futures[1].result(1)
+    executor.shutdown()
+    assert executor.pending == 0
+
+
+def test_gunicorn_config_uses_threaded_workers(monkeypatch):
+    from gunicorn.config import Config
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("GUNICORN_THREADS", "24")
+    monkeypatch.setenv("PORT", "9000")
+    settings = runpy.run_path(os.path.join(os.path.dirname(__file__), "gunicorn.conf.py"))
+    assert settings["worker_class"] == "gthread"
+
+    # Todos os nomes são configurações válidas do gunicorn
+    config = Config()
+    for name in ("wsgi_app", "bind", "worker_class", "workers", "threads", "worker_connections",
+                 "timeout", "graceful_timeout", "keepalive", "preload_app", "accesslog"):
+        config.set(name, settings[name])
+    assert config.workers == 3 and config.threads == 24
+    assert config.bind == ["0.0.0.0:9000"]
+    assert config.worker_class_str == "gthread"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_breaker_trips_rejects_and_recovers_with_a_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker("overpass", min_calls=4, error_rate=0.5, open_seconds=30, clock=clock)
+    for ok in (True, False, True, False):
+        breaker.allow()
+        breaker.record(ok, 0.1)
+    assert breaker.state == "open" and breaker.trips == 1
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    # Depois do intervalo, uma única chamada de teste é liberada
+    clock.now = 31
+    breaker.allow()
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record(False, None)
+    assert breaker.state == "open" and breaker.trips == 2
+
+    clock.now = 62
+    breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed"
+    assert breaker.snapshot()["errors"] == 0
+    breaker.allow()
+
+
+def test_read_timeout_follows_observed_p99():
+    breaker = CircuitBreaker("nominatim", min_samples=100, timeout_factor=2.0, min_timeout=0.5)
+    for position in range(99):
+        breaker.record(True, 0.2 + position * 0.001)
+    # Poucas amostras: vale o timeout fixo
+    assert breaker.read_timeout(10) == 10
+
+    breaker.record(True, 1.5)
+    assert breaker.read_timeout(10) == pytest.approx(0.298 * 2)
+    assert breaker.read_timeout(0.4) == 0.4
+    snapshot = breaker.snapshot()
+    assert snapshot["latency_ms"]["p99"] == pytest.approx(298)
+    assert snapshot["adaptive_timeout_s"] == pytest.approx(0.596)
+
+    # Um upstream mais lento estoura o timeout e faz o p99 subir
+    for _ in range(5):
+        breaker.record(False, 3.0)
+    assert breaker.read_timeout(10) == 6.0
+
+
+def test_http_client_uses_adaptive_read_timeout(monkeypatch):
+    timeouts = []
+
+    def capture(session, method, url, timeout=None, **kwargs):
+        timeouts.append(timeout)
+        return FakeResponse({})
+
+    monkeypatch.setattr(requests.Session, "request", capture)
+    client = HttpClient(breaker_options={"min_samples": 3, "timeout_factor": 10, "min_timeout": 0})
+    for _ in range(4):
+        client.request("nominatim", "GET", "https://example.org", timeout=(3.05, 10))
+    assert timeouts[0] == (3.05, 10)
+    assert timeouts[3][0] == 3.05 and timeouts[3][1] < 1
+
+
+def test_open_overpass_breaker_fails_fast_to_fallback(tmp_path, monkeypatch):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "GEOCODE_CACHE_PATH": str(tmp_path / "geocode_cache.db"),
+        "OUTBOUND_SCHEDULER_PATH": str(tmp_path / "outbound_scheduler.db"),
+        "HTTP_BACKOFF_BASE": 0,
+        "HTTP_MAX_RETRIES": 0,
+        "BREAKER_MIN_CALLS": 3
+    })
+    calls = []
+
+    def failing_post(method, url, data=None, **kwargs):
+        calls.append(url)
+        return FakeResponse({}, status_code=504)
+
+    fake_upstream(monkeypatch, failing_post)
+    client = app.test_client()
+    for position in range(3):
+        response = client.get(f"/api/unidades?lat={-12.97 + position}&lng=-38.50&radius=20000").json
+        assert response["source_status"]["overpass_api"] == "error"
+    assert len(calls) == 3
+
+    response = client.get("/api/unidades?lat=-12.97&lng=-38.50&radius=20000").json
+    assert len(calls) == 3
+    assert response["source_status"]["overpass_api"] == "circuit_open"
+    assert response["partial"] is True
+    assert response["data"][0]["id"] == "hemoba_salvador"
+
+    status = client.get("/api/upstreams")
+    assert status.headers["Cache-Control"] == "no-store"
+    breakers = {breaker["upstream"]: breaker for breaker in status.json["data"]}
+    assert breakers["overpass"]["state"] == "open"
+    assert breakers["overpass"]["errors"] == 3 and breakers["overpass"]["rejected"] >= 1
+    assert breakers["nominatim"]["state"] == "closed"
+
+
+def test_geocoding_with_open_breaker_is_unavailable_and_not_cached(app, nominatim):
+    with app.app_context():
+        breaker = free_maps.get_http_client().breaker("nominatim")
+        breaker.state = "open"
+        breaker.opened_at = time.monotonic()
+
+    response = app.test_client().get("/api/unidades?cidade=Salvador&radius=20000")
+    assert response.status_code == 503
+    assert response.json["error_code"] == "UPSTREAM_UNAVAILABLE"
+    assert nominatim == []
+
+    with app.app_context():
+        breaker.state = "closed"
+        assert free_maps.geocode_city("Salvador") == (-12.97, -38.50)
+
+
+def test_scheduler_spaces_calls_across_workers(tmp_path):
+    # Dois agendadores no mesmo arquivo, como dois workers do gunicorn
+    path = str(tmp_path / "outbound_scheduler.db")
+    slots = []
+    lock = threading.Lock()
+
+    class RecordingScheduler(OutboundScheduler):
+        def _reserve(self, upstream, interval, max_wait):
+            slot = super()._reserve(upstream, interval, max_wait)
+            with lock:
+                slots.append(slot)
+            return slot
+
+    workers = [RecordingScheduler({"nominatim": 0.1}, path) for _ in range(2)]
+
+    def call(scheduler):
+        scheduler.acquire("nominatim")
+
+    threads = [threading.Thread(target=call, args=(workers[position % 2],)) for position in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # Os horários reservados (e não o momento, sujeito ao escalonamento das
+    # threads, em que cada uma acordou) ficam a um intervalo um do outro
+    slots.sort()
+    assert len(slots) == 8
+    assert min(later - earlier for earlier, later in zip(slots, slots[1:])) >= 0.1 - 1e-6
+    # Upstreams sem limite não esperam
+    assert workers[0].acquire("overpass") == 0.0
+
+
+def test_scheduler_reads_next_slot_outside_the_queue_lock(tmp_path):
+    scheduler = OutboundScheduler({"nominatim": 0.01}, str(tmp_path / "outbound_scheduler.db"))
+    reading = threading.Event()
+    release = threading.Event()
+    original = scheduler._next_free
+
+    def slow_next_free(upstream):
+        reading.set()
+        release.wait(5)
+        return original(upstream)
+
+    scheduler._next_free = slow_next_free
+    thread = threading.Thread(target=scheduler.acquire, args=("nominatim",))
+    thread.start()
+    assert reading.wait(5)
+    # Com a leitura do arquivo em andamento, a fila continua livre
+    assert scheduler._condition.acquire(timeout=0.5)
+    scheduler._condition.release()
+    release.set()
+    thread.join(5)
+    assert scheduler.granted["nominatim", "interactive"] == 1
+
+
+def test_default_http_client_is_rate_limited():
+    client = get_http_client()
+    assert client.scheduler is not None
+    assert client.scheduler.intervals == {"nominatim": 1.0}
+
+
+def test_scheduler_serves_higher_priorities_first():
+    scheduler = OutboundScheduler({"nominatim": 0.3})
+    scheduler.acquire("nominatim")
+    order = []
+
+    def call(name, priority):
+        scheduler.acquire("nominatim", priority)
+        order.append(name)
+
+    first = threading.Thread(target=call, args=("primeira", BATCH))
+    first.start()
+    while "nominatim" not in scheduler._reserving:
+        time.sleep(0.005)
+
+    threads = [
+        threading.Thread(target=call, args=(name, priority))
+        for name, priority in (("lote", BATCH), ("autocomplete", AUTOCOMPLETE), ("geocodificacao", INTERACTIVE))
+    ]
+    for thread in threads:
+        thread.start()
+    while len(scheduler._queues["nominatim"]) < 3:
+        time.sleep(0.005)
+    for thread in [first] + threads:
+        thread.join(5)
+
+    assert order == ["primeira", "geocodificacao", "autocomplete", "lote"]
+    stats = scheduler.stats()["nominatim"]
+    assert stats["granted"] == {"interactive": 2, "autocomplete": 1, "batch": 2}
+
+
+def test_scheduler_rejects_calls_that_would_miss_their_deadline():
+    scheduler = OutboundScheduler({"nominatim": 0.5})
+    scheduler.acquire("nominatim")
+
+    started = time.monotonic()
+    with pytest.raises(OutboundRejected):
+        scheduler.acquire("nominatim", AUTOCOMPLETE, max_wait=0.1)
+    assert time.monotonic() - started < 0.1
+
+    # Com prazo suficiente, espera a vez
+    assert 0.3 < scheduler.acquire("nominatim", INTERACTIVE, max_wait=1.0) < 1.0
+    stats = scheduler.stats()["nominatim"]
+    assert stats["rejected"]["autocomplete"] == 1 and stats["queued"] == 0
+
+
+def test_autocomplete_is_rejected_while_nominatim_slot_is_taken(tmp_path, monkeypatch):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "GEOCODE_CACHE_PATH": str(tmp_path / "geocode_cache.db"),
+        "OUTBOUND_SCHEDULER_PATH": str(tmp_path / "outbound_scheduler.db"),
+        "NOMINATIM_MIN_INTERVAL": 5,
+        "AUTOCOMPLETE_MAX_WAIT": 0.5,
+        "MUNICIPALITIES_FILE": capitals_only(tmp_path)
+    })
+    calls = []
+
+    def fake_request(method, url, params=None, data=None):
+        if method == "GET":
+            calls.append(params["q"])
+            return FakeResponse([{"lat": "-12.97", "lon": "-38.50"}])
+        return FakeResponse(overpass_payload())
+
+    fake_upstream(monkeypatch, fake_request)
+    client = app.test_client()
+    assert client.get("/api/unidades?cidade=Salvador&radius=20000").json["success"] is True
+
+    started = time.monotonic()
+    response = client.get("/api/cidades?q=vila ficticia")
+    assert time.monotonic() - started < 0.5
+    assert response.status_code == 503
+    assert response.json["error_code"] == "UPSTREAM_BUSY"
+    assert calls == ["Salvador, Brasil"]
+
+    outbound = client.get("/api/upstreams").json["outbound"]["nominatim"]
+    assert outbound["granted"]["interactive"] == 1
+    assert outbound["rejected"]["autocomplete"] == 1
+
+
+def run_concurrently(app, count, fn, *args):
+    results = [None] * count
+
+    def worker(position):
+        with app.app_context():
+            results[position] = fn(*args)
+
+    threads = [threading.Thread(target=worker, args=(position,)) for position in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_identical_geocodes_share_one_upstream_call(app, monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    def slow_get(method, url, params=None, **kwargs):
+        calls.append(params["q"])
+        release.wait(5)
+        return FakeResponse([{"lat": "-12.97", "lon": "-38.50"}])
+
+    fake_upstream(monkeypatch, slow_get)
+    with app.app_context():
+        flights = get_single_flight()
+
+    threads, results = run_concurrently(app, 20, free_maps.geocode_city, "Salvador")
+    deadline = time.time() + 5
+    while flights.stats()["coalesced"] < 19 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["Salvador, Brasil"]
+    assert results == [(-12.97, -38.50)] * 20
+    assert flights.stats() == {"executions": 1, "coalesced": 19, "in_flight": 0}
+
+
+def test_concurrent_overpass_searches_share_one_tile_fetch(app, monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    def slow_post(method, url, data=None, **kwargs):
+        calls.append(data)
+        release.wait(5)
+        return FakeResponse(overpass_payload())
+
+    fake_upstream(monkeypatch, slow_post)
+    release.set()
+    with app.app_context():
+        free_maps.search_medical_centers_cached(-30.0, -51.2, 1000)  # cria o cache
+        cache = app.extensions["overpass_cache"]
+    calls.clear()
+    release.clear()
+
+    threads, results = run_concurrently(app, 10, free_maps.search_medical_centers_cached, -12.97, -38.50, 20000)
+    deadline = time.time() + 5
+    while cache.stats()["coalesced"] < 9 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(len(result) == 2 for result in results)
+    assert cache.stats()["coalesced"] == 9
+
+
+def test_single_flight_shares_errors_and_forgets_finished_calls():
+    flights = SingleFlight()
+
+    def failing():
+        raise ValueError("falhou")
+
+    with pytest.raises(ValueError):
+        flights.do("chave", failing)
+    assert flights.do("chave", lambda: 42) == 42
+    assert flights.stats() == {"executions": 2, "coalesced": 0, "in_flight": 0}
+
+
+def overpass_document(count):
+    return {
+        "version": 0.6,
+        "osm3s": {"timestamp_osm_base": "2026-10-18T12:00:00Z", "copyright": "OpenStreetMap"},
+        "elements": [
+            {"type": "node", "id": i, "lat": -23.5 + i * 1e-4, "lon": -46.6,
+             "tags": {"amenity": "hospital", "name": f"Hospital São {i} – Ação", "beds": 10 ** (i % 7)}}
+            for i in range(count)
+        ],
+        "remark": "fim",
+    }
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_streamed_elements_match_full_parse(chunk_size):
+    document = overpass_document(50)
+    chunks = FakeResponse(document).iter_content(chunk_size)
+    assert list(iter_json_array(chunks, "elements")) == document["elements"]
+
+
+def test_stream_reads_elements_lazily():
+    content = json.dumps(overpass_document(20000)).encode("utf-8")
+    consumed = []
+
+    def chunks():
+        for start in range(0, len(content), 4096):
+            consumed.append(start)
+            yield content[start:start + 4096]
+
+    elements = iter_json_array(chunks(), "elements")
+    assert next(elements)["id"] == 0
+    assert len(consumed) == 1
+    assert sum(1 for _ in elements) == 19999
+
+
+def test_stream_handles_missing_or_empty_arrays_and_rejects_invalid_json():
+    assert list(iter_json_array([b'{"remark": "runtime error", "elements": []}'], "elements")) == []
+    assert list(iter_json_array([b'{"version": 0.6}'], "elements")) == []
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"elements": [{"id": 1}'], "elements"))
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'<html>erro</html>'], "elements"))
+
+
+def test_compiled_classifier_matches_original_rules():
+    elements = synthetic_elements(3000) + [
+        {"type": "node", "id": 1, "tags": {"name": "Ambulatório Ocupacional", "shop": "x"}},
+        {"type": "node", "id": 2, "tags": {"name": "Laboratório Jesus", "amenity": "doctors"}},
+        {"type": "node", "id": 3, "tags": {"name": "Consultório", "speciality": "Haematology"}},
+        {"type": "node", "id": 4, "tags": {"name": "Ótica", "operator:type": "public"}},
+        {"type": "node", "id": 5, "tags": {"amenity": "clinic", "operator": "Governo do Estado"}},
+        {"type": "node", "id": 6, "tags": {"amenity": "clinic", "healthcare:speciality": "blood;emergency"}},
+    ]
+    assert [tuple(labels) for labels in classify(elements)] == legacy_classify(elements)
+
+
+def test_classifier_ignores_missing_accents():
+    assert classify([{"tags": {"name": "Clinica Sao Jose", "amenity": "doctors"}}])[0].relevant
+    assert classify([{"tags": {"name": "Fundacao Hemope"}}])[0].unit_type == "publica"
+    assert free_maps.is_relevant_medical_facility("POLICLINICA CENTRAL", {})
+    assert free_maps.determine_unit_type_from_tags("Hospital Universitario", {}) == "publica"
+    assert free_maps.extract_specialties_from_tags({"speciality": "Emergency"}) == ["emergencia"]
+
+
+def osm_center(osm_id, name, lat, lng, **fields):
+    center = {
+        "id": f"osm_node_{osm_id}", "name": name, "type": "privada", "address": "Endereço não disponível",
+        "phone": "", "latitude": lat, "longitude": lng, "opening_hours": "Horários não disponíveis",
+        "website": "", "specialties": ["medicina_geral"], "osm_id": osm_id, "osm_type": "node",
+    }
+    center.update(fields)
+    return center
+
+
+def test_osm_node_and_fallback_entry_are_merged():
+    hemoba = free_maps.get_fallback_units(-12.97, -38.50, 5000)
+    osm = osm_center(10, "HEMOBA", -12.9720, -38.5010, website="https://hemoba.ba.gov.br/novo")
+    way = dict(osm_center(11, "Hospital Geral Roberto Santos", -12.9400, -38.4700), id="osm_way_11")
+    node = osm_center(12, "Hospital Geral Roberto Santos", -12.9402, -38.4701, phone="(71) 3117-7500")
+
+    results, merged = dedupe_medical_centers([osm, way, node] + hemoba)
+
+    assert merged == 2
+    assert [result["id"] for result in results] == ["hemoba_salvador", "osm_node_12"]
+    assert results[0]["merged_ids"] == ["osm_node_10"]
+    assert results[0]["phone"] == "(71) 3116-5555"
+    assert results[0]["website"] == "http://www.hemoba.ba.gov.br"
+    assert results[0]["data_source"] == "fallback"
+    assert results[1]["phone"] == "(71) 3117-7500"
+    assert results[1]["merged_ids"] == ["osm_way_11"]
+
+
+def test_different_names_or_distant_records_are_kept():
+    records = [
+        osm_center(1, "Clínica Sorriso", -12.97, -38.50),
+        osm_center(2, "Clínica Vida", -12.97, -38.50),
+        osm_center(3, "Clínica Sorriso", -12.99, -38.50),
+        osm_center(4, "Hospital", -12.97, -38.50),
+        osm_center(5, "Hospital São Rafael", -12.97, -38.50),
+    ]
+    results, merged = dedupe_medical_centers(records)
+    assert merged == 0
+    assert len(results) == 5
+
+
+def test_spatial_dedup_matches_brute_force():
+    rng = random.Random(3)
+    names = ["Clínica Alfa", "Clínica Beta", "Hospital Gama", "Posto Delta"]
+    records = []
+    for i in range(600):
+        records.append(osm_center(
+            i, rng.choice(names),
+            -12.9 + rng.uniform(-0.02, 0.02), -38.5 + rng.uniform(-0.02, 0.02)
+        ))
+
+    # Referência O(n²): componentes conexos de pares próximos com nomes compatíveis
+    parents = list(range(len(records)))
+
+    def find(position):
+        while parents[position] != position:
+            position = parents[position]
+        return position
+
+    tokens = [name_tokens(record["name"]) for record in records]
+    for i, first in enumerate(records):
+        for j in range(i + 1, len(records)):
+            second = records[j]
+            close = haversine_km(first["latitude"], first["longitude"], second["latitude"], second["longitude"]) <= 0.2
+            if close and names_match(tokens[i], tokens[j]):
+                parents[find(j)] = find(i)
+
+    expected = {frozenset(f"osm_node_{j}" for j in range(len(records)) if find(j) == root) for root in set(map(find, range(len(records))))}
+    results, merged = dedupe_medical_centers(records)
+    assert {frozenset([result["id"], *result.get("merged_ids", [])]) for result in results} == expected
+    assert merged == len(records) - len(expected)
+
+
+def test_unidades_reports_merged_duplicates(app, monkeypatch):
+    payload = {"elements": [
+        {"type": "node", "id": 1, "lat": -12.9720, "lon": -38.5010, "tags": {"amenity": "hospital", "name": "HEMOBA"}},
+        {"type": "node", "id": 2, "lat": -12.98, "lon": -38.48, "tags": {"amenity": "hospital", "name": "Hospital Geral"}},
+    ]}
+    fake_upstream(monkeypatch, lambda *a, **k: FakeResponse(payload))
+    response = app.test_client().get("/api/unidades?lat=-12.97&lng=-38.50&radius=5000").json
+    # Poucos resultados do OSM: o fallback entra e o HEMOBA do OSM é fundido nele
+    assert response["merged_duplicates"] == 1
+    assert sorted(unit["id"] for unit in response["data"]) == ["hemoba_salvador", "osm_node_2"]
+    assert response["data"][0]["merged_ids"] == ["osm_node_1"]
+
+
+def test_unidades_answers_if_none_match_without_upstream_calls(app, overpass):
+    client = app.test_client()
+    url = "/api/unidades?lat=-12.97&lng=-38.50&radius=20000"
+
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert etag.startswith('"') and not etag.startswith('W/')
+    assert first.headers["Cache-Control"] == app.config["UNITS_CACHE_CONTROL"]
+    assert client.get(url).headers["ETag"] == etag
+
+    not_modified = client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    assert not_modified.data == b""
+    assert len(overpass) == 1
+
+    # Outros parâmetros ou dados atualizados geram outra ETag
+    assert client.get(url + "&limit=1", headers={"If-None-Match": etag}).status_code == 200
+    cache = app.extensions["overpass_cache"]
+    for tile, (centers, fetched_at) in list(cache._tiles.items()):
+        cache._tiles[tile] = (centers, fetched_at - 1)
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_unidades_pages_reuse_ranked_results(app, overpass, monkeypatch):
+    client = app.test_client()
+    url = "/api/unidades?lat=-12.97&lng=-38.50&radius=20000"
+    full = client.get(url).json["data"]
+
+    rankings = []
+
+    def counting_dedupe(records, *args, **kwargs):
+        rankings.append(len(records))
+        return dedupe_medical_centers(records, *args, **kwargs)
+
+    monkeypatch.setattr(free_maps, "dedupe_medical_centers", counting_dedupe)
+    app.extensions["ranked_results_cache"]._entries.clear()
+
+    pages, cursor = [], None
+    while True:
+        response = client.get(url + "&limit=1" + (f"&cursor={cursor}" if cursor else "")).json
+        pages.extend(response["data"])
+        cursor = response["next_cursor"]
+        if not cursor:
+            break
+    # Só a primeira página classifica; as seguintes fatiam o resultado guardado
+    assert len(pages) > 1 and pages == full
+    assert len(rankings) == 1
+    assert len(overpass) == 1
+
+
+def test_unidades_without_limit_returns_every_unit(app, overpass):
+    # Sem limit nem cursor, nada é cortado pelo teto de página
+    app.config["UNITS_PAGE_SIZE_MAX"] = 1
+    client = app.test_client()
+    url = "/api/unidades?lat=-12.97&lng=-38.50&radius=20000"
+
+    response = client.get(url).json
+    assert response["total"] > 1 and response["next_cursor"] is None
+
+    response = client.get(url + "&limit=5").json
+    assert response["total"] == 1 and response["next_cursor"]
+
+
+def test_unidades_rejects_forged_cursor(app, overpass):
+    client = app.test_client()
+    url = "/api/unidades?lat=-12.97&lng=-38.50&radius=20000&limit=1"
+    cursor = client.get(url).json["next_cursor"]
+    decoded = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    for forged_id in ([1], 1, None):
+        forged = encode_cursor(decoded["d"], forged_id, decoded["q"])
+        response = client.get(url + f"&cursor={forged}")
+        assert response.status_code == 400
+        assert response.json["error_code"] == "INVALID_CURSOR"
+
+
+def test_unidades_projection_and_compression(app, overpass):
+    client = app.test_client()
+    url = "/api/unidades?lat=-12.97&lng=-38.50&radius=20000"
+
+    full = client.get(url)
+    projected = client.get(url + "&fields=name,latitude,longitude,distance_km").json
+    assert [set(unit) for unit in projected["data"]] == [{"id", "name", "latitude", "longitude", "distance_km"}] * len(full.json["data"])
+    assert [unit["id"] for unit in projected["data"]] == [unit["id"] for unit in full.json["data"]]
+    assert projected["next_cursor"] == full.json["next_cursor"]
+
+    # Acima do limite, gzip negociado com ETag própria da representação
+    app.config["COMPRESSION_MIN_SIZE"] = 100
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip, deflate"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert json.loads(gzip.decompress(compressed.data)) == full.json
+    assert compressed.headers["ETag"] == full.headers["ETag"][:-1] + '-gzip"'
+    assert client.get(url, headers={"If-None-Match": compressed.headers["ETag"]}).status_code == 304
+
+    assert "Content-Encoding" not in client.get(url, headers={"Accept-Encoding": "identity"}).headers
+    app.config["COMPRESSION_MIN_SIZE"] = 10 ** 6
+    assert "Content-Encoding" not in client.get(url, headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_fast_encoder_matches_jsonify(app):
+    payload = {"success": True, "data": [{"id": "a", "name": "Clínica São José", "distance_km": 1.25, "tags": None}]}
+    with app.test_request_context():
+        assert json.loads(responses.dumps(payload)) == json.loads(jsonify(payload).get_data())
+        response = responses.json_response(payload)
+        assert response.mimetype == "application/json"
+        assert response.get_json() == payload
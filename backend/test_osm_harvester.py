@@ -0,0 +1,184 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+from sqlalchemy import event
+from backend.app import create_app
+from backend.extensions import db
+from backend.models.harvested_state import HarvestedState
+from backend.models.health_facility import HealthFacility
+from backend.routes import free_maps
+from backend.services import osm_harvester
+from backend.services.osm_harvester import (
+    classify_elements, prune_facilities, read_extract, upsert_facilities
+)
+
+ELEMENTS = [
+    {"type": "node", "id": 1, "lat": -12.98, "lon": -38.48,
+     "tags": {"amenity": "hospital", "name": "Hospital Geral", "phone": "(71) 3333-0000"}},
+    {"type": "way", "id": 2, "center": {"lat": -12.95, "lon": -38.45},
+     "tags": {"amenity": "clinic", "name": "Clínica Hematologia", "healthcare:speciality": "haematology"}},
+    {"type": "node", "id": 3, "lat": -12.96, "lon": -38.47,
+     "tags": {"amenity": "dentist", "name": "Consultório Sorriso"}},
+    {"type": "node", "id": 4, "lat": -23.55, "lon": -46.63,
+     "tags": {"amenity": "hospital", "name": "Hospital Paulista"}},
+]
+
+
+@pytest.fixture
+def app():
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "GEOCODE_CACHE_PATH": None,
+        "OUTBOUND_SCHEDULER_PATH": None
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+def test_classification_matches_live_results(app):
+    centers = classify_elements(ELEMENTS)
+    assert [center["id"] for center in centers] == ["osm_node_1", "osm_way_2", "osm_node_4"]
+    assert centers[1]["specialties"] == ["hematologia"]
+
+
+def test_upsert_updates_rows_and_prune_removes_missing(app):
+    old = datetime.utcnow() - timedelta(days=1)
+    assert upsert_facilities(classify_elements(ELEMENTS), state_code="BA", harvested_at=old) == 3
+
+    renamed = [dict(ELEMENTS[0], tags={"amenity": "hospital", "name": "Hospital Geral Reformado"})]
+    now = datetime.utcnow()
+    assert upsert_facilities(classify_elements(renamed), state_code="BA", harvested_at=now) == 1
+    assert db.session.get(HealthFacility, "osm_node_1").name == "Hospital Geral Reformado"
+
+    assert prune_facilities("BA", now) == 2
+    assert [facility.id for facility in HealthFacility.query.all()] == ["osm_node_1"]
+
+
+def test_file_import_keeps_known_state(app):
+    upsert_facilities(classify_elements(ELEMENTS[:1]), state_code="BA")
+    upsert_facilities(classify_elements(ELEMENTS[:1]))
+    assert db.session.get(HealthFacility, "osm_node_1").state_code == "BA"
+
+
+def test_reads_overpass_json_and_osmium_geojsonseq(tmp_path):
+    overpass_file = tmp_path / "saude.json"
+    overpass_file.write_text(json.dumps({"elements": ELEMENTS}))
+    assert list(read_extract(str(overpass_file))) == ELEMENTS
+
+    features = [
+        {"type": "Feature", "id": "n1", "geometry": {"type": "Point", "coordinates": [-38.48, -12.98]},
+         "properties": {"amenity": "hospital", "name": "Hospital Geral"}},
+        {"type": "Feature", "id": "w2",
+         "geometry": {"type": "Polygon", "coordinates": [[[-38.46, -12.96], [-38.44, -12.96], [-38.44, -12.94], [-38.46, -12.94]]]},
+         "properties": {"amenity": "clinic", "name": "Clínica Hematologia"}},
+    ]
+    seq_file = tmp_path / "saude.geojsonseq"
+    seq_file.write_text("".join("\x1e" + json.dumps(feature) + "\n" for feature in features))
+
+    centers = classify_elements(read_extract(str(seq_file)))
+    assert [center["id"] for center in centers] == ["osm_node_1", "osm_way_2"]
+    assert centers[1]["latitude"] == pytest.approx(-12.95)
+    assert centers[1]["longitude"] == pytest.approx(-38.45)
+
+
+def test_harvest_command_collects_states(app, monkeypatch):
+    queries = []
+
+    def fake_harvest(state_code):
+        if state_code == "SP":
+            raise requests.ConnectionError("sem rede")
+        queries.append(state_code)
+        return classify_elements(ELEMENTS[:2])
+
+    monkeypatch.setattr("backend.cli.harvest_state", fake_harvest)
+    result = app.test_cli_runner().invoke(args=["harvest-osm", "--state", "ba", "--state", "SP", "--delay", "0"])
+
+    assert result.exit_code == 1
+    assert "BA: 2 unidades gravadas, 0 removidas" in result.output
+    assert "Falha ao coletar: SP" in result.output
+    assert queries == ["BA"]
+    assert HealthFacility.query.filter_by(state_code="BA").count() == 2
+
+
+def test_state_query_uses_iso_area():
+    query = osm_harvester.state_overpass_query("ba")
+    assert 'area["ISO3166-2"="BR-BA"]' in query
+    assert 'node["amenity"="hospital"](area.estado);' in query
+    assert "[timeout:180]" in query
+
+
+def test_unidades_is_served_from_local_table_without_network(app, monkeypatch):
+    upsert_facilities(classify_elements(ELEMENTS), state_code="BA")
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("chamada externa no caminho da requisição")
+
+    monkeypatch.setattr(requests.Session, "request", no_network)
+    response = app.test_client().get("/api/unidades?lat=-12.97&lng=-38.50&radius=20000").json
+
+    assert response["source_status"] == {"osm_local": "ok", "fallback_data": "ok"}
+    ids = [unit["id"] for unit in response["data"]]
+    assert {"osm_node_1", "osm_way_2", "hemoba_salvador"} <= set(ids)
+    assert "osm_node_4" not in ids
+
+
+def test_harvest_records_state_extent(app):
+    harvested_at = osm_harvester.utc_now()
+    upsert_facilities(classify_elements(ELEMENTS[:2]), state_code="BA", harvested_at=harvested_at)
+    state = db.session.get(HarvestedState, "BA")
+    assert state.facilities == 2
+    assert (state.south, state.west, state.north, state.east) == (-12.98, -38.48, -12.95, -38.45)
+    assert state.harvested_at == harvested_at
+
+    # Extrato sem estado não conta como cobertura
+    upsert_facilities(classify_elements(ELEMENTS[3:]))
+    assert [state.state_code for state in HarvestedState.query.all()] == ["BA"]
+
+
+def test_unidades_uses_overpass_outside_harvested_states(app, monkeypatch):
+    upsert_facilities(classify_elements(ELEMENTS[:2]), state_code="BA")
+    overpass_calls = []
+
+    def fake_overpass(lat, lng, radius):
+        overpass_calls.append((lat, lng))
+        return []
+
+    monkeypatch.setattr(free_maps, "search_medical_centers_cached", fake_overpass)
+    client = app.test_client()
+
+    # Salvador: dentro do estado coletado
+    assert "osm_local" in client.get("/api/unidades?lat=-12.97&lng=-38.50&radius=20000").json["source_status"]
+    assert overpass_calls == []
+
+    # Manaus (estado não coletado) e um raio que sai da área coletada
+    for url in ("/api/unidades?lat=-3.10&lng=-60.02&radius=20000", "/api/unidades?lat=-12.97&lng=-38.50&radius=200000"):
+        response = client.get(url).json
+        assert "overpass_api" in response["source_status"]
+    assert len(overpass_calls) == 2
+
+
+def test_unidades_etag_follows_local_table_version(app):
+    upsert_facilities(classify_elements(ELEMENTS), state_code="BA")
+    client = app.test_client()
+    url = "/api/unidades?lat=-12.97&lng=-38.50&radius=20000"
+    etag = client.get(url).headers["ETag"]
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    assert statements == []
+
+    # Nova coleta: a versão muda e a resposta completa volta
+    upsert_facilities(classify_elements(ELEMENTS[:1]), state_code="BA")
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
@@ -0,0 +1,627 @@
+import base64
+import importlib.util
+import json
+import math
+import os
+import random
+import threading
+
+import pytest
+import sqlalchemy
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from backend.app import create_app
+from backend.extensions import db
+from backend.models.data_version import DataVersion
+from backend.models.municipality_catchment import MunicipalityCatchment
+from backend.models.treatment_unit import TreatmentUnit
+from backend.routes.treatment_units import calculate_distance
+from backend.services import clustering, data_version, unit_export
+from backend.services.catchments import PartialMunicipalities, catchment_municipalities, refresh_catchments
+from backend.services.clustering import ClusterIndex, get_cluster_index
+from backend.services.municipalities import DATA_DIR
+from backend.services.pagination import encode_cursor
+from backend.services.spatial_query import get_spatial_backend
+from backend.services.unit_snapshot import get_unit_snapshot
+
+MIGRATION = os.path.join(
+    os.path.dirname(__file__), "migrations", "versions", "b7c2e4f1a9d3_indice_espacial_treatment_units.py"
+)
+
+
+@pytest.fixture
+def client():
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "SPATIAL_BACKEND": "auto"
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            yield client
+            db.drop_all()
+
+
+def seed_units(count=400, seed=42):
+    rng = random.Random(seed)
+    specializations = ["Anemia Falciforme", "hematologia, anemia falciforme", "Cardiologia", None]
+    for i in range(count):
+        db.session.add(TreatmentUnit(
+            name=f"Unidade {i}",
+            address=f"Rua {i}",
+            # Concentradas em torno de Salvador, com alguns pontos repetidos
+            latitude=round(-12.97 + rng.uniform(-1, 1), 2),
+            longitude=round(-38.50 + rng.uniform(-1, 1), 2),
+            active=rng.random() > 0.1,
+            specialization=rng.choice(specializations),
+            unit_type=rng.choice(["publica", "privada"])
+        ))
+    db.session.commit()
+
+
+def brute_force(lat, lng, radius, limit, unit_type=None):
+    query = TreatmentUnit.query.filter_by(active=True)
+    query = query.filter(TreatmentUnit.specialization.ilike("%anemia falciforme%"))
+    if unit_type:
+        query = query.filter_by(unit_type=unit_type)
+
+    results = []
+    for unit in query.all():
+        distance = calculate_distance(lat, lng, unit.latitude, unit.longitude)
+        if distance <= radius:
+            unit_dict = unit.to_dict()
+            unit_dict['distance'] = round(distance, 2)
+            results.append(unit_dict)
+    results.sort(key=lambda x: x['distance'])
+    return results[:limit]
+
+
+@pytest.mark.parametrize("radius,limit,unit_type", [
+    (5, 10, None),
+    (25, 10, None),
+    (25, 3, "publica"),
+    (80, 50, "privada"),
+    (500, 100, None),
+])
+def test_nearby_units_match_full_scan(client, radius, limit, unit_type):
+    seed_units()
+    payload = {"latitude": -12.9714, "longitude": -38.5014, "radius": radius, "limit": limit}
+    if unit_type:
+        payload["unit_type"] = unit_type
+
+    response = client.post("/unidades-tratamento/proximas", json=payload)
+    assert response.status_code == 200
+    assert response.json["data"] == brute_force(-12.9714, -38.5014, radius, limit, unit_type)
+
+
+def test_index_rebuilt_after_unit_changes(client):
+    seed_units(count=20)
+    payload = {"latitude": 0, "longitude": 0, "radius": 10, "limit": 10}
+    assert client.post("/unidades-tratamento/proximas", json=payload).json["total"] == 0
+
+    db.session.add(TreatmentUnit(
+        name="Nova", address="Rua Nova", latitude=0.01, longitude=0.01,
+        active=True, specialization="Anemia Falciforme", unit_type="publica"
+    ))
+    db.session.commit()
+
+    response = client.post("/unidades-tratamento/proximas", json=payload)
+    assert [unit["name"] for unit in response.json["data"]] == ["Nova"]
+
+
+def test_nearby_units_get_supports_conditional_requests(client, monkeypatch):
+    seed_units(count=50)
+    payload = {"latitude": -12.9714, "longitude": -38.5014, "radius": 50, "limit": 5}
+    url = "/unidades-tratamento/proximas?latitude=-12.9714&longitude=-38.5014&radius=50&limit=5"
+
+    response = client.get(url)
+    assert response.json == client.post("/unidades-tratamento/proximas", json=payload).json
+    assert "public" in response.headers["Cache-Control"]
+    etag = response.headers["ETag"]
+
+    # 304 sem consultar o banco
+    def no_query(*args, **kwargs):
+        raise AssertionError("consulta feita para uma resposta não modificada")
+
+    with monkeypatch.context() as patch:
+        patch.setattr("backend.routes.treatment_units.find_nearby_units", no_query)
+        assert client.get(url, headers={"If-None-Match": f'W/{etag}'}).status_code == 304
+
+    projected = client.post("/unidades-tratamento/proximas", json=dict(payload, fields=["name", "distance"])).json
+    assert projected["data"] == [
+        {"id": unit["id"], "name": unit["name"], "distance": unit["distance"]} for unit in response.json["data"]
+    ]
+    assert client.get(url + "&fields=name,distance").json == projected
+
+    db.session.add(TreatmentUnit(
+        name="Nova", address="Rua Nova", latitude=-12.97, longitude=-38.50,
+        active=True, specialization="Anemia Falciforme", unit_type="publica"
+    ))
+    db.session.commit()
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["data"][0]["name"] == "Nova"
+
+
+def test_etag_version_is_shared_between_processes(tmp_path):
+    # Dois apps no mesmo banco fazem o papel de dois workers
+    uri = f"sqlite:///{tmp_path / 'unidades.db'}"
+    first = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": uri, "UNIT_SNAPSHOT_MAX_AGE": 3600})
+    second = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": uri, "UNIT_SNAPSHOT_MAX_AGE": 3600})
+    url = "/unidades-tratamento/proximas?latitude=-12.9714&longitude=-38.5014&radius=50&limit=5"
+
+    with first.app_context():
+        db.create_all()
+        seed_units(count=50)
+    etag = first.test_client().get(url).headers["ETag"]
+    assert second.test_client().get(url).headers["ETag"] == etag
+
+    with first.app_context():
+        unit = db.session.get(TreatmentUnit, 1)
+        unit.name = "Renomeada"
+        db.session.commit()
+
+    # O outro worker não responde 304 com a ETag antiga nem serve o snapshot antigo
+    response = second.test_client().get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == first.test_client().get(url).headers["ETag"] != etag
+    with second.app_context():
+        assert get_unit_snapshot().records[0]["name"] == "Renomeada"
+        db.drop_all()
+
+
+def test_unit_data_version_is_read_at_most_once_per_interval(client):
+    seed_units(count=50)
+    url = "/unidades-tratamento/proximas?latitude=-12.9714&longitude=-38.5014&radius=50&limit=5"
+    etag = client.get(url).headers["ETag"]
+
+    # 304 sem nenhuma consulta ao banco
+    statements = []
+
+    def listener(connection, cursor, statement, *args):
+        statements.append(statement)
+
+    sqlalchemy.event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    finally:
+        sqlalchemy.event.remove(db.engine, "before_cursor_execute", listener)
+    assert statements == []
+
+    # Alteração feita por outro processo: notada ao fim do intervalo
+    db.session.execute(sqlalchemy.update(DataVersion).values(version=DataVersion.version + 1))
+    db.session.commit()
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    client.application.extensions["unit_data_version"]["checked_at"] -= client.application.config["DATA_VERSION_CHECK_INTERVAL"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_version_table_created_after_startup_is_noticed(client):
+    DataVersion.__table__.drop(db.engine)
+    data_version._has_version_table.clear()
+    assert data_version.stored_version() is None
+
+    # Migração aplicada com o processo no ar
+    DataVersion.__table__.create(db.engine)
+    assert data_version.stored_version() == 0
+
+
+def apply_spatial_migration():
+    spec = importlib.util.spec_from_file_location("spatial_migration", MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    with db.engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+
+
+@pytest.mark.parametrize("radius,limit,unit_type", [
+    (25, 10, None),
+    (80, 50, "privada"),
+    (500, 100, None),
+])
+def test_rtree_backend_matches_full_scan(client, radius, limit, unit_type):
+    seed_units(count=200)
+    apply_spatial_migration()
+    # Unidades inseridas depois da migração entram no R*Tree pelos triggers
+    seed_units(count=200, seed=3)
+    TreatmentUnit.query.filter(TreatmentUnit.id <= 20).update({"latitude": -13.0, "longitude": -38.5})
+    db.session.commit()
+    assert get_spatial_backend() == "rtree"
+
+    payload = {"latitude": -12.9714, "longitude": -38.5014, "radius": radius, "limit": limit}
+    if unit_type:
+        payload["unit_type"] = unit_type
+
+    response = client.post("/unidades-tratamento/proximas", json=payload)
+    assert response.status_code == 200
+    assert response.json["data"] == brute_force(-12.9714, -38.5014, radius, limit, unit_type)
+
+
+def test_specialization_tags_are_accent_and_case_insensitive(client):
+    unit = TreatmentUnit(
+        name="Centro", address="Rua A", latitude=-12.97, longitude=-38.50,
+        active=True, specialization="Centro de referência em ANÊMIA  Falciforme", unit_type="publica"
+    )
+    db.session.add(unit)
+    db.session.commit()
+    assert "anemia_falciforme" in {tag.tag for tag in unit.specialization_tags}
+
+    payload = {"latitude": -12.97, "longitude": -38.50, "radius": 5, "limit": 10}
+    assert client.post("/unidades-tratamento/proximas", json=payload).json["total"] == 1
+
+    unit.specialization = "Cardiologia"
+    db.session.commit()
+    assert [tag.tag for tag in unit.specialization_tags] == ["cardiologia"]
+    assert client.post("/unidades-tratamento/proximas", json=payload).json["total"] == 0
+
+
+@pytest.mark.parametrize("use_rtree", [False, True])
+def test_cursor_pagination_walks_full_result(client, use_rtree):
+    seed_units()
+    if use_rtree:
+        apply_spatial_migration()
+    expected = brute_force(-12.9714, -38.5014, 120, 1000)
+    assert len(expected) > 100
+
+    payload = {"latitude": -12.9714, "longitude": -38.5014, "radius": 120, "limit": 7}
+    pages = []
+    while True:
+        data = client.post("/unidades-tratamento/proximas", json=payload).json
+        assert len(data["data"]) <= 7
+        pages.extend(data["data"])
+        if not data["next_cursor"]:
+            break
+        payload["cursor"] = data["next_cursor"]
+
+    assert pages == expected
+
+
+def test_cursor_is_rejected_for_other_query(client):
+    seed_units(count=50)
+    payload = {"latitude": -12.9714, "longitude": -38.5014, "radius": 200, "limit": 2}
+    cursor = client.post("/unidades-tratamento/proximas", json=payload).json["next_cursor"]
+    assert cursor
+
+    payload.update({"radius": 10, "cursor": cursor})
+    response = client.post("/unidades-tratamento/proximas", json=payload)
+    assert response.status_code == 400
+    assert response.json["error_code"] == "INVALID_CURSOR"
+
+    payload["cursor"] = "nao-e-um-cursor"
+    assert client.post("/unidades-tratamento/proximas", json=payload).status_code == 400
+
+    # Cursor forjado com id de outro tipo
+    payload["radius"] = 200
+    decoded = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    for forged_id in ([1], "1", True):
+        forged = dict(decoded, id=forged_id)
+        payload["cursor"] = encode_cursor(forged["d"], forged["id"], forged["q"])
+        response = client.post("/unidades-tratamento/proximas", json=payload)
+        assert response.status_code == 400
+        assert response.json["error_code"] == "INVALID_CURSOR"
+
+
+def test_unit_snapshot_is_columnar_and_versioned(client):
+    seed_units(count=30)
+    snapshot = get_unit_snapshot()
+    active = TreatmentUnit.query.filter_by(active=True).order_by(TreatmentUnit.id).all()
+
+    assert snapshot.ids.tolist() == [unit.id for unit in active]
+    assert snapshot.latitudes.tolist() == [unit.latitude for unit in active]
+    assert snapshot.records == [unit.to_dict() for unit in active]
+    assert set(snapshot.unit_types) == {"publica", "privada"}
+    publicas = snapshot.rows(unit_type="publica")
+    assert [snapshot.records[row]["unit_type"] for row in publicas.tolist()] == ["publica"] * len(publicas)
+    assert get_unit_snapshot() is snapshot
+
+    active[0].active = False
+    db.session.commit()
+    rebuilt = get_unit_snapshot()
+    assert rebuilt is not snapshot
+    assert rebuilt.version > snapshot.version
+    assert active[0].id not in rebuilt.ids.tolist()
+
+
+def point_total(features):
+    return sum(feature["properties"].get("point_count", 1) for feature in features)
+
+
+def test_cluster_levels_keep_every_point():
+    rng = random.Random(5)
+    lats = [-12.97 + rng.uniform(-2, 2) for _ in range(500)]
+    lngs = [-38.50 + rng.uniform(-2, 2) for _ in range(500)]
+    index = ClusterIndex([{"id": i} for i in range(500)], lats, lngs, max_zoom=14)
+
+    # Cada nível reparte os mesmos 500 pontos em menos itens à medida que o zoom diminui
+    sizes = [len(index.levels[zoom]) for zoom in range(0, 16)]
+    assert sizes == sorted(sizes) and sizes[0] == 1 and sizes[-1] == 500
+    assert all(int(index.levels[zoom].counts.sum()) == 500 for zoom in range(0, 16))
+    assert point_total(index.tile_features(0, 0, 0)) == 500
+
+    # Um grupo se divide no zoom indicado
+    x, y = tile_xy(-12.97, -38.50, 8)
+    cluster = next(f for f in index.tile_features(8, x, y) if f["properties"]["cluster"])
+    expansion_zoom = cluster["properties"]["expansion_zoom"]
+    lng, lat = cluster["geometry"]["coordinates"]
+    assert expansion_zoom > 8
+    assert len(index.tile_features(expansion_zoom, *tile_xy(lat, lng, expansion_zoom))) >= 2
+
+    # Acima do zoom máximo os pontos vêm soltos
+    features = index.tile_features(15, *tile_xy(lats[0], lngs[0], 15))
+    assert {"id": 0, "cluster": False} in [f["properties"] for f in features]
+    point = next(f for f in features if f["properties"]["id"] == 0)
+    assert point["geometry"]["coordinates"] == pytest.approx([lngs[0], lats[0]])
+
+
+def tile_xy(lat, lng, zoom):
+    n = 2 ** zoom
+    x = int((lng + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+
+def test_tiles_endpoint_serves_clusters_per_data_version(client):
+    seed_units(count=200)
+    # Mesmas unidades da busca pública: ativas e de anemia falciforme
+    sickle_cell = TreatmentUnit.query.filter_by(active=True).filter(
+        TreatmentUnit.specialization.ilike("%anemia falciforme%")
+    )
+    active = sickle_cell.count()
+    assert active < TreatmentUnit.query.filter_by(active=True).count()
+
+    world = client.get("/api/tiles/0/0/0")
+    assert world.status_code == 200
+    assert world.mimetype == "application/geo+json"
+    assert world.json["type"] == "FeatureCollection"
+    assert point_total(world.json["features"]) == active
+    assert any(feature["properties"]["cluster"] for feature in world.json["features"])
+
+    # Zoom alto: só as unidades do tile, como pontos soltos
+    unit = sickle_cell.first()
+    x, y = tile_xy(unit.latitude, unit.longitude, 18)
+    features = client.get(f"/api/tiles/18/{x}/{y}").json["features"]
+    assert unit.id in {feature["properties"]["id"] for feature in features}
+    assert not any(feature["properties"]["cluster"] for feature in features)
+
+    publicas = client.get("/api/tiles/0/0/0?unit_type=publica").json["features"]
+    assert point_total(publicas) == sickle_cell.filter_by(unit_type="publica").count()
+
+    # Índice e tiles prontos reaproveitados até a próxima alteração
+    index = get_cluster_index()
+    etag = world.headers["ETag"]
+    assert client.get("/api/tiles/0/0/0", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/tiles/0/0/0").data == world.data
+    assert get_cluster_index() is index
+
+    unit.active = False
+    db.session.commit()
+    updated = client.get("/api/tiles/0/0/0", headers={"If-None-Match": etag})
+    assert updated.status_code == 200
+    assert point_total(updated.json["features"]) == active - 1
+    assert get_cluster_index() is not index
+
+    assert client.get("/api/tiles/2/4/0").status_code == 400
+    assert client.get("/api/tiles/25/0/0").status_code == 400
+
+
+def test_cluster_index_is_built_once_outside_the_lock(client, monkeypatch):
+    seed_units(count=100)
+    snapshot = get_unit_snapshot()
+    monkeypatch.setattr(clustering, "get_unit_snapshot", lambda: snapshot)
+
+    builds = []
+    started = threading.Event()
+    release = threading.Event()
+    original = clustering.build_cluster_index
+
+    def slow_build(snapshot, unit_type=None):
+        builds.append(unit_type)
+        if unit_type is None:
+            started.set()
+            release.wait(5)
+        return original(snapshot, unit_type)
+
+    monkeypatch.setattr(clustering, "build_cluster_index", slow_build)
+    app = client.application
+    results = []
+
+    def fetch():
+        with app.app_context():
+            results.append(get_cluster_index())
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+
+    # Enquanto um índice é construído, outro tipo não espera pelo lock
+    with app.app_context():
+        assert get_cluster_index("publica") is not None
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert builds.count(None) == 1 and builds.count("publica") == 1
+    assert len(results) == 8 and all(index is results[0] for index in results)
+    with app.app_context():
+        assert get_cluster_index() is results[0]
+
+
+def test_export_streams_units_in_batches(client, monkeypatch, tmp_path):
+    seed_units(count=300)
+    expected = [
+        dict(unit.to_dict(), active=unit.active)
+        for unit in TreatmentUnit.query.filter_by(active=True).order_by(TreatmentUnit.id)
+    ]
+    monkeypatch.setattr(unit_export, "CHUNK_SIZE", 1024)
+    client.application.config["EXPORT_BATCH_SIZE"] = 50
+
+    response = client.get("/unidades-tratamento/exportar?format=ndjson")
+    assert response.is_streamed
+    assert response.mimetype == "application/x-ndjson"
+    chunks = list(response.response)
+    assert len(chunks) > 10
+    assert [json.loads(line) for line in b"".join(chunks).splitlines()] == expected
+
+    geojson = client.get("/unidades-tratamento/exportar?format=geojson&unit_type=publica").json
+    assert geojson["type"] == "FeatureCollection"
+    assert [feature["properties"] for feature in geojson["features"]] == [
+        unit for unit in expected if unit["unit_type"] == "publica"
+    ]
+    first = geojson["features"][0]
+    assert first["geometry"]["coordinates"] == [first["properties"]["longitude"], first["properties"]["latitude"]]
+
+    everything = client.get("/unidades-tratamento/exportar?include_inactive=true").data.splitlines()
+    assert len(everything) == 300
+    assert client.get("/unidades-tratamento/exportar?format=csv").status_code == 400
+
+    output = tmp_path / "unidades.geojson"
+    result = client.application.test_cli_runner().invoke(
+        args=["export-units", "--format", "geojson", "--output", str(output), "--batch-size", "7"]
+    )
+    assert result.exit_code == 0, result.output
+    assert len(json.loads(output.read_text())["features"]) == len(expected)
+
+
+def test_batch_nearest_matches_single_origin_queries(client):
+    seed_units(count=400)
+    rng = random.Random(8)
+    origins = [
+        {"id": f"o{i}", "latitude": -12.97 + rng.uniform(-1, 1), "longitude": -38.50 + rng.uniform(-1, 1),
+         "radius": rng.choice([5, 25, 80]), "limit": rng.choice([0, 1, 3, 10, 50])}
+        for i in range(60)
+    ]
+    client.application.config["BATCH_MATRIX_CELLS"] = 1000  # vários blocos de origens
+
+    response = client.post("/unidades-tratamento/proximas/lote", json={"origins": origins, "unit_type": "publica"})
+    assert response.status_code == 200
+    results = response.json["results"]
+    assert [result["origin"]["id"] for result in results] == [origin["id"] for origin in origins]
+    for origin, result in zip(origins, results):
+        assert result["data"] == brute_force(
+            origin["latitude"], origin["longitude"], origin["radius"], origin["limit"], "publica"
+        )
+
+    streamed = client.post("/unidades-tratamento/proximas/lote", json={
+        "origins": origins[:5], "format": "ndjson", "unit_type": "publica", "fields": ["distance"]
+    })
+    assert streamed.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in streamed.data.splitlines()]
+    assert [line["data"] for line in lines] == [
+        [{"id": unit["id"], "distance": unit["distance"]} for unit in result["data"]] for result in results[:5]
+    ]
+
+
+def test_batch_nearest_validates_origins(client):
+    url = "/unidades-tratamento/proximas/lote"
+    assert client.post(url, json={}).json["error_code"] == "ORIGINS_REQUIRED"
+    assert client.post(url, json={"origins": [{"latitude": 1}]}).json["error_code"] == "INVALID_ORIGIN"
+    for radius in ("nan", "inf", "-inf"):
+        origins = [{"latitude": 0, "longitude": 0, "radius": radius}]
+        response = client.post(url, json={"origins": origins})
+        assert response.status_code == 400
+        assert response.json["error_code"] == "INVALID_ORIGIN"
+    client.application.config["BATCH_MAX_ORIGINS"] = 2
+    origins = [{"latitude": 0, "longitude": 0}] * 3
+    assert client.post(url, json={"origins": origins}).json["error_code"] == "TOO_MANY_ORIGINS"
+
+
+def capitals_only(tmp_path):
+    """Arquivo de municípios parcial: só as capitais do CSV versionado"""
+    path = tmp_path / "capitais.csv"
+    with open(os.path.join(DATA_DIR, "municipios.csv"), encoding="utf-8") as source:
+        lines = source.read().splitlines()
+    path.write_text("\n".join([lines[0]] + [line for line in lines[1:] if line.split(",")[4] == "1"]) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def catchment_brute_force():
+    units = [
+        unit for unit in TreatmentUnit.query.filter_by(active=True).all()
+        if "anemia falciforme" in (unit.specialization or "").lower()
+    ]
+    expected = {}
+    for municipality in catchment_municipalities():
+        best = min(
+            ((calculate_distance(municipality.latitude, municipality.longitude, unit.latitude, unit.longitude), unit.id)
+             for unit in units),
+            default=(None, None)
+        )
+        expected[municipality.ibge_code] = (best[1], best[0])
+    return expected
+
+
+def stored_catchments():
+    return {
+        row.ibge_code: (row.nearest_unit_id, row.distance_km)
+        for row in MunicipalityCatchment.query.all()
+    }
+
+
+def assert_catchments_match(expected, stored):
+    assert stored.keys() == expected.keys()
+    for code, (unit_id, distance) in expected.items():
+        assert stored[code][0] == unit_id
+        assert stored[code][1] == pytest.approx(distance)
+
+
+def test_catchments_are_refreshed_incrementally(client, tmp_path):
+    # Unidades espalhadas pelo país, para que cada capital tenha uma vizinha diferente
+    rng = random.Random(11)
+    for i in range(120):
+        db.session.add(TreatmentUnit(
+            name=f"Unidade {i}", address=f"Rua {i}",
+            latitude=rng.uniform(-30, 0), longitude=rng.uniform(-60, -36),
+            active=True, specialization=rng.choice(["Anemia Falciforme", "Cardiologia"]), unit_type="publica"
+        ))
+    db.session.commit()
+
+    # Arquivo só com as capitais: sem --allow-partial, a atualização falha
+    client.application.config["MUNICIPALITIES_FILE"] = capitals_only(tmp_path)
+    result = client.application.test_cli_runner().invoke(args=["build-catchments"])
+    assert result.exit_code == 1
+    assert "27 linhas" in result.output
+    assert MunicipalityCatchment.query.count() == 0
+    with pytest.raises(PartialMunicipalities):
+        refresh_catchments()
+
+    result = client.application.test_cli_runner().invoke(args=["build-catchments", "--allow-partial"])
+    assert result.exit_code == 0, result.output
+    total = len(catchment_municipalities())
+    assert f"{total} municípios: {total} recalculados" in result.output
+    assert_catchments_match(catchment_brute_force(), stored_catchments())
+
+    # Nada mudou: nada é recalculado
+    assert refresh_catchments(allow_partial=True)["recomputed"] == 0
+
+    # Unidade mais próxima de Salvador desativada, unidade nova ao lado de
+    # Fortaleza e uma unidade movida
+    salvador = db.session.get(MunicipalityCatchment, "2927408")
+    db.session.get(TreatmentUnit, salvador.nearest_unit_id).active = False
+    db.session.add(TreatmentUnit(
+        name="Nova Fortaleza", address="Rua Nova", latitude=-3.72, longitude=-38.54,
+        active=True, specialization="Anemia Falciforme", unit_type="publica"
+    ))
+    moved = TreatmentUnit.query.filter(TreatmentUnit.specialization == "Anemia Falciforme").first()
+    moved.latitude, moved.longitude = -15.79, -47.88
+    db.session.commit()
+
+    stats = refresh_catchments(allow_partial=True)
+    assert 0 < stats["recomputed"] < total
+    assert stats["reassigned"] >= 1
+    assert_catchments_match(catchment_brute_force(), stored_catchments())
+
+    response = client.get("/unidades-tratamento/cobertura?uf=ce").json
+    assert [row["ibge_code"] for row in response["data"]] == ["2304400"]
+    assert response["data"][0]["nearest_unit_name"] == "Nova Fortaleza"
+    assert response["data"][0]["distance_km"] < 1
+
+    # O CSV versionado é a tabela completa do IBGE: dispensa --allow-partial
+    client.application.config["MUNICIPALITIES_FILE"] = None
+    result = client.application.test_cli_runner().invoke(args=["build-catchments"])
+    assert result.exit_code == 0, result.output
+    assert len(stored_catchments()) == len(catchment_municipalities()) >= 5500
+    assert_catchments_match(catchment_brute_force(), stored_catchments())